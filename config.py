@@ -10,17 +10,108 @@ MD 语义检索知识库 - 配置文件
 # - "sentence-transformers/all-MiniLM-L6-v2" (英文，384维，最小)
 EMBEDDING_MODEL = "moka-ai/m3e-base"  # 中英文双语模型，效果最好
 VECTOR_DIM = 768                       # 向量维度
+EMBEDDING_BACKEND = "torch"            # 推理后端: "torch"（SentenceTransformer）| "onnx"（onnxruntime，不导入 torch）
+ONNX_QUANTIZE = True                   # onnx 后端是否使用动态 int8 量化
+ONNX_CACHE_DIR = "./data/onnx"         # ONNX 导出缓存目录（首次使用时自动导出）
+EMBEDDING_TOKEN_BUDGET = 16384         # 建索引时每个前向批次的 token 上限（批大小 × 最长序列，0 表示按固定 32 条组批）
+EMBEDDING_MAX_BATCH_SIZE = 256         # 按 token 预算组批时每批最多的文本数
+EMBEDDING_WORKERS = 1                  # 建索引时的 Embedding 工作进程数（1 表示单进程）
+EMBEDDING_WORKER_THREADS = 0           # 每个工作进程的算子线程数（0 表示按 CPU 核心数平均分配）
+
+# Embedding 缓存配置（按文本内容寻址，可在多个文档目录的索引之间共享）
+EMBEDDING_CACHE_ENABLED = True                      # 是否启用磁盘缓存
+EMBEDDING_CACHE_DIR = "./data/embedding_cache"      # 缓存目录（按模型分子目录）
+EMBEDDING_CACHE_MAX_ENTRIES = 200000                # 最大缓存条目数（超出按 LRU 淘汰）
 
 # Milvus 配置
+VECTOR_STORE_BACKEND = "milvus"       # 向量存储后端: "milvus"（Milvus Lite）| "numpy"（内存映射 .npy 暴力检索）
 MILVUS_DB_PATH = "./data/milvus.db"   # 本地数据库路径
+NUMPY_STORE_DIR = "./data/numpy_store"  # numpy 后端的存储目录
+
+# 向量索引配置（已有集合沿用建立时的索引，修改后需 index --full 或在命令行指定）
+INDEX_TYPE = "FLAT"                    # 索引类型: "FLAT"（精确）| "IVF_FLAT" | "HNSW"（Milvus Lite 只支持 FLAT，numpy 后端不支持 HNSW）
+INDEX_NLIST = 128                      # IVF_FLAT 聚类中心数
+INDEX_HNSW_M = 16                      # HNSW 每个节点的最大连接数
+INDEX_HNSW_EF_CONSTRUCTION = 200       # HNSW 建图时的候选集大小
+SEARCH_NPROBE = 16                     # IVF_FLAT 查询时探测的聚类数（越大召回越高、越慢）
+SEARCH_EF = 64                         # HNSW 查询时的候选集大小（不小于 top_k）
+VECTOR_QUANTIZATION = "none"           # 向量量化存储: "none" | "float16" | "int8" | "binary"（仅 numpy 后端）
+QUANTIZE_RERANK_FACTOR = 4             # 量化检索召回 top_k 的该倍数个候选，再用原始向量精排
 COLLECTION_NAME = "md_knowledge_base"  # 集合名称
 
+# 增量索引配置
+INDEX_MANIFEST_PATH = "./data/index_manifest.json"  # 索引清单（文件哈希 -> 分块 ID）
+INDEX_GENERATION_PATH = "./data/index_generation.json"  # 索引代数（索引内容变化时递增，用于使查询缓存失效）
+
 # 文本分割配置
-CHUNK_SIZE = 500                       # 分块大小（字符数）
-CHUNK_OVERLAP = 50                     # 分块重叠（字符数）
+CHUNK_MODE = "chars"                   # 分块计量方式: "chars"（按字符数）| "tokens"（按 Embedding 模型的 token 数，修改后自动全量重建）
+CHUNK_SIZE = 500                       # chars 模式的分块大小（字符数）
+CHUNK_OVERLAP = 50                     # chars 模式的分块重叠（字符数）
+CHUNK_TOKENS = 400                     # tokens 模式的目标分块大小（token 数，不超过模型最大序列长度减去特殊 token）
+CHUNK_OVERLAP_TOKENS = 40              # tokens 模式的分块重叠（token 数）
+
+# 近重复去重配置（MinHash + LSH：复制粘贴的安装步骤、许可证等文本块只向量化和存储一次）
+DEDUP_ENABLED = False                  # 是否在分割后合并近重复的文本块（默认关闭，修改后自动全量重建）
+DEDUP_PATH = "./data/chunk_dedup.npz"  # 代表块签名与重复位置映射
+DEDUP_THRESHOLD = 0.9                  # 签名估计的 Jaccard 相似度阈值（达到才视为重复）
+DEDUP_NUM_PERM = 128                   # MinHash 签名长度
+DEDUP_BANDS = 16                       # LSH 分段数（每段 NUM_PERM / BANDS 位，段越多召回越高、候选越多）
+DEDUP_SHINGLE_SIZE = 5                 # 字符 shingle 长度
+
+# 索引流水线配置
+INDEX_BATCH_SIZE = 100                 # 每批向量化/写入的文本块数
+PIPELINE_QUEUE_SIZE = 4                # 阶段之间队列的最大批次数（限制内存占用）
+
+# 监视模式配置（watch 命令轮询文档目录，合并一段时间内的变化后增量更新）
+WATCH_INTERVAL = 1.0                   # 轮询间隔（秒），每次比较所有 .md 文件的修改时间和大小
+WATCH_DEBOUNCE = 2.0                   # 最后一次变化后等待多久没有新变化才开始更新（秒）
+
+# 常驻服务配置
+DAEMON_SOCKET_PATH = "./data/doc-inspect.sock"  # Unix 域套接字路径（serve 命令监听，其他命令自动连接）
 
 # 检索配置
 TOP_K = 5                              # 默认返回结果数量
+QUERY_BATCH_SIZE = 64                  # 批量检索时每批编码/检索的问题数
+
+# 混合检索配置（BM25 关键词检索 + 向量检索，倒数排名融合）
+HYBRID_SEARCH_ENABLED = True                     # 默认是否使用混合检索（命令行 --no-hybrid 关闭）
+LEXICAL_INDEX_PATH = "./data/lexical_index.npz"  # 关键词倒排索引路径（build_index 时同步更新）
+HYBRID_CANDIDATE_FACTOR = 4                      # 两路检索各取 top_k 的该倍数个候选参与融合
+RRF_K = 60                                       # 倒数排名融合的平滑常数
+BM25_K1 = 1.2                                    # BM25 词频饱和参数
+BM25_B = 0.75                                    # BM25 文档长度归一化参数
+
+# 查询缓存配置
+QUERY_CACHE_ENABLED = True                       # 是否缓存问题向量与检索结果
+QUERY_CACHE_MAX_ENTRIES = 1024                   # 每级缓存的最大条目数（超出按 LRU 淘汰）
+QUERY_CACHE_PERSIST = False                      # 是否在进程退出时落盘，下次启动时恢复
+QUERY_CACHE_PATH = "./data/query_cache.npz"      # 落盘文件路径
+
+# 答案缓存配置（措辞相近且检索到同一组文本块的问题直接复用之前的回答）
+ANSWER_CACHE_ENABLED = False                     # 默认是否启用答案缓存（命令行 --answer-cache / --no-answer-cache 覆盖）
+ANSWER_CACHE_PATH = "./data/answer_cache.npz"    # 缓存文件路径
+ANSWER_CACHE_THRESHOLD = 0.92                    # 问题向量余弦相似度阈值（达到才视为同一问题）
+ANSWER_CACHE_TTL = 7 * 24 * 3600                 # 答案有效期（秒）
+ANSWER_CACHE_MAX_ENTRIES = 2000                  # 最大缓存条目数（超出按 LRU 淘汰）
+
+# 重排序配置（ask 时用本地交叉编码器对更多候选重新打分，只把最相关的 top_k 个交给大模型）
+RERANK_ENABLED = False                 # 默认是否重排序（命令行 --rerank / --no-rerank 覆盖）
+RERANK_MODEL = "BAAI/bge-reranker-base"  # 交叉编码器模型（中英文）
+RERANK_CANDIDATES = 20                 # 重排序前检索的候选数（不小于 top_k）
+RERANK_BATCH_SIZE = 8                  # 每次前向计算的候选数
+RERANK_MAX_LENGTH = 512                # 问题 + 文本块的最大 token 数
+RERANK_TIME_BUDGET = 1.0               # 打分阶段的时间预算（秒），超出时回退到检索顺序
+
+# 上下文打包配置（把检索结果交给大模型前合并相邻分块、去掉重叠，并按 token 预算截取）
+CONTEXT_PACKING_ENABLED = True         # 是否打包上下文（关闭时逐块原样发送）
+CONTEXT_TOKEN_BUDGET = 3000            # 参考资料的 token 上限（0 表示不限制）
+CONTEXT_TOKENIZER = ""                 # 计数用的分词器（Hugging Face 名称或路径，留空使用 Embedding 模型的分词器）
+
+# 句子抽取配置（可选：把参考资料压缩为与问题最相关的句子及其上下文，减少提示词 token）
+SENTENCE_EXTRACTION_ENABLED = False    # 默认是否抽取（命令行 --compress / --no-compress 覆盖）
+SENTENCE_KEEP_RATIO = 0.4              # 每段参考资料保留的句子比例（按与问题的相似度挑选）
+SENTENCE_NEIGHBOURS = 1                # 同时保留被选句子前后各几句，保持上下文连贯
+SENTENCE_MIN_SENTENCES = 4             # 句子数少于此值的段落原样保留
 
 # AI 服务配置 (OpenAI 兼容)
 OPENAI_BASE_URL = "https://xxx/v1"  # OpenAI 兼容的 API 地址
@@ -28,3 +119,10 @@ OPENAI_API_KEY = "xxxi"           # API 密钥
 OPENAI_MODEL = "glm-4.7"                 # 使用的模型名称
 OPENAI_TEMPERATURE = 0.7                       # 温度参数
 OPENAI_MAX_TOKENS = 100000                       # 最大回复长度（增加以支持更长的回答）
+OPENAI_STREAM = True                             # ask 是否流式输出回答（命令行 --no-stream 关闭）
+AI_MAX_CONCURRENCY = 4                           # 每个 API 端点同时进行的最大请求数
+AI_POOL_CONNECTIONS = 10                         # 每个 API 端点保持的 HTTP 连接池大小
+AI_MAX_RETRIES = 3                               # 429 / 5xx / 连接错误的最大重试次数
+AI_RETRY_BASE_DELAY = 0.5                        # 重试退避基数（秒，按 2^n 增长并随机抖动）
+AI_RETRY_MAX_DELAY = 8.0                         # 单次重试等待上限（秒）
+AI_REQUEST_TIMEOUT = 120.0                       # 单次请求超时（秒）
@@ -10,8 +10,16 @@ from pathlib import Path
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, str(Path(__file__).parent))
 
-from src.cli_commands import cmd_index, cmd_query, cmd_ask, cmd_stats
-from config import TOP_K
+from config import (
+    TOP_K,
+    EMBEDDING_WORKERS,
+    DAEMON_SOCKET_PATH,
+    SEARCH_NPROBE,
+    SEARCH_EF,
+    RERANK_CANDIDATES,
+    WATCH_INTERVAL,
+    WATCH_DEBOUNCE
+)
 
 
 def main():
@@ -24,15 +32,25 @@ def main():
         epilog="""
 示例:
   建立索引:  python main.py index --docs-dir ./docs
+  全量重建:  python main.py index --docs-dir ./docs --full
+  监视目录:  python main.py watch --docs-dir ./docs   (文件变化后自动增量更新)
   语义查询:  python main.py query
+  批量查询:  python main.py query --batch-file questions.txt -o results.jsonl
   AI 问答:   python main.py ask
   查看统计:  python main.py stats
+  常驻服务:  python main.py serve   (之后 query/ask/stats/index 自动通过服务执行)
   
 使用自定义 API:
   python main.py ask --base-url https://api.example.com/v1 --api-key YOUR_KEY --model gpt-4
         """
     )
     
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="不使用常驻服务，始终在当前进程中执行"
+    )
+    
     subparsers = parser.add_subparsers(dest="command", help="可用命令")
     
     # index 命令
@@ -43,6 +61,70 @@ def main():
         default="./docs",
         help="md 文档目录路径 (默认: ./docs)"
     )
+    index_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="强制全量重建（默认仅增量处理变化的文件）"
+    )
+    index_parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=None,
+        help=f"Embedding 工作进程数 (默认: {EMBEDDING_WORKERS}，1 表示单进程)"
+    )
+    index_parser.add_argument(
+        "--index-type",
+        type=str.upper,
+        choices=["FLAT", "IVF_FLAT", "HNSW"],
+        default=None,
+        help="向量索引类型（默认沿用集合已有的索引，新集合使用 config.py 中的 INDEX_TYPE）"
+    )
+    index_parser.add_argument(
+        "--nlist",
+        type=int,
+        default=None,
+        help="IVF_FLAT 聚类中心数"
+    )
+    index_parser.add_argument(
+        "--hnsw-m",
+        type=int,
+        default=None,
+        help="HNSW 每个节点的最大连接数 (M)"
+    )
+    index_parser.add_argument(
+        "--ef-construction",
+        type=int,
+        default=None,
+        help="HNSW 建图时的候选集大小 (efConstruction)"
+    )
+    index_parser.add_argument(
+        "--quantization",
+        type=str.lower,
+        choices=["none", "float16", "int8", "binary"],
+        default=None,
+        help="向量量化存储方式（仅 numpy 后端，检索时先用压缩向量召回再精排；默认沿用已有设置）"
+    )
+    
+    # watch 命令
+    watch_parser = subparsers.add_parser("watch", help="监视文档目录，文件变化后自动增量更新索引")
+    watch_parser.add_argument(
+        "--docs-dir", "-d",
+        type=str,
+        default="./docs",
+        help="md 文档目录路径 (默认: ./docs)"
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=WATCH_INTERVAL,
+        help=f"轮询间隔（秒，默认: {WATCH_INTERVAL}）"
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=WATCH_DEBOUNCE,
+        help=f"最后一次变化后等待多久没有新变化才更新（秒，默认: {WATCH_DEBOUNCE}）"
+    )
     
     # query 命令
     query_parser = subparsers.add_parser("query", help="问答查询")
@@ -52,6 +134,35 @@ def main():
         default=TOP_K,
         help=f"返回结果数量 (默认: {TOP_K})"
     )
+    query_parser.add_argument(
+        "--batch-file", "-f",
+        type=str,
+        default=None,
+        help="批量模式：从文件读取问题（每行一个，或 JSONL 的 question 字段），结果以 JSONL 输出"
+    )
+    query_parser.add_argument(
+        "--output", "-o",
+        type=str,
+        default=None,
+        help="批量模式的结果文件路径（默认输出到标准输出）"
+    )
+    query_parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=None,
+        help=f"IVF_FLAT 查询时探测的聚类数 (默认: {SEARCH_NPROBE})"
+    )
+    query_parser.add_argument(
+        "--ef",
+        type=int,
+        default=None,
+        help=f"HNSW 查询时的候选集大小 (默认: {SEARCH_EF})"
+    )
+    query_parser.add_argument(
+        "--no-hybrid",
+        action="store_true",
+        help="只使用向量检索（默认融合 BM25 关键词检索）"
+    )
     
     # stats 命令
     stats_parser = subparsers.add_parser("stats", help="显示统计信息")
@@ -79,17 +190,78 @@ def main():
         type=str,
         help="模型名称"
     )
+    ask_parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=None,
+        help=f"IVF_FLAT 查询时探测的聚类数 (默认: {SEARCH_NPROBE})"
+    )
+    ask_parser.add_argument(
+        "--ef",
+        type=int,
+        default=None,
+        help=f"HNSW 查询时的候选集大小 (默认: {SEARCH_EF})"
+    )
+    ask_parser.add_argument(
+        "--no-hybrid",
+        action="store_true",
+        help="只使用向量检索（默认融合 BM25 关键词检索）"
+    )
+    ask_parser.add_argument(
+        "--rerank",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help=f"是否用交叉编码器对 {RERANK_CANDIDATES} 个候选重排序后再交给大模型（默认: config.py 中的 RERANK_ENABLED）"
+    )
+    ask_parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="等待完整回答后再显示（默认边生成边显示）"
+    )
+    ask_parser.add_argument(
+        "--answer-cache",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="是否复用答案缓存中相似问题的回答（默认: config.py 中的 ANSWER_CACHE_ENABLED）"
+    )
+    ask_parser.add_argument(
+        "--compress",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="是否只把与问题最相关的句子及其前后句交给大模型（默认: config.py 中的 SENTENCE_EXTRACTION_ENABLED）"
+    )
+    
+    # serve 命令
+    serve_parser = subparsers.add_parser("serve", help="启动常驻服务（保持模型与数据库常驻）")
+    serve_parser.add_argument(
+        "--socket",
+        type=str,
+        default=DAEMON_SOCKET_PATH,
+        help=f"Unix 域套接字路径 (默认: {DAEMON_SOCKET_PATH})"
+    )
     
     args = parser.parse_args()
     
+    if args.command is None:
+        parser.print_help()
+        return
+    
+    # 解析参数后再导入命令模块：--help 不承担 rich/numpy 等导入开销，
+    # 各子命令也只在真正用到时才加载 torch、pymilvus、openai
+    from src.cli_commands import cmd_index, cmd_watch, cmd_query, cmd_ask, cmd_stats, cmd_serve
+    
     if args.command == "index":
         cmd_index(args)
+    elif args.command == "watch":
+        cmd_watch(args)
     elif args.command == "query":
         cmd_query(args)
     elif args.command == "ask":
         cmd_ask(args)
     elif args.command == "stats":
         cmd_stats(args)
+    elif args.command == "serve":
+        cmd_serve(args)
     else:
         parser.print_help()
 
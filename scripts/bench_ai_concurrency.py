@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+AI 服务并发基准 - 对本地模拟服务并发发起问答，检查连接复用、并发上限与限流重试
+
+用法:
+  python scripts/bench_ai_concurrency.py [--requests 40] [--latency 0.2] [--fail-rate 0.2] [--stream]
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import threading
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+
+from config import AI_MAX_CONCURRENCY, AI_POOL_CONNECTIONS
+from mock_openai_server import make_server
+
+
+def run_async(base_url: str, requests: int, stream: bool):
+    """
+    用 AsyncAIService 在一个事件循环中并发发起请求，返回 (每个请求的耗时, 成功数, 服务统计)
+    """
+    from src.ai_service import AsyncAIService
+
+    service = AsyncAIService(base_url=base_url, api_key="test", model="mock")
+
+    async def one(i):
+        started = time.perf_counter()
+        if stream:
+            result = None
+            async for event in service.stream_answer(f"问题 {i}", ["参考资料"]):
+                if event["type"] == "done":
+                    result = event["result"]
+        else:
+            result = await service.generate_answer(f"问题 {i}", ["参考资料"])
+        return time.perf_counter() - started, result["success"]
+
+    async def all_requests():
+        return await asyncio.gather(*(one(i) for i in range(requests)))
+
+    results = asyncio.run(all_requests())
+    return [r[0] for r in results], sum(r[1] for r in results), service.stats()
+
+
+def run_threads(base_url: str, requests: int, stream: bool):
+    """
+    用同步 AIService 从多个线程并发发起请求（模拟常驻服务的并发请求）
+    """
+    from src.ai_service import get_ai_service
+
+    service = get_ai_service(base_url=base_url, api_key="test", model="mock")
+
+    def one(i):
+        started = time.perf_counter()
+        if stream:
+            result = [e for e in service.stream_answer(f"问题 {i}", ["参考资料"]) if e["type"] == "done"][0]["result"]
+        else:
+            result = service.generate_answer(f"问题 {i}", ["参考资料"])
+        return time.perf_counter() - started, result["success"]
+
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        results = list(pool.map(one, range(requests)))
+    return [r[0] for r in results], sum(r[1] for r in results), service.stats()
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="AI 服务并发基准")
+    parser.add_argument("--requests", "-n", type=int, default=40, help="每种方式的请求数 (默认: 40)")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟服务响应延迟秒数 (默认: 0.2)")
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="模拟服务返回 429 的概率 (默认: 0.2)")
+    parser.add_argument("--stream", action="store_true", help="使用流式接口")
+    args = parser.parse_args()
+
+    print(f"并发上限 {AI_MAX_CONCURRENCY}，连接池 {AI_POOL_CONNECTIONS}，请求数 {args.requests}，429 概率 {args.fail_rate}")
+    print(f"{'方式':<12}{'成功':>8}{'重试':>6}{'连接数':>8}{'最大并发':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'总耗时(s)':>11}")
+
+    failed = False
+    for name, runner in (("asyncio", run_async), ("线程", run_threads)):
+        server = make_server(latency=args.latency, fail_rate=args.fail_rate)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+        started = time.perf_counter()
+        timings, succeeded, stats = runner(base_url, args.requests, args.stream)
+        elapsed = time.perf_counter() - started
+        server_stats = server.state.snapshot()
+        server.shutdown()
+        server.server_close()
+
+        timings = sorted(t * 1000 for t in timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        violations = []
+        if server_stats["max_in_flight"] > AI_MAX_CONCURRENCY:
+            violations.append("超出并发上限")
+        if server_stats["connections"] > AI_POOL_CONNECTIONS:
+            violations.append("连接未复用")
+        failed = failed or bool(violations)
+        status = "❌ " + "，".join(violations) if violations else "✅"
+        print(
+            f"{name:<12}{succeeded:>5}/{args.requests:<3}{stats['retries']:>5}{server_stats['connections']:>8}"
+            f"{server_stats['max_in_flight']:>10}{statistics.median(timings):>10.0f}{p95:>10.0f}{elapsed:>11.2f}  {status}"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+文本分割基准 - 在大文件上比较逐行标题分割与单遍 Markdown 分词器的吞吐量、内存峰值和切分结果
+
+用法:
+  python scripts/bench_splitter.py [--size-mb 20] [--repeat 3] [--file docs/xxx.md] [--tokens]
+
+加 --tokens 时加载 Embedding 模型的分词器，比较按字符数与按 token 数分块的块数、
+平均 token 数和超出模型最大序列长度（编码时被截断）的块数。
+"""
+
+import sys
+import time
+import argparse
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+from src.splitter import split_by_headers, split_text, get_token_chunker
+from src.markdown_tokenizer import iter_sections
+
+
+# 合成文档的基本单元：标题、中英文段落、列表、含 # 注释的代码块、表格、Setext 标题
+_PARAGRAPH = (
+    "Docker 默认为每个容器创建独立的网络命名空间。容器之间可以通过桥接网络互相访问！需要对外暴露端口时使用 -p 参数？\n"
+    "The bridge driver is the default. Containers on the same user-defined bridge can resolve each other by name.\n"
+    "自定义网络还提供自动的 DNS 解析，比默认网桥上的 --link 更灵活，也更容易在多个服务之间复用。\n\n"
+)
+
+_BLOCK = """## 第 {i} 节 容器网络
+
+""" + _PARAGRAPH * 2 + """- 使用 `docker network ls` 查看网络
+- 使用 `docker network inspect` 查看详情
+- 使用 `docker network rm` 删除网络
+
+```bash
+# 创建自定义网络
+docker network create app-net
+# 启动容器并加入网络
+docker run -d --name web --network app-net nginx
+```
+
+| 驱动 | 说明 |
+| --- | --- |
+| bridge | 默认的桥接网络 |
+| host | 与宿主机共享网络 |
+
+常见问题
+--------
+
+""" + _PARAGRAPH + """```python
+# 这不是标题
+def ping(host):
+    return os.system(f"ping -c 1 {{host}}")
+```
+
+"""
+
+
+def make_document(size_mb: float) -> str:
+    """
+    生成约 size_mb MB 的合成 Markdown 文档（以 Front Matter 开头）
+    """
+    parts = ["---\ntitle: 容器网络手册\n# 生成的测试文档\n---\n\n# 容器网络手册\n\n"]
+    total, i = 0, 0
+    target = int(size_mb * 1024 * 1024)
+    while total < target:
+        block = _BLOCK.format(i=i)
+        parts.append(block)
+        total += len(block.encode("utf-8"))
+        i += 1
+    return "".join(parts)
+
+
+def legacy_sections(content: str) -> list:
+    """
+    原有实现：逐行判断标题
+    """
+    return split_by_headers(content)
+
+
+def tokenizer_sections(content: str) -> list:
+    """
+    新实现：单遍 Markdown 分词器
+    """
+    return [section["text"] for section in iter_sections(content)]
+
+
+def chunk_all(sections: list) -> int:
+    """
+    把章节按大小分块，返回块数
+    """
+    return sum(len(split_text(section, CHUNK_SIZE, CHUNK_OVERLAP)) for section in sections)
+
+
+def measure(func, content: str, repeat: int):
+    """
+    返回 (最快耗时, 结果)
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(content)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def peak_memory(func, content: str) -> float:
+    """
+    返回执行 func 时新分配内存的峰值（MB）
+    """
+    tracemalloc.start()
+    func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="文本分割基准")
+    parser.add_argument("--size-mb", type=float, default=20, help="合成文档大小 (默认: 20 MB)")
+    parser.add_argument("--repeat", type=int, default=3, help="每种实现重复次数，取最快一次 (默认: 3)")
+    parser.add_argument("--file", type=str, default=None, help="使用指定的 Markdown 文件代替合成文档")
+    parser.add_argument("--tokens", action="store_true", help="同时比较按字符数与按 token 数分块（需要加载分词器）")
+    args = parser.parse_args()
+
+    content = Path(args.file).read_text(encoding="utf-8") if args.file else make_document(args.size_mb)
+    size_mb = len(content.encode("utf-8")) / 1024 / 1024
+    print(f"文档大小 {size_mb:.1f} MB，分块大小 {CHUNK_SIZE}，重叠 {CHUNK_OVERLAP}")
+    print(f"{'实现':<14}{'章节数':>8}{'章节(s)':>10}{'MB/s':>9}{'内存峰值(MB)':>14}{'分块数':>9}{'分块(s)':>10}")
+
+    results = {}
+    for name, func in (("逐行标题", legacy_sections), ("Markdown 分词", tokenizer_sections)):
+        seconds, sections = measure(func, content, args.repeat)
+        memory = peak_memory(func, content)
+        started = time.perf_counter()
+        chunks = chunk_all(sections)
+        chunk_seconds = time.perf_counter() - started
+        results[name] = sections
+        print(
+            f"{name:<14}{len(sections):>8}{seconds:>10.3f}{size_mb / seconds:>9.1f}"
+            f"{memory:>14.1f}{chunks:>9}{chunk_seconds:>10.3f}"
+        )
+
+    # 按章节首行比较切分位置：原有实现会从代码块 / Front Matter 的 # 注释处切开，
+    # 分词器额外识别 Setext 标题并把 Front Matter 单独成段
+    legacy = Counter(section.lstrip().split("\n", 1)[0] for section in results["逐行标题"])
+    tokenized = Counter(section.split("\n", 1)[0] for section in results["Markdown 分词"])
+    print(f"\n仅原有实现切分的位置: {sum((legacy - tokenized).values())}，仅分词器切分的位置: {sum((tokenized - legacy).values())}")
+    for line, count in (legacy - tokenized).most_common(3):
+        print(f"   原有实现从 {line!r} 处切开 {count} 次")
+
+    if args.tokens:
+        compare_token_chunking(results["Markdown 分词"])
+
+
+def compare_token_chunking(sections: list):
+    """
+    比较按字符数与按 token 数分块：块数、平均 token 数、超出模型最大序列长度的块数
+    """
+    chunker = get_token_chunker()
+    chunker.load_tokenizer()
+    # 超出 limit 的块在编码时会被截断（limit 已扣除特殊 token）
+    print(f"\n模型最大序列长度 {chunker.max_seq_length}，每块 token 上限 {chunker.limit}，重叠 {chunker.overlap} tokens")
+    print(f"{'分块方式':<12}{'分块数':>9}{'分块(s)':>10}{'平均 tokens':>13}{'超出上限':>10}")
+
+    for name, split in (
+        ("按字符数", lambda: [chunk for section in sections for chunk in split_text(section, CHUNK_SIZE, CHUNK_OVERLAP)]),
+        ("按 token 数", lambda: [chunk for chunks in chunker.split(sections) for chunk in chunks])
+    ):
+        started = time.perf_counter()
+        chunks = split()
+        seconds = time.perf_counter() - started
+        counts = chunker.count_tokens(chunks)
+        over = sum(1 for count in counts if count > chunker.limit)
+        print(f"{name:<12}{len(chunks):>9}{seconds:>10.2f}{sum(counts) / max(len(counts), 1):>13.1f}{over:>10}")
+
+
+if __name__ == "__main__":
+    main()
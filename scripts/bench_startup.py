@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+CLI 启动耗时基准 - 测量各子命令的启动时间与重量级模块的导入情况
+
+用法:
+  python scripts/bench_startup.py [--repeat 5]
+"""
+
+import sys
+import time
+import argparse
+import subprocess
+import statistics
+from pathlib import Path
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 需要关注导入开销的重量级模块
+HEAVY_MODULES = ["torch", "sentence_transformers", "transformers", "onnxruntime", "pymilvus", "openai"]
+
+# (名称, 命令参数, 标准输入, 不允许导入的模块)
+CASES = [
+    ("--help", ["--help"], None, HEAVY_MODULES),
+    ("index --help", ["index", "--help"], None, HEAVY_MODULES),
+    ("watch --help", ["watch", "--help"], None, HEAVY_MODULES),
+    ("query --help", ["query", "--help"], None, HEAVY_MODULES),
+    ("ask --help", ["ask", "--help"], None, HEAVY_MODULES),
+    ("stats", ["stats"], None, ["torch", "sentence_transformers", "transformers", "onnxruntime", "openai"]),
+    ("query (首次提问前)", ["query"], "q\n", ["torch", "sentence_transformers", "transformers", "onnxruntime", "openai"]),
+    ("ask (首次提问前)", ["ask"], "q\n", ["torch", "sentence_transformers", "transformers", "onnxruntime"]),
+]
+
+
+def run_once(args, stdin):
+    """
+    运行一次命令，返回 (耗时秒数, 已导入的顶层模块集合)
+    """
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", str(PROJECT_ROOT / "main.py")] + args,
+        input=stdin,
+        capture_output=True,
+        text=True,
+        cwd=str(PROJECT_ROOT)
+    )
+    elapsed = time.perf_counter() - started
+
+    imported = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        name = line.rsplit("|", 1)[-1].strip()
+        imported.add(name.split(".")[0])
+    return elapsed, imported
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="CLI 启动耗时基准")
+    parser.add_argument("--repeat", "-n", type=int, default=5, help="每个命令重复次数 (默认: 5)")
+    args = parser.parse_args()
+
+    print(f"{'命令':<22}{'中位数(ms)':>12}{'最小(ms)':>10}  重量级模块")
+    failed = False
+    for name, cmd_args, stdin, forbidden in CASES:
+        timings = []
+        imported = set()
+        for _ in range(args.repeat):
+            elapsed, imported = run_once(cmd_args, stdin)
+            timings.append(elapsed * 1000)
+
+        heavy = [m for m in HEAVY_MODULES if m in imported]
+        violations = [m for m in forbidden if m in imported]
+        failed = failed or bool(violations)
+        status = "❌ 不应导入 " + ",".join(violations) if violations else "✅"
+        print(
+            f"{name:<22}{statistics.median(timings):>12.0f}{min(timings):>10.0f}  "
+            f"{','.join(heavy) or '-'}  {status}"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容模拟服务 - 用于在不访问真实 API 的情况下测试 AI 服务的并发、重试与流式输出
+
+支持 POST /v1/chat/completions（含 stream=True 的 SSE 输出），
+可配置响应延迟与按比例返回 429 / 503；GET /stats 返回请求统计。
+
+用法:
+  python scripts/mock_openai_server.py [--port 8765] [--latency 0.2] [--fail-rate 0.2]
+  python main.py ask --base-url http://127.0.0.1:8765/v1 --api-key test
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockState:
+    """
+    模拟服务的配置与统计（所有请求线程共享）
+    """
+
+    def __init__(self, latency: float = 0.2, fail_rate: float = 0.0, fail_status: int = 429, retry_after: float = None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.stats = {
+            "connections": 0,
+            "requests": 0,
+            "failed": 0,
+            "in_flight": 0,
+            "max_in_flight": 0
+        }
+
+    def update(self, **deltas):
+        """
+        原子地累加统计值，并维护最大并发数
+        """
+        with self.lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def snapshot(self) -> dict:
+        """
+        返回统计快照
+        """
+        with self.lock:
+            return dict(self.stats)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    请求处理器：保持长连接，流式响应使用 chunked 编码
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.state.update(connections=1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data: bytes, last: bool = False):
+        # 最后一块与结束标记一起写出，客户端读到 [DONE] 时响应已完整，连接可以复用
+        payload = f"{len(data):x}\r\n".encode() + data + b"\r\n"
+        self.wfile.write(payload + b"0\r\n\r\n" if last else payload)
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.server.state.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        state = self.server.state
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        state.update(requests=1, in_flight=1)
+        try:
+            time.sleep(state.latency)
+            if random.random() < state.fail_rate:
+                state.update(failed=1)
+                headers = {"Retry-After": str(state.retry_after)} if state.retry_after is not None else {}
+                self._send_json(
+                    state.fail_status,
+                    {"error": {"message": f"mock {state.fail_status}", "type": "mock_error"}},
+                    headers
+                )
+                return
+
+            question = request["messages"][-1]["content"] if request.get("messages") else ""
+            words = ["这是", "模拟", "服务", "返回", "的", "答案", "。"]
+            usage = {
+                "prompt_tokens": len(question),
+                "completion_tokens": len(words),
+                "total_tokens": len(question) + len(words)
+            }
+            model = request.get("model", "mock")
+
+            if not request.get("stream"):
+                self._send_json(200, {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(words)},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": usage
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            include_usage = (request.get("stream_options") or {}).get("include_usage")
+            base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+            try:
+                for word in words:
+                    chunk = {**base, "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                    self._send_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    time.sleep(state.latency / len(words))
+                if include_usage:
+                    chunk = {**base, "choices": [], "usage": usage}
+                    self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self._send_chunk(b"data: [DONE]\n\n", last=True)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前关闭了流
+                self.close_connection = True
+        finally:
+            state.update(in_flight=-1)
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.2,
+    fail_rate: float = 0.0,
+    fail_status: int = 429,
+    retry_after: float = None
+) -> ThreadingHTTPServer:
+    """
+    创建模拟服务（未启动）
+
+    Args:
+        host: 监听地址
+        port: 监听端口（0 表示随机分配）
+        latency: 每个请求的响应延迟（秒）
+        fail_rate: 返回错误的概率
+        fail_status: 错误状态码（如 429 / 503）
+        retry_after: 错误响应附带的 Retry-After（秒，None 表示不附带）
+
+    Returns:
+        服务对象，统计在 server.state 中，地址为 http://host:server.server_port/v1
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.state = MockState(latency, fail_rate, fail_status, retry_after)
+    return server
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址 (默认: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口 (默认: 8765)")
+    parser.add_argument("--latency", type=float, default=0.2, help="响应延迟秒数 (默认: 0.2)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="返回错误的概率 (默认: 0)")
+    parser.add_argument("--fail-status", type=int, default=429, help="错误状态码 (默认: 429)")
+    parser.add_argument("--retry-after", type=float, default=None, help="错误响应附带的 Retry-After 秒数")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.fail_rate, args.fail_status, args.retry_after)
+    print(f"✅ 模拟服务已启动: http://{args.host}:{server.server_port}/v1（Ctrl+C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n统计:", json.dumps(server.state.snapshot(), ensure_ascii=False))
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
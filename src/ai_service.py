@@ -3,54 +3,288 @@ AI 服务模块 - OpenAI 兼容接口集成
 """
 
 import os
-from typing import List, Dict, Optional
-from openai import OpenAI
+import json
+import time
+import queue
+import random
+import asyncio
+import weakref
+import threading
+import contextlib
+from typing import List, Dict, Optional, Iterator, AsyncIterator
 from config import (
-    OPENAI_BASE_URL, 
-    OPENAI_API_KEY, 
+    OPENAI_BASE_URL,
+    OPENAI_API_KEY,
     OPENAI_MODEL,
     OPENAI_TEMPERATURE,
-    OPENAI_MAX_TOKENS
+    OPENAI_MAX_TOKENS,
+    AI_MAX_CONCURRENCY,
+    AI_POOL_CONNECTIONS,
+    AI_MAX_RETRIES,
+    AI_RETRY_BASE_DELAY,
+    AI_RETRY_MAX_DELAY,
+    AI_REQUEST_TIMEOUT
 )
 
 
-class AIService:
+def build_messages(question: str, contexts: List[str]) -> List[Dict[str, str]]:
     """
-    AI 服务类，用于与 OpenAI 兼容的 API 进行交互
+    构建 RAG 问答的对话消息
+    
+    Args:
+        question: 用户问题
+        contexts: 检索到的相关文本列表
+    
+    Returns:
+        对话消息列表
+    """
+    # 构建上下文
+    context_text = "\n\n".join([
+        f"参考资料 {i+1}:\n{ctx}"
+        for i, ctx in enumerate(contexts)
+    ])
+    
+    # 构建系统提示词
+    system_prompt = """你是一个专业的技术文档助手。你的任务是根据提供的参考资料回答用户的问题。
+
+回答要求：
+1. 基于提供的参考资料回答问题
+2. 如果参考资料中没有相关信息，请明确说明
+3. 回答要准确、清晰、有条理
+4. 如果可能，引用具体的参考资料编号"""
+    
+    # 构建用户提示词
+    user_prompt = f"""参考资料:
+{context_text}
+
+问题: {question}
+
+请基于以上参考资料回答问题。"""
+    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _usage_dict(usage) -> Optional[Dict]:
+    """
+    把响应中的 usage（对象或流式 chunk 中的字典）转换为字典
+    """
+    if not usage:
+        return None
+    fields = ("prompt_tokens", "completion_tokens", "total_tokens")
+    if isinstance(usage, dict):
+        return {field: usage.get(field) for field in fields}
+    return {field: getattr(usage, field) for field in fields}
+
+
+async def _iter_chunks(response) -> AsyncIterator[Dict]:
+    """
+    逐个解析流式响应（SSE）中的 chunk
+    
+    读到 [DONE] 后仍把响应体读完再结束：只有完整读完的响应，
+    连接才会回到连接池复用（SDK 的流对象在 [DONE] 处直接关闭连接）。
+    
+    Args:
+        response: 尚未读取响应体的 HTTP 响应
+        
+    Yields:
+        chunk 字典
+    """
+    done = False
+    async for line in response.aiter_lines():
+        if done or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            done = True
+            continue
+        chunk = json.loads(data)
+        if isinstance(chunk, dict) and chunk.get("error"):
+            error = chunk["error"]
+            raise RuntimeError(error.get("message") if isinstance(error, dict) else str(error))
+        yield chunk
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    判断请求错误是否值得重试：限流 (429)、服务端错误 (5xx)、连接错误与超时
+    
+    Args:
+        error: 请求抛出的异常
+    
+    Returns:
+        是否重试
+    """
+    from openai import APIStatusError, APIConnectionError
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    # APITimeoutError 是 APIConnectionError 的子类
+    return isinstance(error, APIConnectionError)
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """
+    计算第 attempt 次重试前的等待时间
+    
+    使用 "full jitter" 指数退避：在 [0, min(上限, 基数 * 2^attempt)] 内均匀随机，
+    避免并发请求在同一时刻一起重试；服务端给出 Retry-After 时至少等待该时长（不超过上限）。
+    
+    Args:
+        attempt: 已失败的次数（从 0 开始）
+        error: 本次失败的异常
+    
+    Returns:
+        等待秒数
+    """
+    delay = random.uniform(0, min(AI_RETRY_MAX_DELAY, AI_RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        delay = max(delay, min(float(retry_after), AI_RETRY_MAX_DELAY))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+class _Endpoint:
+    """
+    一个 API 端点（base_url + api_key）的共享资源：HTTP 连接池、并发信号量与请求统计
+    
+    同一事件循环内访问同一端点的所有服务实例共用一个 _Endpoint，
+    连接在请求之间保持复用，并发数由信号量统一限制。
+    """
+    
+    def __init__(self, base_url: Optional[str], api_key: str):
+        """
+        初始化端点（需在所属事件循环中调用）
+        
+        Args:
+            base_url: API 基础 URL
+            api_key: API 密钥
+        """
+        import httpx
+        from openai import AsyncOpenAI
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=AI_POOL_CONNECTIONS,
+                max_keepalive_connections=AI_POOL_CONNECTIONS
+            ),
+            timeout=AI_REQUEST_TIMEOUT,
+            follow_redirects=True
+        )
+        # 重试由 AsyncAIService 统一负责，关闭 SDK 自带的重试
+        self.client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=0,
+            timeout=AI_REQUEST_TIMEOUT,
+            http_client=self.http_client
+        )
+        self.semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "in_flight": 0,
+            "max_in_flight": 0
+        }
+    
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """
+        占用一个并发名额，直到请求（含流式读取）结束
+        """
+        async with self.semaphore:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            try:
+                yield
+            finally:
+                self.stats["in_flight"] -= 1
+
+
+# 每个事件循环各自的端点表 {loop: {(base_url, api_key): _Endpoint}}
+# 连接池和信号量都绑定在创建它们的事件循环上，循环被回收时一并释放
+_endpoints = weakref.WeakKeyDictionary()
+
+
+def _get_endpoint(base_url: Optional[str], api_key: str) -> _Endpoint:
+    """
+    获取当前事件循环中指定端点的共享资源，不存在时创建
+    """
+    endpoints = _endpoints.setdefault(asyncio.get_running_loop(), {})
+    key = (base_url, api_key)
+    if key not in endpoints:
+        endpoints[key] = _Endpoint(base_url, api_key)
+    return endpoints[key]
+
+
+class AsyncAIService:
+    """
+    异步 AI 服务类，基于 asyncio 与 OpenAI 兼容的 API 进行交互
+    
+    同一端点的请求复用连接池，并发数受 AI_MAX_CONCURRENCY 限制；
+    429 / 5xx / 连接错误按带抖动的指数退避重试，重试期间继续占用并发名额，
+    让限流时的整体请求速率随之下降。
     """
     
     def __init__(
         self,
         base_url: Optional[str] = None,
         api_key: Optional[str] = None,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        max_retries: int = AI_MAX_RETRIES
     ):
         """
-        初始化 AI 服务
+        初始化 AI 服务（不建立连接，首次请求时才创建端点资源）
         
         Args:
             base_url: API 基础 URL（可选，默认从配置读取）
             api_key: API 密钥（可选，默认从配置读取）
             model: 模型名称（可选，默认从配置读取）
+            max_retries: 可重试错误的最大重试次数
         """
         # 优先使用传入参数，否则使用配置文件，最后使用环境变量
         self.base_url = base_url or OPENAI_BASE_URL or os.getenv("OPENAI_BASE_URL")
         self.api_key = api_key or OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
         self.model = model or OPENAI_MODEL or os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+        self.max_retries = max_retries
         
         if not self.api_key or self.api_key == "your-api-key-here":
             raise ValueError(
                 "未设置 API Key，请在 config.py 中设置 OPENAI_API_KEY "
                 "或设置环境变量 OPENAI_API_KEY"
             )
+    
+    async def _create(self, endpoint: _Endpoint, **request):
+        """
+        发送一次对话请求，可重试的错误按退避策略重试
         
-        # 初始化 OpenAI 客户端
-        self.client = OpenAI(
-            base_url=self.base_url,
-            api_key=self.api_key
-        )
+        Args:
+            endpoint: 端点资源（调用方已占用并发名额）
+            **request: chat.completions.create 的参数
+        
+        Returns:
+            响应对象；stream=True 时为尚未读取响应体的 HTTP 响应
+        """
+        completions = endpoint.client.chat.completions
+        for attempt in range(self.max_retries + 1):
+            try:
+                if request.get("stream"):
+                    raw = await completions.with_raw_response.create(**request)
+                    return raw.http_response
+                return await completions.create(**request)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    endpoint.stats["failures"] += 1
+                    raise
+                endpoint.stats["retries"] += 1
+                await asyncio.sleep(_retry_delay(attempt, e))
     
-    def generate_answer(
+    async def generate_answer(
         self,
         question: str,
         contexts: List[str],
@@ -65,44 +299,21 @@ class AIService:
             contexts: 检索到的相关文本列表
             temperature: 温度参数（可选）
             max_tokens: 最大生成长度（可选）
-            
+        
         Returns:
             包含答案和元信息的字典
         """
-        # 构建上下文
-        context_text = "\n\n".join([
-            f"参考资料 {i+1}:\n{ctx}" 
-            for i, ctx in enumerate(contexts)
-        ])
-        
-        # 构建系统提示词
-        system_prompt = """你是一个专业的技术文档助手。你的任务是根据提供的参考资料回答用户的问题。
-
-回答要求：
-1. 基于提供的参考资料回答问题
-2. 如果参考资料中没有相关信息，请明确说明
-3. 回答要准确、清晰、有条理
-4. 如果可能，引用具体的参考资料编号"""
-        
-        # 构建用户提示词
-        user_prompt = f"""参考资料:
-{context_text}
-
-问题: {question}
-
-请基于以上参考资料回答问题。"""
-        
         # 调用 AI 服务
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature or OPENAI_TEMPERATURE,
-                max_tokens=max_tokens or OPENAI_MAX_TOKENS
-            )
+            endpoint = _get_endpoint(self.base_url, self.api_key)
+            async with endpoint.slot():
+                response = await self._create(
+                    endpoint,
+                    model=self.model,
+                    messages=build_messages(question, contexts),
+                    temperature=temperature or OPENAI_TEMPERATURE,
+                    max_tokens=max_tokens or OPENAI_MAX_TOKENS
+                )
             
             # 提取答案，支持多种格式
             message = response.choices[0].message
@@ -124,11 +335,7 @@ class AIService:
                 "success": True,
                 "answer": answer,
                 "model": self.model,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
+                "usage": _usage_dict(response.usage)
             }
         
         except Exception as e:
@@ -138,7 +345,100 @@ class AIService:
                 "answer": None
             }
     
-    def chat(
+    async def stream_answer(
+        self,
+        question: str,
+        contexts: List[str],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        基于检索到的上下文流式生成答案，收到增量就立即产出
+        
+        思考过程（glm 等模型的 reasoning_content）与正文分开产出；
+        结束时请求服务端附带 token 用量，并统计首个 token 的延迟。
+        只在收到第一个增量之前重试，已输出的内容不会重复。
+        
+        Args:
+            question: 用户问题
+            contexts: 检索到的相关文本列表
+            temperature: 温度参数（可选）
+            max_tokens: 最大生成长度（可选）
+        
+        Yields:
+            {"type": "reasoning" | "content", "text": 增量文本}，
+            最后一个为 {"type": "done", "result": 与 generate_answer 相同的字典，另含 reasoning、ttft}
+        """
+        request = dict(
+            model=self.model,
+            messages=build_messages(question, contexts),
+            temperature=temperature or OPENAI_TEMPERATURE,
+            max_tokens=max_tokens or OPENAI_MAX_TOKENS,
+            stream=True
+        )
+        
+        start = time.perf_counter()
+        ttft = None
+        content_parts, reasoning_parts = [], []
+        usage = None
+        try:
+            endpoint = _get_endpoint(self.base_url, self.api_key)
+            async with endpoint.slot():
+                try:
+                    response = await self._create(endpoint, **request, stream_options={"include_usage": True})
+                except Exception as e:
+                    if _is_retryable(e):
+                        raise
+                    # 部分兼容服务不支持 stream_options，此时不统计用量
+                    response = await self._create(endpoint, **request)
+                
+                try:
+                    async for chunk in _iter_chunks(response):
+                        if chunk.get("usage"):
+                            usage = _usage_dict(chunk["usage"])
+                        if not chunk.get("choices"):
+                            continue
+                        
+                        delta = chunk["choices"][0].get("delta") or {}
+                        for kind, text, parts in (
+                            ("reasoning", delta.get("reasoning_content"), reasoning_parts),
+                            ("content", delta.get("content"), content_parts)
+                        ):
+                            if not text:
+                                continue
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                            parts.append(text)
+                            yield {"type": kind, "text": text}
+                finally:
+                    await response.aclose()
+        
+        except Exception as e:
+            yield {
+                "type": "done",
+                "result": {
+                    "success": False,
+                    "error": str(e),
+                    "answer": "".join(content_parts) or None
+                }
+            }
+            return
+        
+        answer = "".join(content_parts)
+        reasoning = "".join(reasoning_parts)
+        result = {
+            "success": True,
+            # 与 generate_answer 一致：没有正文时使用思考过程
+            "answer": answer or reasoning or "[API 返回了响应但未找到答案内容]",
+            "reasoning": reasoning or None,
+            "model": self.model,
+            "ttft": round(ttft, 3) if ttft is not None else None
+        }
+        if usage:
+            result["usage"] = usage
+        yield {"type": "done", "result": result}
+    
+    async def chat(
         self,
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
@@ -151,17 +451,20 @@ class AIService:
             messages: 对话消息列表
             temperature: 温度参数（可选）
             max_tokens: 最大生成长度（可选）
-            
+        
         Returns:
             包含回复和元信息的字典
         """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature or OPENAI_TEMPERATURE,
-                max_tokens=max_tokens or OPENAI_MAX_TOKENS
-            )
+            endpoint = _get_endpoint(self.base_url, self.api_key)
+            async with endpoint.slot():
+                response = await self._create(
+                    endpoint,
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature or OPENAI_TEMPERATURE,
+                    max_tokens=max_tokens or OPENAI_MAX_TOKENS
+                )
             
             reply = response.choices[0].message.content
             
@@ -169,11 +472,7 @@ class AIService:
                 "success": True,
                 "reply": reply,
                 "model": self.model,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
+                "usage": _usage_dict(response.usage)
             }
         
         except Exception as e:
@@ -182,10 +481,167 @@ class AIService:
                 "error": str(e),
                 "reply": None
             }
+    
+    def stats(self) -> Dict:
+        """
+        获取本端点的请求统计（汇总所有事件循环）
+        
+        Returns:
+            {requests, retries, failures, in_flight, max_in_flight}
+        """
+        total = {"requests": 0, "retries": 0, "failures": 0, "in_flight": 0, "max_in_flight": 0}
+        for endpoints in list(_endpoints.values()):
+            endpoint = endpoints.get((self.base_url, self.api_key))
+            if endpoint is None:
+                continue
+            for key, value in endpoint.stats.items():
+                total[key] = max(total[key], value) if key == "max_in_flight" else total[key] + value
+        return total
+
+
+# 同步接口共用的后台事件循环（在守护线程中运行）
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    获取后台事件循环，首次调用时启动线程
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="ai-service", daemon=True).start()
+    return _loop
+
+
+def _run(coro):
+    """
+    在后台事件循环中执行协程并等待结果
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+class AIService:
+    """
+    AI 服务类，用于与 OpenAI 兼容的 API 进行交互
+    
+    同步接口：请求提交到后台事件循环中的 AsyncAIService 执行，
+    因此多个线程（如常驻服务的并发请求）共享同一个连接池与并发上限。
+    """
+    
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None
+    ):
+        """
+        初始化 AI 服务
+        
+        Args:
+            base_url: API 基础 URL（可选，默认从配置读取）
+            api_key: API 密钥（可选，默认从配置读取）
+            model: 模型名称（可选，默认从配置读取）
+        """
+        self.async_service = AsyncAIService(base_url=base_url, api_key=api_key, model=model)
+        self.base_url = self.async_service.base_url
+        self.api_key = self.async_service.api_key
+        self.model = self.async_service.model
+    
+    def generate_answer(
+        self,
+        question: str,
+        contexts: List[str],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Dict:
+        """
+        基于检索到的上下文生成答案
+        
+        Args:
+            question: 用户问题
+            contexts: 检索到的相关文本列表
+            temperature: 温度参数（可选）
+            max_tokens: 最大生成长度（可选）
+        
+        Returns:
+            包含答案和元信息的字典
+        """
+        return _run(self.async_service.generate_answer(question, contexts, temperature, max_tokens))
+    
+    def stream_answer(
+        self,
+        question: str,
+        contexts: List[str],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Iterator[Dict]:
+        """
+        基于检索到的上下文流式生成答案，收到增量就立即产出
+        
+        调用方提前停止迭代时取消后台请求并释放连接。
+        
+        Args:
+            question: 用户问题
+            contexts: 检索到的相关文本列表
+            temperature: 温度参数（可选）
+            max_tokens: 最大生成长度（可选）
+        
+        Yields:
+            与 AsyncAIService.stream_answer 相同的事件
+        """
+        events = queue.Queue()
+        
+        async def pump():
+            try:
+                async for event in self.async_service.stream_answer(question, contexts, temperature, max_tokens):
+                    events.put(event)
+            finally:
+                events.put(None)
+        
+        future = asyncio.run_coroutine_threadsafe(pump(), _get_loop())
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            future.cancel()
+    
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Dict:
+        """
+        直接对话（不使用 RAG）
+        
+        Args:
+            messages: 对话消息列表
+            temperature: 温度参数（可选）
+            max_tokens: 最大生成长度（可选）
+        
+        Returns:
+            包含回复和元信息的字典
+        """
+        return _run(self.async_service.chat(messages, temperature, max_tokens))
+    
+    def stats(self) -> Dict:
+        """
+        获取本端点的请求统计
+        
+        Returns:
+            {requests, retries, failures, in_flight, max_in_flight}
+        """
+        return self.async_service.stats()
 
 
-# 全局单例
-_ai_service_instance = None
+# 全局单例（按 base_url、api_key、model 分别缓存）
+_ai_service_instances = {}
 
 
 def get_ai_service(
@@ -194,23 +650,20 @@ def get_ai_service(
     model: Optional[str] = None
 ) -> AIService:
     """
-    获取全局 AIService 实例
+    获取 AIService 实例
+    
+    相同参数返回同一个实例，不会为每次调用重新创建客户端；
+    访问同一端点的实例共享连接池与并发上限。
     
     Args:
         base_url: API 基础 URL（可选）
         api_key: API 密钥（可选）
         model: 模型名称（可选）
-        
+    
     Returns:
         AIService 实例
     """
-    global _ai_service_instance
-    
-    # 如果传入了自定义参数，创建新实例
-    if base_url or api_key or model:
-        return AIService(base_url=base_url, api_key=api_key, model=model)
-    
-    # 否则返回单例
-    if _ai_service_instance is None:
-        _ai_service_instance = AIService()
-    return _ai_service_instance
+    key = (base_url, api_key, model)
+    if key not in _ai_service_instances:
+        _ai_service_instances[key] = AIService(base_url=base_url, api_key=api_key, model=model)
+    return _ai_service_instances[key]
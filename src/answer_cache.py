@@ -0,0 +1,305 @@
+"""
+答案缓存 - 按问题向量语义匹配复用大模型回答，按索引代数、有效期和容量淘汰
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+import numpy as np
+from config import (
+    INDEX_GENERATION_PATH,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MAX_ENTRIES
+)
+from src.query_cache import read_index_generation, normalize_question
+
+
+# 缓存的回答字段（检索结果、耗时等每次问答重新生成）
+ANSWER_FIELDS = ("answer", "reasoning", "model")
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    """
+    把向量归一化为单位长度（float32）
+    """
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def context_key(chunk_ids: List, llm_model: str, prompt_options: Optional[Dict] = None) -> str:
+    """
+    计算 (模型, 文本块 ID 集合, 提示词选项) 的标识：只有交给同一模型的参考资料完全相同，回答才能复用
+
+    Args:
+        chunk_ids: 检索到的文本块 ID（顺序无关）
+        llm_model: 生成回答的模型名称
+        prompt_options: 影响参考资料内容的选项（打包预算、句子抽取等）
+
+    Returns:
+        十六进制摘要
+    """
+    payload = json.dumps(
+        [llm_model, sorted(str(chunk_id) for chunk_id in chunk_ids), prompt_options],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class AnswerCache:
+    """
+    答案缓存
+
+    命中需要同时满足：
+    - 检索到的文本块 ID 集合、生成模型和提示词选项相同（见 context_key）
+    - 问题向量的余弦相似度不低于阈值
+    - 答案生成时的索引代数与当前一致，且未超过有效期
+
+    缓存写入后立即原子落盘；读取前检查文件是否变化，
+    因此命令行进程与常驻服务之间可以共享答案。
+    """
+
+    def __init__(
+        self,
+        model_key: str,
+        path: str = ANSWER_CACHE_PATH,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        generation_path: str = INDEX_GENERATION_PATH
+    ):
+        """
+        初始化缓存
+
+        Args:
+            model_key: Embedding 模型标识（不同模型的问题向量不能比较）
+            path: 缓存文件路径
+            threshold: 余弦相似度阈值
+            ttl: 答案有效期（秒）
+            max_entries: 最大条目数
+            generation_path: 索引代数文件路径
+        """
+        self.model_key = model_key
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation_path = generation_path
+
+        # key -> {question, context, generation, created, result}，按最近使用排序
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.vectors: Dict[str, np.ndarray] = {}
+        # context_key -> 条目 key 集合，查找时只比较参考资料相同的条目
+        self.groups: Dict[str, set] = {}
+        self.generation = read_index_generation(generation_path)
+        self._file_stat = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _stat_file(self):
+        """
+        获取缓存文件的 (mtime, size)
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        """
+        缓存文件被其他进程更新时重新加载，并丢弃索引代数已过期的条目（需持有锁）
+        """
+        stat = self._stat_file()
+        reloaded = stat != self._file_stat
+        if reloaded:
+            self._file_stat = stat
+            self._load()
+
+        generation = read_index_generation(self.generation_path)
+        if reloaded or generation != self.generation:
+            self.generation = generation
+            for key in [key for key, entry in self.entries.items() if entry["generation"] != generation]:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        """
+        删除一个条目（需持有锁）
+        """
+        entry = self.entries.pop(key)
+        self.vectors.pop(key, None)
+        group = self.groups.get(entry["context"])
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self.groups[entry["context"]]
+
+    def _add(self, key: str, entry: Dict, vector: np.ndarray):
+        """
+        写入一个条目并移到最近使用的位置（需持有锁）
+        """
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = entry
+        self.vectors[key] = vector
+        self.groups.setdefault(entry["context"], set()).add(key)
+
+    def _evict(self):
+        """
+        淘汰过期条目，再按 LRU 淘汰超出容量的条目（需持有锁）
+        """
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl]:
+            self._remove(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def get(
+        self,
+        vector: np.ndarray,
+        chunk_ids: List,
+        llm_model: str,
+        prompt_options: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        查找可复用的回答
+
+        Args:
+            vector: 问题向量
+            chunk_ids: 本次检索到的文本块 ID
+            llm_model: 生成回答的模型名称
+            prompt_options: 影响参考资料内容的选项（打包预算、句子抽取等）
+
+        Returns:
+            {answer, reasoning, model, question, similarity}，未命中时返回 None
+        """
+        vector = _unit(vector)
+        context = context_key(chunk_ids, llm_model, prompt_options)
+        with self._lock:
+            self._refresh()
+            now = time.time()
+            best_key, best_similarity = None, self.threshold
+            for key in self.groups.get(context, ()):
+                if now - self.entries[key]["created"] > self.ttl:
+                    continue
+                similarity = float(self.vectors[key] @ vector)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(best_key)
+            entry = self.entries[best_key]
+            return {
+                **entry["result"],
+                "question": entry["question"],
+                "similarity": round(best_similarity, 4)
+            }
+
+    def put(
+        self,
+        question: str,
+        vector: np.ndarray,
+        chunk_ids: List,
+        llm_model: str,
+        prompt_options: Optional[Dict],
+        result: Dict
+    ):
+        """
+        缓存一次成功的回答并落盘
+
+        Args:
+            question: 问题文本
+            vector: 问题向量
+            chunk_ids: 交给大模型的文本块 ID
+            llm_model: 生成回答的模型名称
+            prompt_options: 影响参考资料内容的选项（与 get 相同）
+            result: generate_answer 的返回结果
+        """
+        context = context_key(chunk_ids, llm_model, prompt_options)
+        question = normalize_question(question)
+        key = hashlib.blake2b(f"{context}:{question}".encode("utf-8"), digest_size=16).hexdigest()
+        with self._lock:
+            self._refresh()
+            entry = {
+                "question": question,
+                "context": context,
+                "generation": self.generation,
+                "created": time.time(),
+                "result": {field: result.get(field) for field in ANSWER_FIELDS}
+            }
+            self._add(key, entry, _unit(vector))
+            self._evict()
+            self._save()
+
+    def stats(self) -> Dict:
+        """
+        获取缓存统计信息
+
+        Returns:
+            {entries, hits, misses, threshold}
+        """
+        with self._lock:
+            self._refresh()
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "threshold": self.threshold
+            }
+
+    def _load(self):
+        """
+        从缓存文件加载全部条目（Embedding 模型不一致或文件损坏时清空，需持有锁）
+        """
+        self.entries.clear()
+        self.vectors.clear()
+        self.groups.clear()
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data["meta"]))
+                keys = [str(key) for key in data["keys"]]
+                vectors = data["vectors"]
+                entries = [json.loads(str(value)) for value in data["entries"]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"警告: 答案缓存文件损坏，已忽略: {e}")
+            return
+
+        if meta.get("model_key") != self.model_key:
+            return
+        for key, vector, entry in zip(keys, vectors, entries):
+            self._add(key, entry, vector)
+
+    def _save(self):
+        """
+        把全部条目原子地写入缓存文件（需持有锁）
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        keys = list(self.entries.keys())
+        vectors = np.stack([self.vectors[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            meta=np.array(json.dumps({"model_key": self.model_key})),
+            keys=np.array(keys, dtype=str),
+            vectors=vectors,
+            entries=np.array([json.dumps(self.entries[key], ensure_ascii=False) for key in keys], dtype=str)
+        )
+        os.replace(tmp_path, self.path)
+        self._file_stat = self._stat_file()
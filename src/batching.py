@@ -0,0 +1,54 @@
+"""
+批次规划 - 决定哪些文本在同一次前向计算中编码
+"""
+
+from typing import List, Sequence
+import numpy as np
+
+
+def plan_groups(texts: List[str], batch_size: int) -> List[np.ndarray]:
+    """
+    按 SentenceTransformer.encode 的方式划分前向批次
+
+    SentenceTransformer 先按文本长度降序排序，再按 batch_size 连续切分。
+    这里使用完全相同的排序，使多进程下每个批次的成员（以及填充长度）
+    与单进程完全一致，从而得到一致的向量。
+
+    Args:
+        texts: 文本列表
+        batch_size: 批大小
+
+    Returns:
+        每个批次在原列表中的下标数组
+    """
+    order = np.argsort([-len(text) for text in texts])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def plan_token_batches(lengths: Sequence[int], token_budget: int, max_batch_size: int) -> List[np.ndarray]:
+    """
+    按 token 长度分桶并按 token 预算组批
+
+    先按 token 数降序排序，使长度相近的文本落在同一批，再贪心地把文本加入当前批，
+    直到 "批大小 × 批内最长序列" 超过预算。这样每批的填充量很小，
+    短文本可以组成更大的批，长文本则组成较小的批。
+
+    Args:
+        lengths: 每个文本的 token 数（含特殊 token，已按模型最大长度截断）
+        token_budget: 每批的 token 上限（批大小 × 最长序列）
+        max_batch_size: 每批最多的文本数
+
+    Returns:
+        每个批次在原列表中的下标数组（按批内最长序列降序）
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(-lengths, kind="stable")
+
+    groups = []
+    start = 0
+    while start < len(order):
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(1, min(max_batch_size, token_budget // longest))
+        groups.append(order[start:start + size])
+        start += size
+    return groups
@@ -2,17 +2,137 @@
 CLI 命令处理模块
 """
 
+import sys
+import json
+import contextlib
+import time
+import socket
 from pathlib import Path
-from rich.console import Console
+from rich.console import Console, Group
+from rich.live import Live
+from rich.markup import escape
 from rich.panel import Panel
 from rich.table import Table
-from src.qa_engine import get_qa_engine
-from config import TOP_K, OPENAI_MODEL
+from rich.text import Text
+from src.daemon import get_engine
+from config import TOP_K, OPENAI_MODEL, OPENAI_STREAM, QUERY_BATCH_SIZE
 
 
 console = Console()
 
 
+def _index_params_from_args(args):
+    """
+    从命令行参数构造向量索引配置（未指定任何索引参数时返回 None，沿用已有索引）
+    """
+    quantization = getattr(args, "quantization", None)
+    if not any(getattr(args, name, None) for name in ("index_type", "nlist", "hnsw_m", "ef_construction")):
+        # 只指定量化方式时沿用已有的索引类型
+        return {"quantization": quantization} if quantization else None
+    
+    from src.vector_store import make_index_params
+    overrides = {
+        "index_type": args.index_type,
+        "nlist": args.nlist,
+        "hnsw_m": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+    }
+    return make_index_params(
+        **{key: value for key, value in overrides.items() if value},
+        quantization=quantization
+    )
+
+
+def _search_params_from_args(args):
+    """
+    从命令行参数构造查询参数覆盖值（未指定时返回 None，使用 config 默认值）
+    """
+    params = {
+        name: getattr(args, name)
+        for name in ("nprobe", "ef")
+        if getattr(args, name, None)
+    }
+    return params or None
+
+
+def _hybrid_from_args(args):
+    """
+    从命令行参数确定是否使用混合检索（未指定 --no-hybrid 时返回 None，使用 config 默认值）
+    """
+    return False if getattr(args, "no_hybrid", False) else None
+
+
+def _format_ranks(result) -> str:
+    """
+    格式化混合检索结果在两路检索中的名次，如 " | 向量 #2 · 关键词 #1"
+    """
+    if "rrf_score" not in result:
+        return ""
+    ranks = [
+        f"{name} #{result[key]}"
+        for name, key in (("向量", "vector_rank"), ("关键词", "lexical_rank"))
+        if result.get(key)
+    ]
+    return " | " + " · ".join(ranks)
+
+
+def _format_duplicates(result) -> str:
+    """
+    格式化同一文本块的其他重复位置，如 " | 另有 2 处重复: a.md、b.md"
+    """
+    duplicates = result.get("duplicates")
+    if not duplicates:
+        return ""
+    names = list(dict.fromkeys(item["source_file"] for item in duplicates))
+    shown = "、".join(names[:3]) + (" 等" if len(names) > 3 else "")
+    return f" | 另有 {len(duplicates)} 处重复: {shown}"
+
+
+def _format_timings(timings, rerank_info=None) -> str:
+    """
+    格式化问答各阶段耗时，如 "耗时: 检索 0.05s | 重排序 0.31s (20 候选) | 生成 2.10s | 总计 2.46s"
+    """
+    parts = [f"检索 {timings['retrieve']:.2f}s"]
+    if "rerank" in timings:
+        note = f"{rerank_info['scored']}/{rerank_info['candidates']} 候选"
+        if rerank_info["timed_out"]:
+            note += "，超时，其余候选保持检索顺序"
+        parts.append(f"重排序 {timings['rerank']:.2f}s ({note})")
+    if "compress" in timings:
+        parts.append(f"句子抽取 {timings['compress']:.2f}s")
+    if "generate" in timings:
+        parts.append(f"生成 {timings['generate']:.2f}s")
+    parts.append(f"总计 {timings['total']:.2f}s")
+    return "耗时: " + " | ".join(parts)
+
+
+def _format_packing(packing) -> str:
+    """
+    格式化上下文打包信息，如 "上下文: 5 块 → 3 段 | 1180 tokens（节省 220，去掉重叠 96 字，超出预算跳过 1 块）"
+    """
+    notes = [f"节省 {packing['saved_tokens']}"]
+    if packing["overlap_chars"]:
+        notes.append(f"去掉重叠 {packing['overlap_chars']} 字")
+    if packing["dropped_chunks"]:
+        notes.append(f"超出预算跳过 {packing['dropped_chunks']} 块")
+    if packing["truncated"]:
+        notes.append("已按预算截断")
+    return (
+        f"上下文: {packing['chunks']} 块 → {packing['passages']} 段 | "
+        f"{packing['packed_tokens']} tokens（{'，'.join(notes)}）"
+    )
+
+
+def _format_compression(compression) -> str:
+    """
+    格式化句子抽取信息，如 "句子抽取: 保留 12/40 句 | 1800 → 620 字（34%）"
+    """
+    return (
+        f"句子抽取: 保留 {compression['kept_sentences']}/{compression['sentences']} 句 | "
+        f"{compression['chars_before']} → {compression['chars_after']} 字（{compression['ratio']:.0%}）"
+    )
+
+
 def cmd_index(args):
     """
     建立索引命令
@@ -28,26 +148,103 @@ def cmd_index(args):
         title="📚 MD 知识库"
     ))
     
-    qa_engine = get_qa_engine()
-    result = qa_engine.build_index(docs_dir, recreate=True)
+    incremental = not getattr(args, "full", False)
+    
+    qa_engine = get_engine(use_daemon=not getattr(args, "no_daemon", False))
+    result = qa_engine.build_index(
+        docs_dir,
+        recreate=True,
+        incremental=incremental,
+        workers=getattr(args, "workers", None),
+        index_params=_index_params_from_args(args)
+    )
     
     if result["success"]:
-        console.print(Panel.fit(
+        summary = (
             f"[green]索引建立成功![/green]\n"
             f"文件数: {result['total_files']}\n"
-            f"文本块: {result['total_chunks']}\n"
-            f"向量维度: {result['vector_dimension']}",
-            title="✅ 完成"
-        ))
+        )
+        if result.get("incremental"):
+            summary += (
+                f"新增/修改/删除文件: {result['added_files']}/"
+                f"{result['changed_files']}/{result['removed_files']}\n"
+                f"新增文本块: {result['total_chunks']}\n"
+                f"删除文本块: {result['deleted_chunks']}\n"
+            )
+        else:
+            summary += f"文本块: {result['total_chunks']}\n"
+        if result.get("duplicate_chunks"):
+            summary += f"近重复文本块: {result['duplicate_chunks']}（已合并，未重复向量化）\n"
+        summary += f"向量维度: {result['vector_dimension'] or '-'}"
+        if result.get("index"):
+            summary += f"\n向量索引: {_format_index(result['index'])}"
+        console.print(Panel.fit(summary, title="✅ 完成"))
     else:
         console.print(f"[red]索引建立失败: {result.get('message', '未知错误')}[/red]")
 
 
+def cmd_watch(args):
+    """
+    监视目录命令：先增量索引一次，之后合并文件变化，只重新处理变化的文件
+    """
+    from src.watcher import DirectoryWatcher
+    
+    docs_dir = args.docs_dir
+    if not Path(docs_dir).exists():
+        console.print(f"[red]错误: 目录不存在: {docs_dir}[/red]")
+        return
+    
+    console.print(Panel.fit(
+        f"[bold blue]监视文档目录[/bold blue]\n目录: {docs_dir}\n"
+        f"轮询间隔 {args.interval}s，变化合并窗口 {args.debounce}s\n"
+        f"按 [bold]Ctrl+C[/bold] 退出",
+        title="👀 监视模式"
+    ))
+    
+    qa_engine = get_engine(use_daemon=not getattr(args, "no_daemon", False))
+    # 先记录快照再做首次索引，索引期间发生的变化会在下一轮处理；
+    # 单进程编码，模型在各次更新之间保持加载
+    watcher = DirectoryWatcher(docs_dir, args.interval, args.debounce)
+    result = qa_engine.build_index(docs_dir, recreate=True, incremental=True, workers=1)
+    if not result["success"]:
+        console.print(f"[yellow]首次索引未完成: {result.get('message', '未知错误')}[/yellow]")
+    
+    try:
+        while True:
+            paths = watcher.wait_for_changes()
+            console.print(f"\n[cyan]{time.strftime('%H:%M:%S')} 检测到 {len(paths)} 个文件变化[/cyan]")
+            result = qa_engine.build_index(
+                docs_dir,
+                recreate=True,
+                incremental=True,
+                workers=1,
+                paths=sorted(paths)
+            )
+            if result["success"]:
+                console.print(
+                    f"[green]已更新: 新增/修改/删除文件 {result['added_files']}/{result['changed_files']}/"
+                    f"{result['removed_files']}，写入 {result['total_chunks']} 个、删除 {result['deleted_chunks']} 个文本块[/green]"
+                )
+                if result.get("unreadable_files"):
+                    console.print(f"[yellow]{len(result['unreadable_files'])} 个文件读取失败，稍后重试[/yellow]")
+                    watcher.requeue(result["unreadable_files"])
+            else:
+                # 快照已经前移，放回这批文件，否则它们要等到下次被修改才会更新
+                console.print(f"[red]更新失败: {result.get('message', '未知错误')}，稍后重试[/red]")
+                watcher.requeue(paths)
+    except KeyboardInterrupt:
+        console.print("\n[green]已停止监视[/green]")
+
+
 def cmd_query(args):
     """
     问答查询命令
     """
-    qa_engine = get_qa_engine()
+    qa_engine = get_engine(use_daemon=not getattr(args, "no_daemon", False))
+    
+    if getattr(args, "batch_file", None):
+        _run_batch_query(qa_engine, args)
+        return
     
     # 检查索引是否存在
     stats = qa_engine.get_stats()
@@ -64,6 +261,7 @@ def cmd_query(args):
     ))
     
     top_k = args.top_k if hasattr(args, 'top_k') else TOP_K
+    search_params = _search_params_from_args(args)
     
     while True:
         try:
@@ -78,7 +276,12 @@ def cmd_query(args):
                 break
             
             # 执行查询
-            results = qa_engine.query(question, top_k=top_k)
+            results = qa_engine.query(
+                question,
+                top_k=top_k,
+                search_params=search_params,
+                hybrid=_hybrid_from_args(args)
+            )
             
             if not results:
                 console.print("[yellow]未找到相关结果[/yellow]")
@@ -97,8 +300,8 @@ def cmd_query(args):
                     text = text[:300] + "..."
                 
                 # 使用 Panel 显示结果
-                panel_content = f"[dim]相似度: {score:.2f}[/dim]\n"
-                panel_content += f"[dim]来源: {source}[/dim]\n\n"
+                panel_content = f"[dim]相似度: {score:.2f}{_format_ranks(result)}[/dim]\n"
+                panel_content += f"[dim]来源: {source}{_format_duplicates(result)}[/dim]\n\n"
                 panel_content += text
                 
                 console.print(Panel(
@@ -114,11 +317,117 @@ def cmd_query(args):
             console.print(f"[red]查询出错: {e}[/red]")
 
 
+def _load_batch_questions(batch_file: str) -> list:
+    """
+    读取批量问题文件
+    
+    每行一个问题；以 { 开头的行按 JSON 解析，问题取 "question" 字段，
+    其余字段原样带到输出中（便于评测时携带问题 ID、标准答案等）。
+    
+    Args:
+        batch_file: 问题文件路径
+        
+    Returns:
+        记录列表 [{question, ...}]
+    """
+    records = []
+    with open(batch_file, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                if not record.get("question"):
+                    raise ValueError(f"第 {line_no} 行缺少 question 字段")
+            else:
+                record = {"question": line}
+            records.append(record)
+    return records
+
+
+def _run_batch_query(qa_engine, args):
+    """
+    批量查询模式：从文件读取问题，按批检索并把结果以 JSONL 写出
+    """
+    # 模型加载等库内提示直接 print 到标准输出，会混入 JSONL 结果：
+    # 期间把标准输出重定向到标准错误，结果通过保存的句柄写出
+    stdout = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        _write_batch_results(qa_engine, args, stdout)
+
+
+def _write_batch_results(qa_engine, args, stdout):
+    """
+    执行批量查询并写出结果
+    
+    Args:
+        qa_engine: 问答引擎
+        args: 命令行参数
+        stdout: 未重定向的标准输出（未指定 --output 时写入这里）
+    """
+    # 结果可能写到标准输出，提示信息一律输出到标准错误
+    err_console = Console(stderr=True)
+    top_k = args.top_k if hasattr(args, 'top_k') else TOP_K
+    
+    if not Path(args.batch_file).exists():
+        err_console.print(f"[red]错误: 文件不存在: {args.batch_file}[/red]")
+        return
+    
+    stats = qa_engine.get_stats()
+    if not stats.get("exists") or stats.get("count", 0) == 0:
+        err_console.print("[yellow]警告: 索引为空，请先运行 index 命令建立索引[/yellow]")
+        return
+    
+    try:
+        records = _load_batch_questions(args.batch_file)
+    except ValueError as e:
+        err_console.print(f"[red]错误: 问题文件格式不正确: {e}[/red]")
+        return
+    
+    output = open(args.output, "w", encoding="utf-8") if args.output else stdout
+    start = time.perf_counter()
+    try:
+        for i in range(0, len(records), QUERY_BATCH_SIZE):
+            batch = records[i:i + QUERY_BATCH_SIZE]
+            results = qa_engine.query_batch(
+                [record["question"] for record in batch],
+                top_k=top_k,
+                search_params=_search_params_from_args(args),
+                hybrid=_hybrid_from_args(args)
+            )
+            for record, hits in zip(batch, results):
+                output.write(json.dumps({**record, "results": hits}, ensure_ascii=False) + "\n")
+            output.flush()
+            err_console.print(f"已完成 {min(i + QUERY_BATCH_SIZE, len(records))}/{len(records)} 个问题")
+    finally:
+        if output is not stdout:
+            output.close()
+    
+    elapsed = time.perf_counter() - start
+    rate = len(records) / elapsed if elapsed > 0 else 0.0
+    err_console.print(
+        f"[green]批量查询完成: {len(records)} 个问题，耗时 {elapsed:.2f}s ({rate:.1f} 问/秒)[/green]"
+        + (f"，结果已写入 {args.output}" if args.output else "")
+    )
+
+
+def _format_index(index_info) -> str:
+    """
+    格式化向量索引信息，如 "HNSW (M=16, efConstruction=200)"
+    """
+    params = ", ".join(f"{key}={value}" for key, value in index_info["params"].items())
+    text = index_info["index_type"] + (f" ({params})" if params else "")
+    if index_info.get("quantization", "none") != "none":
+        text += f" + {index_info['quantization']}"
+    return text
+
+
 def cmd_stats(args):
     """
     显示统计信息命令
     """
-    qa_engine = get_qa_engine()
+    qa_engine = get_engine(use_daemon=not getattr(args, "no_daemon", False))
     stats = qa_engine.get_stats()
     
     table = Table(title="📊 知识库统计")
@@ -128,14 +437,127 @@ def cmd_stats(args):
     table.add_row("索引状态", "✅ 已建立" if stats.get("exists") else "❌ 未建立")
     table.add_row("文档块数量", str(stats.get("count", 0)))
     
+    table.add_row("向量存储", stats.get("vector_store", "milvus"))
+    index_info = stats.get("index")
+    if index_info:
+        table.add_row("向量索引", _format_index(index_info))
+        table.add_row(
+            "索引构建耗时",
+            f"{index_info['build_seconds']:.2f}s（{index_info['built_at']}，{index_info['rows']} 行）"
+        )
+        if index_info.get("compression_ratio"):
+            recall = index_info["recall"]
+            table.add_row("量化压缩比", f"{index_info['compression_ratio']}x（{index_info['quantization']}）")
+            table.add_row(
+                f"量化 recall@{recall['k']}",
+                f"压缩检索 {recall['compressed']:.3f} / 精排后 {recall['reranked']:.3f}（{recall['queries']} 个采样查询）"
+            )
+    table.add_row("运行方式", f"常驻服务 ({stats['daemon']})" if stats.get("daemon") else "进程内")
+    
+    backend = stats["embedding"]
+    backend_desc = backend["backend"] + (" (int8)" if backend["quantized"] else "")
+    table.add_row("Embedding 后端", backend_desc)
+    if backend["agreement"]:
+        table.add_row(
+            "与 torch 余弦一致性",
+            f"平均 {backend['agreement']['mean']:.4f} / 最低 {backend['agreement']['min']:.4f}"
+        )
+    
+    lexical = stats.get("lexical")
+    if lexical and lexical["docs"]:
+        table.add_row(
+            "关键词索引",
+            f"{lexical['docs']} 块 | {lexical['terms']} 词 | {lexical['postings']} 条倒排记录 | "
+            f"{lexical['size_bytes'] / 1024 / 1024:.1f} MB"
+        )
+    
+    dedup = stats.get("dedup")
+    if dedup and dedup["groups"]:
+        table.add_row("近重复去重", f"{dedup['duplicates']} 个重复位置合并到 {dedup['groups']} 个代表块")
+    
+    query_cache = stats.get("query_cache")
+    if query_cache:
+        table.add_row("索引代数", str(query_cache["generation"]))
+        table.add_row(
+            "查询缓存（向量）",
+            f"{query_cache['vector_entries']} 条 | 命中 {query_cache['vector_hits']} / "
+            f"未命中 {query_cache['vector_misses']}"
+        )
+        table.add_row(
+            "查询缓存（结果）",
+            f"{query_cache['result_entries']} 条 | 命中 {query_cache['result_hits']} / "
+            f"未命中 {query_cache['result_misses']}"
+        )
+    
+    answer_cache = stats.get("answer_cache")
+    if answer_cache:
+        table.add_row(
+            "答案缓存",
+            f"{answer_cache['entries']} 条 | 命中 {answer_cache['hits']} / 未命中 {answer_cache['misses']} | "
+            f"相似度阈值 {answer_cache['threshold']}"
+        )
+    
     console.print(table)
 
 
+def cmd_serve(args):
+    """
+    启动常驻服务命令
+    """
+    from src.daemon import serve
+    
+    if not hasattr(socket, "AF_UNIX"):
+        console.print("[red]错误: 当前平台不支持 Unix 域套接字[/red]")
+        return
+    
+    serve(args.socket)
+
+
+def _stream_answer(qa_engine, question: str, ask_args: dict) -> dict:
+    """
+    流式问答：等待检索和首个 token 时显示进度，之后在面板中逐步显示思考过程和回答
+    
+    Returns:
+        与 ask_with_ai 相同的结果字典
+    """
+    events = qa_engine.ask_with_ai_stream(question, **ask_args)
+    with console.status("[bold green]正在检索知识库...", spinner="dots") as status:
+        event = next(events)
+        if event["type"] == "contexts":
+            status.update("[bold green]等待 AI 回答...")
+            event = next(events)
+    if event["type"] == "done":
+        return event["result"]
+    
+    console.print("\n[bold green]🤖 AI 回答：[/bold green]\n")
+    reasoning = Text(style="dim")
+    answer = Text()
+    
+    def render():
+        panels = []
+        if reasoning:
+            panels.append(Panel(reasoning, title="思考过程", border_style="dim", expand=False))
+        if answer:
+            panels.append(Panel(answer, title="答案", border_style="green", expand=False))
+        return Group(*panels)
+    
+    # 文本对象原地追加，Live 按固定频率重绘；只有新出现一个面板时才替换内容
+    with Live(render(), console=console, refresh_per_second=12, vertical_overflow="visible") as live:
+        while event["type"] != "done":
+            target = reasoning if event["type"] == "reasoning" else answer
+            is_new_panel = not target
+            target.append(event["text"])
+            if is_new_panel:
+                live.update(render())
+            event = next(events)
+    return event["result"]
+
+
 def cmd_ask(args):
     """
     AI 问答命令（RAG）
     """
-    qa_engine = get_qa_engine()
+    qa_engine = get_engine(use_daemon=not getattr(args, "no_daemon", False))
     
     # 检查索引是否存在
     stats = qa_engine.get_stats()
@@ -149,6 +571,7 @@ def cmd_ask(args):
     api_key = args.api_key if hasattr(args, 'api_key') and args.api_key else None
     model = args.model if hasattr(args, 'model') and args.model else None
     top_k = args.top_k if hasattr(args, 'top_k') else TOP_K
+    stream = OPENAI_STREAM and not getattr(args, "no_stream", False)
     
     # 显示配置信息
     config_info = f"[bold blue]AI 问答模式[/bold blue]\n"
@@ -173,15 +596,23 @@ def cmd_ask(args):
                 console.print("[green]再见！[/green]")
                 break
             
-            # 显示检索进度
-            with console.status("[bold green]正在检索知识库...", spinner="dots"):
-                result = qa_engine.ask_with_ai(
-                    question,
-                    top_k=top_k,
-                    base_url=base_url,
-                    api_key=api_key,
-                    model=model
-                )
+            ask_args = dict(
+                top_k=top_k,
+                base_url=base_url,
+                api_key=api_key,
+                model=model,
+                search_params=_search_params_from_args(args),
+                hybrid=_hybrid_from_args(args),
+                rerank=getattr(args, "rerank", None),
+                answer_cache=getattr(args, "answer_cache", None),
+                compress=getattr(args, "compress", None)
+            )
+            if stream:
+                result = _stream_answer(qa_engine, question, ask_args)
+            else:
+                # 显示检索进度
+                with console.status("[bold green]正在检索知识库...", spinner="dots"):
+                    result = qa_engine.ask_with_ai(question, **ask_args)
             
             if not result.get("success"):
                 console.print(f"[red]错误: {result.get('error', '未知错误')}[/red]")
@@ -192,24 +623,44 @@ def cmd_ask(args):
                     console.print("3. 或者使用 --api-key 参数传入")
                 continue
             
-            # 显示 AI 回答
-            console.print("\n[bold green]🤖 AI 回答：[/bold green]\n")
-            console.print(Panel(
-                result["answer"],
-                title="答案",
-                border_style="green",
-                expand=False,
-                width=None  # 不限制宽度
-            ))
+            # 显示 AI 回答（流式模式下已边生成边显示）
+            if not stream:
+                console.print("\n[bold green]🤖 AI 回答：[/bold green]\n")
+                console.print(Panel(
+                    result["answer"],
+                    title="答案",
+                    border_style="green",
+                    expand=False,
+                    width=None  # 不限制宽度
+                ))
             
-            # 显示使用的 token
-            if "usage" in result:
+            # 显示答案来源或使用的 token 与首字延迟
+            ttft = (result.get("timings") or {}).get("ttft")
+            ttft_text = f"首字延迟 {ttft:.2f}s" if ttft is not None else ""
+            if result.get("cached"):
+                cached = result["cached"]
+                console.print(
+                    f"\n[yellow]⚡ 答案来自缓存[/yellow] [dim](问题相似度 {cached['similarity']:.3f} | "
+                    f"原问题: {escape(cached['question'])} | 加 --no-answer-cache 重新生成)[/dim]"
+                )
+            elif result.get("usage"):
                 usage = result["usage"]
                 console.print(
                     f"\n[dim]Token 使用: 输入 {usage['prompt_tokens']} | "
                     f"输出 {usage['completion_tokens']} | "
-                    f"总计 {usage['total_tokens']}[/dim]"
+                    f"总计 {usage['total_tokens']}"
+                    f"{' | ' + ttft_text if ttft_text else ''}[/dim]"
                 )
+            elif ttft_text:
+                console.print(f"\n[dim]{ttft_text}[/dim]")
+            
+            # 显示上下文打包、句子抽取效果与各阶段耗时
+            if result.get("packing"):
+                console.print(f"[dim]{_format_packing(result['packing'])}[/dim]")
+            if result.get("compression"):
+                console.print(f"[dim]{_format_compression(result['compression'])}[/dim]")
+            if result.get("timings"):
+                console.print(f"[dim]{_format_timings(result['timings'], result.get('rerank'))}[/dim]")
             
             # 显示参考文档
             console.print(f"\n[bold blue]📚 参考文档 ({result.get('context_count', 0)} 个)：[/bold blue]")
@@ -223,7 +674,7 @@ def cmd_ask(args):
                     text = text[:150] + "..."
                 
                 console.print(
-                    f"\n[cyan][{i}][/cyan] [dim]相似度: {score:.2f} | 来源: {source}[/dim]\n"
+                    f"\n[cyan][{i}][/cyan] [dim]相似度: {score:.2f}{_format_ranks(ctx)} | 来源: {source}{_format_duplicates(ctx)}[/dim]\n"
                     f"    {text}"
                 )
         
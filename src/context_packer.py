@@ -0,0 +1,238 @@
+"""
+上下文打包 - 合并相邻分块、去掉分块重叠，并在 token 预算内挑选交给大模型的参考资料
+"""
+
+from typing import List, Dict, Tuple, Optional
+from config import CHUNK_MODE, CHUNK_OVERLAP, CONTEXT_TOKEN_BUDGET, CONTEXT_TOKENIZER
+
+
+# 相邻分块至少重合这么多字符才视为重叠（避免把偶然相同的标点当作重叠）
+MIN_OVERLAP_CHARS = 8
+
+# 相邻分块最多重合的字符数（按 token 分块时重叠的字符数不固定，不设上限）
+MAX_OVERLAP_CHARS = CHUNK_OVERLAP if CHUNK_MODE == "chars" else None
+
+
+def find_overlap(left: str, right: str, max_overlap: Optional[int] = MAX_OVERLAP_CHARS) -> int:
+    """
+    计算 left 的结尾与 right 的开头重合的字符数
+
+    按字符分块时相邻分块共享 CHUNK_OVERLAP 个字符（去掉首尾空白后可能略短），
+    因此只在这个范围内查找最长的重合；按 token 分块时在整个分块范围内查找。
+
+    Args:
+        left: 前一个分块
+        right: 后一个分块
+        max_overlap: 最大重叠字符数（None 表示不限制）
+
+    Returns:
+        重合的字符数，没有重叠时为 0
+    """
+    limit = min(len(left), len(right))
+    if max_overlap is not None:
+        limit = min(limit, max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class TokenCounter:
+    """
+    批量计算 token 数（不截断、不含特殊 token）
+
+    默认使用 Embedding 模型的分词器（已随模型加载，不需要额外下载）；
+    配置 CONTEXT_TOKENIZER 后使用大模型自己的分词器，计数更准确。
+    """
+
+    def __init__(self, tokenizer_name: str = CONTEXT_TOKENIZER):
+        """
+        初始化计数器
+
+        Args:
+            tokenizer_name: Hugging Face 分词器名称或路径（空字符串表示使用 Embedding 模型的分词器）
+        """
+        self.tokenizer_name = tokenizer_name
+        self.tokenizer = None
+
+    def get_tokenizer(self):
+        """
+        获取分词器（延迟加载）
+        """
+        if self.tokenizer is None:
+            if self.tokenizer_name:
+                from transformers import AutoTokenizer
+                try:
+                    self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name, local_files_only=True)
+                except Exception:
+                    self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+            else:
+                from src.embedder import get_embedder
+                embedder = get_embedder()
+                # 常驻服务中打包与其他请求的编码并发进行，使用不截断的独立副本
+                self.tokenizer = embedder.copy_tokenizer() or embedder.get_tokenizer()
+        return self.tokenizer
+
+    def count(self, texts: List[str]) -> List[int]:
+        """
+        批量计算 token 数
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            token 数列表
+        """
+        if not texts:
+            return []
+        tokenizer = self.get_tokenizer()
+        if hasattr(tokenizer, "encode_batch"):
+            return [len(encoding.ids) for encoding in tokenizer.encode_batch(texts, add_special_tokens=False)]
+        input_ids = tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+        return [len(ids) for ids in input_ids]
+
+
+class ContextPacker:
+    """
+    上下文打包器
+
+    1. 同一文件中 chunk_index 连续的检索结果合并为一段，去掉相邻分块之间的重叠文本
+    2. 按检索顺序（相关度从高到低）逐块放入，超出 token 预算的分块跳过；
+       最相关的一块本身就超出预算时截断它
+    3. 每段按其中最相关分块的名次排序，段内按原文顺序排列
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, counter: Optional[TokenCounter] = None):
+        """
+        初始化打包器
+
+        Args:
+            token_budget: 参考资料的 token 上限（0 表示不限制）
+            counter: token 计数器（默认按 CONTEXT_TOKENIZER 创建）
+        """
+        self.token_budget = token_budget
+        self.counter = counter or TokenCounter()
+
+    def pack(self, hits: List[Dict], token_budget: Optional[int] = None) -> Tuple[List[str], Dict]:
+        """
+        打包检索结果
+
+        Args:
+            hits: 按相关度排列的检索结果（需含 id、text、file_path、chunk_index）
+            token_budget: 本次的 token 上限（None 表示使用初始化时的值）
+
+        Returns:
+            (参考资料文本列表, 打包信息 {chunks, passages, raw_tokens, packed_tokens, saved_tokens,
+             overlap_chars, dropped_chunks, truncated, budget})
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+
+        # 去掉重复的分块，按 (文件, 序号) 定位相邻分块
+        unique, seen = [], set()
+        for hit in hits:
+            key = (hit.get("file_path", ""), hit.get("chunk_index", 0))
+            if key not in seen:
+                seen.add(key)
+                unique.append(hit)
+        position = {(hit.get("file_path", ""), hit.get("chunk_index", 0)): i for i, hit in enumerate(unique)}
+
+        # 与前一个分块（若也被检索到）的重叠
+        overlaps = []
+        for hit in unique:
+            previous = position.get((hit.get("file_path", ""), hit.get("chunk_index", 0) - 1))
+            overlaps.append(find_overlap(unique[previous]["text"], hit["text"]) if previous is not None else 0)
+
+        # 一次批量计数：完整文本，以及去掉前缀重叠后的文本
+        texts = [hit["text"] for hit in unique]
+        counts = self.counter.count(texts + [text[size:] for text, size in zip(texts, overlaps)])
+        full_tokens, trimmed_tokens = counts[:len(texts)], counts[len(texts):]
+        raw_tokens = sum(full_tokens[position[(hit.get("file_path", ""), hit.get("chunk_index", 0))]] for hit in hits)
+
+        # 按相关度贪心放入：分块的代价取决于前一个分块是否已被选中
+        selected, used, truncated, dropped = {}, 0, False, 0
+        for i, hit in enumerate(unique):
+            previous = position.get((hit.get("file_path", ""), hit.get("chunk_index", 0) - 1))
+            cost = trimmed_tokens[i] if previous in selected else full_tokens[i]
+            following = position.get((hit.get("file_path", ""), hit.get("chunk_index", 0) + 1))
+            if following in selected:
+                # 后一个分块已按完整文本计入，现在它与本块的重叠不再需要
+                cost -= full_tokens[following] - trimmed_tokens[following]
+            if budget and used + cost > budget:
+                if selected:
+                    dropped += 1
+                    continue
+                selected[i] = self._truncate(hit["text"], budget)
+                truncated = True
+                dropped += len(unique) - i - 1
+                break
+            selected[i] = hit["text"]
+            used += cost
+
+        passages, overlap_chars = self._merge(unique, selected, position, overlaps)
+        packed_tokens = sum(self.counter.count(passages))
+        return passages, {
+            "chunks": len(hits),
+            "passages": len(passages),
+            "raw_tokens": raw_tokens,
+            "packed_tokens": packed_tokens,
+            "saved_tokens": raw_tokens - packed_tokens,
+            "overlap_chars": overlap_chars,
+            "dropped_chunks": dropped,
+            "truncated": truncated,
+            "budget": budget
+        }
+
+    @staticmethod
+    def _merge(unique: List[Dict], selected: Dict[int, str], position: Dict, overlaps: List[int]) -> Tuple[List[str], int]:
+        """
+        把选中的分块按文件和序号连成段落
+
+        Returns:
+            (段落列表, 去掉的重叠字符数)
+        """
+        runs = []
+        for i in sorted(selected, key=lambda i: (unique[i].get("file_path", ""), unique[i].get("chunk_index", 0))):
+            previous = position.get((unique[i].get("file_path", ""), unique[i].get("chunk_index", 0) - 1))
+            if runs and previous == runs[-1][-1]:
+                runs[-1].append(i)
+            else:
+                runs.append([i])
+        # 段落按其中最相关分块的名次排序
+        runs.sort(key=min)
+
+        passages, overlap_chars = [], 0
+        for run in runs:
+            text = selected[run[0]]
+            for i in run[1:]:
+                size = overlaps[i]
+                overlap_chars += size
+                text += selected[i][size:] if size else "\n" + selected[i]
+            passages.append(text)
+        return passages, overlap_chars
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """
+        按 token 预算截断文本（按比例估计截断位置，再逐步缩短直到不超出预算）
+        """
+        tokens = self.counter.count([text])[0]
+        while tokens > budget and text:
+            text = text[:max(int(len(text) * budget / tokens * 0.95), 0)]
+            tokens = self.counter.count([text])[0]
+        return text
+
+
+# 全局单例
+_context_packer_instance = None
+
+
+def get_context_packer() -> ContextPacker:
+    """
+    获取全局 ContextPacker 实例
+
+    Returns:
+        ContextPacker 实例
+    """
+    global _context_packer_instance
+    if _context_packer_instance is None:
+        _context_packer_instance = ContextPacker()
+    return _context_packer_instance
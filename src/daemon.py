@@ -0,0 +1,517 @@
+"""
+常驻服务 - 通过 Unix 域套接字提供 query / query_batch / ask / ask_stream / stats / index，保持模型与数据库常驻
+"""
+
+import os
+import json
+import socket
+import struct
+import threading
+import socketserver
+from typing import Dict, List, Optional, Iterator
+from config import DAEMON_SOCKET_PATH, RERANK_ENABLED
+
+
+# 帧格式：4 字节大端无符号长度 + UTF-8 JSON
+_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+def send_frame(sock: socket.socket, payload: Dict):
+    """
+    发送一帧 JSON 数据
+
+    Args:
+        sock: 套接字
+        payload: 可 JSON 序列化的字典
+    """
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    """
+    读取指定字节数，连接关闭时返回 None
+    """
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Optional[Dict]:
+    """
+    接收一帧 JSON 数据
+
+    Args:
+        sock: 套接字
+
+    Returns:
+        解析后的字典，连接关闭时返回 None
+    """
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"帧过大: {size} 字节")
+    data = _recv_exact(sock, size)
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+class _ReadWriteLock:
+    """
+    读写锁：查询类请求可以并发执行，建索引时独占
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    def acquire(self, write: bool):
+        """
+        获取读锁或写锁
+        """
+        with self._cond:
+            if write:
+                while self._writing or self._readers:
+                    self._cond.wait()
+                self._writing = True
+            else:
+                while self._writing:
+                    self._cond.wait()
+                self._readers += 1
+
+    def release(self, write: bool):
+        """
+        释放读锁或写锁
+        """
+        with self._cond:
+            if write:
+                self._writing = False
+            else:
+                self._readers -= 1
+            self._cond.notify_all()
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """
+    处理单个客户端连接（一个连接上可以连续发送多个请求）
+    """
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (OSError, ValueError):
+                return
+            if request is None:
+                return
+            if request.get("op") in self.server.stream_ops:
+                self.server.dispatch_stream(request, lambda payload: send_frame(self.request, payload))
+            else:
+                send_frame(self.request, self.server.dispatch(request))
+
+
+class DocInspectServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    常驻服务：持有预热好的 QAEngine
+
+    查询、问答和统计请求并发执行，其中编码、检索、重排序和打包由 QAEngine.lock 串行化，
+    只有 LLM 调用真正并发（不阻塞其他请求）；建索引请求独占执行。
+    """
+
+    daemon_threads = True
+    stream_ops = ("ask_stream",)
+
+    def __init__(self, socket_path: str = DAEMON_SOCKET_PATH):
+        """
+        初始化服务并预热问答引擎
+
+        Args:
+            socket_path: Unix 域套接字路径
+        """
+        from src.qa_engine import get_qa_engine
+
+        self.socket_path = socket_path
+        self.engine = get_qa_engine()
+        self.lock = _ReadWriteLock()
+
+        print("正在预热问答引擎...")
+        self.engine.embedder.load_model()
+        self.engine.vector_store.connect()
+        if RERANK_ENABLED:
+            from src.reranker import get_reranker
+            get_reranker().load_model()
+        try:
+            from src.ai_service import get_ai_service
+            self.engine.ai_service = get_ai_service()
+        except ValueError as e:
+            print(f"AI 服务未初始化: {e}")
+
+        directory = os.path.dirname(socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+
+    def dispatch(self, request: Dict) -> Dict:
+        """
+        执行一个请求
+
+        Args:
+            request: {op, args}
+
+        Returns:
+            {ok, result} 或 {ok: False, error}
+        """
+        op = request.get("op")
+        args = request.get("args") or {}
+        handlers = {
+            "ping": lambda: "pong",
+            "query": lambda: self.engine.query(**args),
+            "query_batch": lambda: self.engine.query_batch(**args),
+            "ask": lambda: self.engine.ask_with_ai(**args),
+            "stats": lambda: self.engine.get_stats(),
+            "index": lambda: self.engine.build_index(**args),
+        }
+        if op not in handlers:
+            return {"ok": False, "error": f"未知操作: {op}"}
+
+        write = op == "index"
+        self.lock.acquire(write)
+        try:
+            return {"ok": True, "result": handlers[op]()}
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.lock.release(write)
+
+    def dispatch_stream(self, request: Dict, send):
+        """
+        执行一个流式请求：每个事件发送一帧 {ok, event}，最后一个事件的 type 为 "done"
+
+        Args:
+            request: {op, args}
+            send: 发送一帧的函数
+        """
+        args = request.get("args") or {}
+        self.lock.acquire(False)
+        try:
+            for event in self.engine.ask_with_ai_stream(**args):
+                send({"ok": True, "event": event})
+        except OSError:
+            # 客户端已断开，放弃剩余的输出
+            pass
+        except Exception as e:
+            send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            self.lock.release(False)
+
+    def server_close(self):
+        """
+        关闭服务并删除套接字文件
+        """
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def serve(socket_path: str = DAEMON_SOCKET_PATH):
+    """
+    启动常驻服务（阻塞直到 Ctrl+C）
+
+    Args:
+        socket_path: Unix 域套接字路径
+    """
+    if DaemonClient(socket_path).available():
+        print(f"常驻服务已在运行: {socket_path}")
+        return
+
+    server = DocInspectServer(socket_path)
+    print(f"✅ 常驻服务已启动: {socket_path}（Ctrl+C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止常驻服务...")
+    finally:
+        server.server_close()
+
+
+class DaemonClient:
+    """
+    常驻服务客户端
+    """
+
+    def __init__(self, socket_path: str = DAEMON_SOCKET_PATH):
+        """
+        初始化客户端
+
+        Args:
+            socket_path: Unix 域套接字路径
+        """
+        self.socket_path = socket_path
+        self.sock = None
+
+    def connect(self, timeout: Optional[float] = 0.5):
+        """
+        连接到常驻服务
+
+        Args:
+            timeout: 连接超时（秒），请求阶段不设超时
+        """
+        if self.sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            sock.settimeout(None)
+            self.sock = sock
+        return self.sock
+
+    def available(self) -> bool:
+        """
+        检查常驻服务是否在运行
+
+        Returns:
+            是否可用
+        """
+        if not hasattr(socket, "AF_UNIX") or not os.path.exists(self.socket_path):
+            return False
+        try:
+            return self.call("ping") == "pong"
+        except (OSError, RuntimeError, ValueError):
+            self.close()
+            return False
+
+    def call(self, op: str, **args):
+        """
+        发送请求并等待结果
+
+        Args:
+            op: 操作名称
+            **args: 操作参数
+
+        Returns:
+            操作结果
+        """
+        sock = self.connect()
+        send_frame(sock, {"op": op, "args": args})
+        response = recv_frame(sock)
+        if response is None:
+            self.close()
+            raise ConnectionError("常驻服务连接已断开")
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "未知错误"))
+        return response["result"]
+
+    def stream(self, op: str, **args) -> Iterator[Dict]:
+        """
+        发送流式请求，逐个产出服务端的事件
+
+        Args:
+            op: 操作名称
+            **args: 操作参数
+
+        Yields:
+            事件字典，最后一个的 type 为 "done"
+        """
+        sock = self.connect()
+        send_frame(sock, {"op": op, "args": args})
+        done = False
+        try:
+            while not done:
+                response = recv_frame(sock)
+                if response is None:
+                    raise ConnectionError("常驻服务连接已断开")
+                if not response.get("ok"):
+                    done = True
+                    raise RuntimeError(response.get("error", "未知错误"))
+                event = response["event"]
+                done = event["type"] == "done"
+                yield event
+        finally:
+            # 中途停止读取时连接上还有未读的帧，不能再复用
+            if not done:
+                self.close()
+
+    def close(self):
+        """
+        关闭连接
+        """
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class RemoteEngine:
+    """
+    通过常驻服务执行的问答引擎代理，与 QAEngine 的调用方式相同
+    """
+
+    def __init__(self, client: DaemonClient):
+        """
+        初始化代理
+
+        Args:
+            client: 已连接的常驻服务客户端
+        """
+        self.client = client
+
+    def build_index(
+        self,
+        docs_dir: str,
+        recreate: bool = True,
+        incremental: bool = False,
+        workers: Optional[int] = None,
+        index_params: Optional[Dict] = None,
+        paths: Optional[List[str]] = None
+    ) -> Dict:
+        """
+        在常驻服务中构建索引（参数同 QAEngine.build_index）
+        """
+        # 服务端的工作目录可能不同，传绝对路径
+        return self.client.call(
+            "index",
+            docs_dir=os.path.abspath(docs_dir),
+            recreate=recreate,
+            incremental=incremental,
+            workers=workers,
+            index_params=index_params,
+            paths=[os.path.abspath(path) for path in paths] if paths is not None else None
+        )
+
+    def query(
+        self,
+        question: str,
+        top_k: int,
+        search_params: Optional[Dict] = None,
+        hybrid: Optional[bool] = None
+    ) -> List[Dict]:
+        """
+        在常驻服务中检索（参数同 QAEngine.query）
+        """
+        return self.client.call(
+            "query",
+            question=question,
+            top_k=top_k,
+            search_params=search_params,
+            hybrid=hybrid
+        )
+
+    def query_batch(
+        self,
+        questions: List[str],
+        top_k: int,
+        search_params: Optional[Dict] = None,
+        hybrid: Optional[bool] = None
+    ) -> List[List[Dict]]:
+        """
+        在常驻服务中批量检索（参数同 QAEngine.query_batch）
+        """
+        return self.client.call(
+            "query_batch",
+            questions=questions,
+            top_k=top_k,
+            search_params=search_params,
+            hybrid=hybrid
+        )
+
+    def ask_with_ai(
+        self,
+        question: str,
+        top_k: int,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        search_params: Optional[Dict] = None,
+        hybrid: Optional[bool] = None,
+        rerank: Optional[bool] = None,
+        answer_cache: Optional[bool] = None,
+        compress: Optional[bool] = None
+    ) -> Dict:
+        """
+        在常驻服务中进行 RAG 问答（参数同 QAEngine.ask_with_ai）
+        """
+        return self.client.call(
+            "ask",
+            question=question,
+            top_k=top_k,
+            base_url=base_url,
+            api_key=api_key,
+            model=model,
+            search_params=search_params,
+            hybrid=hybrid,
+            rerank=rerank,
+            answer_cache=answer_cache,
+            compress=compress
+        )
+
+    def ask_with_ai_stream(
+        self,
+        question: str,
+        top_k: int,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        search_params: Optional[Dict] = None,
+        hybrid: Optional[bool] = None,
+        rerank: Optional[bool] = None,
+        answer_cache: Optional[bool] = None,
+        compress: Optional[bool] = None
+    ) -> Iterator[Dict]:
+        """
+        在常驻服务中进行流式 RAG 问答（参数同 QAEngine.ask_with_ai_stream）
+        """
+        return self.client.stream(
+            "ask_stream",
+            question=question,
+            top_k=top_k,
+            base_url=base_url,
+            api_key=api_key,
+            model=model,
+            search_params=search_params,
+            hybrid=hybrid,
+            rerank=rerank,
+            answer_cache=answer_cache,
+            compress=compress
+        )
+
+    def get_stats(self) -> Dict:
+        """
+        获取常驻服务中的索引统计信息
+        """
+        stats = self.client.call("stats")
+        stats["daemon"] = self.client.socket_path
+        return stats
+
+
+def get_engine(use_daemon: bool = True):
+    """
+    获取问答引擎：常驻服务在运行时使用它，否则在当前进程中执行
+
+    Args:
+        use_daemon: 是否尝试使用常驻服务
+
+    Returns:
+        RemoteEngine 或 QAEngine
+    """
+    if use_daemon:
+        client = DaemonClient()
+        if client.available():
+            return RemoteEngine(client)
+
+    from src.qa_engine import get_qa_engine
+    return get_qa_engine()
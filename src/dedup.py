@@ -0,0 +1,378 @@
+"""
+近重复检测 - 用 MinHash 签名与 LSH 分桶把近似相同的文本块归为一组，只向量化每组的代表块
+"""
+
+import os
+import json
+import threading
+from typing import List, Dict, Callable, Optional
+import numpy as np
+from config import (
+    DEDUP_PATH,
+    DEDUP_THRESHOLD,
+    DEDUP_NUM_PERM,
+    DEDUP_BANDS,
+    DEDUP_SHINGLE_SIZE
+)
+
+
+# MinHash 的置换函数 (a * x + b) mod p，p 取 2^31 - 1，乘积不超出 uint64
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+# shingle 多项式滚动哈希的基数与混合常数（uint64 溢出即取模）
+_ROLLING_BASE = np.uint64(0x100000001B3)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class MinHasher:
+    """
+    MinHash 签名：文本去掉多余空白后取字符 shingle，签名中每一位相同的概率等于两段文本 shingle 集合的 Jaccard 相似度
+    """
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, shingle_size: int = DEDUP_SHINGLE_SIZE, seed: int = 1):
+        """
+        初始化
+
+        Args:
+            num_perm: 签名长度（置换函数个数）
+            shingle_size: 字符 shingle 长度
+            seed: 置换函数的随机种子（签名会落盘，必须固定）
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)[:, None]
+        self.b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)[:, None]
+
+    def shingles(self, text: str) -> np.ndarray:
+        """
+        计算文本所有字符 shingle 的 31 位哈希（去重）
+
+        Args:
+            text: 文本
+
+        Returns:
+            uint64 数组
+        """
+        codes = np.frombuffer(" ".join(text.split()).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        size = min(self.shingle_size, len(codes))
+        if size == 0:
+            return np.zeros(1, dtype=np.uint64)
+        count = len(codes) - size + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(size):
+            hashes = hashes * _ROLLING_BASE + codes[offset:offset + count]
+        hashes = (hashes ^ (hashes >> np.uint64(29))) * _MIX
+        return np.unique(hashes >> np.uint64(33))
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        计算文本的 MinHash 签名
+
+        Args:
+            text: 文本
+
+        Returns:
+            (num_perm,) uint32 数组
+        """
+        shingles = self.shingles(text)[None, :]
+        return ((self.a * shingles + self.b) % _MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+
+class DuplicateIndex:
+    """
+    近重复索引（建索引时使用）
+
+    每个代表块保存 MinHash 签名，签名按 DEDUP_BANDS 段分桶：
+    两个文本块只要有一段完全相同就成为候选，再按签名估计的 Jaccard 相似度确认。
+    与已有代表块重复的文本块不分配新 ID、不向量化，在索引清单中直接记为代表块的 ID，
+    因此清单中 文件 -> 分块 ID 列表 就是每个位置到代表块的映射。
+
+    保存时另外记录每个代表块对应的全部位置（只记录有重复、或写入时的位置已经失效的代表块），
+    检索时据此把结果改写为仍然存在的位置，并列出其他重复位置。
+    """
+
+    def __init__(
+        self,
+        path: str = DEDUP_PATH,
+        threshold: float = DEDUP_THRESHOLD,
+        num_perm: int = DEDUP_NUM_PERM,
+        bands: int = DEDUP_BANDS,
+        shingle_size: int = DEDUP_SHINGLE_SIZE
+    ):
+        """
+        初始化
+
+        Args:
+            path: 索引文件路径
+            threshold: 估计的 Jaccard 相似度阈值（达到才视为重复）
+            num_perm: 签名长度
+            bands: LSH 分段数（需整除 num_perm）
+            shingle_size: 字符 shingle 长度
+        """
+        if num_perm % bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) 必须是 DEDUP_BANDS ({bands}) 的整数倍")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.meta = {"num_perm": num_perm, "bands": bands, "shingle_size": shingle_size}
+        self.reset()
+
+    def reset(self):
+        """
+        清空索引（全量重建前调用）
+        """
+        self.signatures: Dict[int, np.ndarray] = {}              # 代表块 ID -> 签名
+        self.origins: Dict[int, tuple] = {}                      # 代表块 ID -> 写入向量存储时的 (file_path, chunk_index)
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self.groups: Dict[int, List[List]] = {}                  # 代表块 ID -> [[file_path, source_file, chunk_index]]
+
+    def load(self) -> bool:
+        """
+        从磁盘加载索引
+
+        Returns:
+            是否加载成功且签名参数与当前配置一致
+        """
+        self.reset()
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data["meta"]))
+                ids = data["ids"].tolist()
+                signatures = data["signatures"]
+                origins = json.loads(str(data["origins"]))
+                groups = json.loads(str(data["groups"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"警告: 去重索引文件损坏，已忽略: {e}")
+            return False
+
+        if meta != self.meta:
+            return False
+        for chunk_id, signature, origin in zip(ids, signatures, origins):
+            self._add(chunk_id, signature, tuple(origin))
+        self.groups = {int(chunk_id): locations for chunk_id, locations in groups.items()}
+        return True
+
+    def save(self):
+        """
+        原子地写入索引文件
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        ids = list(self.signatures)
+        signatures = np.stack([self.signatures[chunk_id] for chunk_id in ids]) if ids else \
+            np.zeros((0, self.hasher.num_perm), dtype=np.uint32)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            meta=np.array(json.dumps(self.meta)),
+            ids=np.array(ids, dtype=np.int64),
+            signatures=signatures,
+            origins=np.array(json.dumps([self.origins[chunk_id] for chunk_id in ids], ensure_ascii=False)),
+            groups=np.array(json.dumps(self.groups, ensure_ascii=False))
+        )
+        os.replace(tmp_path, self.path)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """
+        签名每一段的分桶键
+        """
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _add(self, chunk_id: int, signature: np.ndarray, origin: tuple):
+        """
+        加入一个代表块
+        """
+        self.signatures[chunk_id] = signature
+        self.origins[chunk_id] = origin
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(key, []).append(chunk_id)
+
+    def find(self, signature: np.ndarray) -> Optional[int]:
+        """
+        查找与签名近似相同的代表块
+
+        Args:
+            signature: MinHash 签名
+
+        Returns:
+            估计相似度最高且不低于阈值的代表块 ID，没有时返回 None
+        """
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+
+        best_id, best_similarity = None, self.threshold
+        for chunk_id in candidates:
+            similarity = float(np.mean(self.signatures[chunk_id] == signature))
+            if similarity >= best_similarity:
+                best_id, best_similarity = chunk_id, similarity
+        return best_id
+
+    def assign(self, chunks: List[Dict], allocate_ids: Callable[[int], List[int]]) -> List[Dict]:
+        """
+        为一批文本块分配 ID：近重复的文本块使用已有代表块的 ID，其余分配新 ID 并成为代表块
+
+        Args:
+            chunks: 文本块列表（按原文顺序，写入 id 字段）
+            allocate_ids: 分配新 ID 的函数（IndexManifest.allocate_ids）
+
+        Returns:
+            需要向量化和写入的代表块
+        """
+        representatives = []
+        for chunk in chunks:
+            signature = self.hasher.signature(chunk["chunk_text"])
+            chunk_id = self.find(signature)
+            if chunk_id is None:
+                chunk_id = allocate_ids(1)[0]
+                self._add(chunk_id, signature, (chunk["file_path"], chunk["chunk_index"]))
+                representatives.append(chunk)
+            chunk["id"] = chunk_id
+        return representatives
+
+    def remove(self, chunk_ids: List[int]):
+        """
+        删除不再被任何位置引用的代表块
+
+        Args:
+            chunk_ids: 分块 ID 列表
+        """
+        for chunk_id in chunk_ids:
+            signature = self.signatures.pop(chunk_id, None)
+            if signature is None:
+                continue
+            del self.origins[chunk_id]
+            for bucket, key in zip(self.buckets, self._band_keys(signature)):
+                members = bucket[key]
+                members.remove(chunk_id)
+                if not members:
+                    del bucket[key]
+
+    def update_groups(self, files: Dict[str, Dict]) -> bool:
+        """
+        按索引清单重新计算每个代表块对应的位置
+
+        Args:
+            files: IndexManifest.files（文件路径 -> {hash, chunk_ids}）
+
+        Returns:
+            位置映射是否发生变化
+        """
+        locations: Dict[int, List[List]] = {}
+        for file_path, entry in files.items():
+            source_file = os.path.basename(file_path)
+            for chunk_index, chunk_id in enumerate(entry["chunk_ids"]):
+                locations.setdefault(chunk_id, []).append([file_path, source_file, chunk_index])
+
+        groups = {
+            chunk_id: places
+            for chunk_id, places in locations.items()
+            if len(places) > 1 or (places[0][0], places[0][2]) != self.origins.get(chunk_id)
+        }
+        changed = groups != self.groups
+        self.groups = groups
+        return changed
+
+
+class DuplicateGroups:
+    """
+    近重复位置映射（检索时使用）：把结果改写为仍然存在的位置，并附上其他重复位置
+
+    只读取索引文件中的位置映射（不加载签名）；文件被建索引的进程更新后自动重新加载。
+    """
+
+    def __init__(self, path: str = DEDUP_PATH):
+        """
+        初始化
+
+        Args:
+            path: 去重索引文件路径
+        """
+        self.path = path
+        self.groups: Dict[int, List[List]] = {}
+        self._file_stat = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """
+        索引文件变化时重新加载位置映射（需持有锁）
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.groups, self._file_stat = {}, None
+            return
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self._file_stat:
+            return
+        try:
+            with np.load(self.path) as data:
+                groups = json.loads(str(data["groups"]))
+        except (OSError, ValueError, KeyError):
+            groups = {}
+        self.groups = {int(chunk_id): locations for chunk_id, locations in groups.items()}
+        self._file_stat = stat
+
+    def collapse(self, hits: List[Dict]) -> List[Dict]:
+        """
+        改写检索结果的位置
+
+        写入时的位置仍然存在时保留，否则改为第一个仍然存在的位置；
+        其余位置放在 duplicates 字段 [{file_path, source_file, chunk_index}] 中。
+
+        Args:
+            hits: 检索结果
+
+        Returns:
+            改写后的检索结果（没有重复的结果原样返回）
+        """
+        with self._lock:
+            self._refresh()
+            groups = self.groups
+        if not groups:
+            return hits
+
+        collapsed = []
+        for hit in hits:
+            locations = groups.get(hit["id"])
+            if locations is None:
+                collapsed.append(hit)
+                continue
+            primary = next(
+                (i for i, (file_path, _, chunk_index) in enumerate(locations)
+                 if file_path == hit.get("file_path") and chunk_index == hit.get("chunk_index")),
+                0
+            )
+            file_path, source_file, chunk_index = locations[primary]
+            collapsed.append({
+                **hit,
+                "file_path": file_path,
+                "source_file": source_file,
+                "chunk_index": chunk_index,
+                "duplicates": [
+                    {"file_path": path, "source_file": name, "chunk_index": index}
+                    for i, (path, name, index) in enumerate(locations) if i != primary
+                ]
+            })
+        return collapsed
+
+    def stats(self) -> Dict:
+        """
+        获取统计信息
+
+        Returns:
+            {groups: 有重复的代表块数, duplicates: 合并掉的重复位置数}
+        """
+        with self._lock:
+            self._refresh()
+            groups = [locations for locations in self.groups.values() if len(locations) > 1]
+        return {
+            "groups": len(groups),
+            "duplicates": sum(len(locations) - 1 for locations in groups)
+        }
@@ -0,0 +1,197 @@
+"""
+多进程 Embedding - 在多个 CPU 核心上数据并行编码
+"""
+
+import os
+import multiprocessing
+from typing import List, Union, Optional
+import numpy as np
+from config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_WORKER_THREADS,
+    EMBEDDING_MAX_BATCH_SIZE,
+    ONNX_QUANTIZE
+)
+from src.embedder import Embedder, ENCODE_BATCH_SIZE
+from src.batching import plan_groups, plan_token_batches
+
+
+# 工作进程内的 Embedder（每个进程一份模型副本）
+_worker_embedder = None
+
+
+def _init_worker(model_name: str, backend: str, num_threads: int):
+    """
+    工作进程初始化：限制算子线程数并加载模型
+
+    Args:
+        model_name: 模型名称
+        backend: 推理后端
+        num_threads: 每个进程的 intra-op 线程数
+    """
+    global _worker_embedder
+
+    # 多进程已经占满核心，进程内不再额外开线程
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(num_threads)
+
+    _worker_embedder = Embedder(model_name, backend=backend, num_threads=num_threads)
+    _worker_embedder.load_model()
+
+
+def _encode_group(texts: List[str]) -> np.ndarray:
+    """
+    在工作进程中编码一组文本（恰好构成一次前向计算）
+
+    Args:
+        texts: 文本列表
+
+    Returns:
+        向量数组
+    """
+    return _worker_embedder.encode(texts, batch_size=max(1, len(texts)))
+
+
+class EmbeddingPool:
+    """
+    多进程 Embedding 工作池
+
+    与 Embedder 提供相同的 encode / get_dimension 接口，可直接替换使用。
+    工作进程在第一次编码时才启动。
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        model_name: str = EMBEDDING_MODEL,
+        backend: str = EMBEDDING_BACKEND,
+        threads_per_worker: int = EMBEDDING_WORKER_THREADS,
+        tokenizer_source: Optional[Embedder] = None
+    ):
+        """
+        初始化工作池
+
+        Args:
+            num_workers: 工作进程数
+            model_name: 模型名称
+            backend: 推理后端
+            threads_per_worker: 每个进程的 intra-op 线程数（0 表示按核心数平均分配）
+            tokenizer_source: 用于在主进程中计算 token 数的 Embedder（只加载分词器）
+        """
+        self.num_workers = num_workers
+        self.model_name = model_name
+        self.backend = backend
+        if threads_per_worker <= 0:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+        self.threads_per_worker = threads_per_worker
+        self.tokenizer_source = tokenizer_source or Embedder(model_name, backend=backend)
+        self.pool = None
+        self._dimension = None
+
+    def start(self):
+        """
+        启动工作进程（使用 spawn，避免 fork 已加载的 torch 状态）
+        """
+        if self.pool is None:
+            print(
+                f"启动 {self.num_workers} 个 Embedding 工作进程 "
+                f"(每进程 {self.threads_per_worker} 线程)"
+            )
+            if self.backend == "onnx":
+                # 先在主进程中确保导出完成，避免多个工作进程同时导出
+                from src.onnx_backend import ensure_export
+                ensure_export(self.model_name, ONNX_QUANTIZE)
+            context = multiprocessing.get_context("spawn")
+            self.pool = context.Pool(
+                self.num_workers,
+                initializer=_init_worker,
+                initargs=(self.model_name, self.backend, self.threads_per_worker)
+            )
+        return self.pool
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        show_progress: bool = False,
+        batch_size: int = ENCODE_BATCH_SIZE,
+        token_budget: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        将文本分片到各工作进程编码，并按原顺序返回
+
+        批次划分与单进程 Embedder.encode 完全相同，每个批次交给一个工作进程。
+
+        Args:
+            texts: 单个文本或文本列表
+            show_progress: 兼容 Embedder 接口（不使用）
+            batch_size: 单次前向计算的批大小
+            token_budget: 按 token 长度分桶组批时每批的 token 上限（None 表示按固定批大小）
+
+        Returns:
+            向量数组
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, self.get_dimension()), dtype=np.float32)
+
+        if token_budget and len(texts) > 1:
+            lengths = self.tokenizer_source.count_tokens(texts)
+            groups = plan_token_batches(lengths, token_budget, EMBEDDING_MAX_BATCH_SIZE)
+        else:
+            groups = plan_groups(texts, batch_size)
+
+        self.start()
+        results = self.pool.map(
+            _encode_group,
+            [[texts[i] for i in group] for group in groups],
+            chunksize=1
+        )
+
+        embeddings = np.empty((len(texts), results[0].shape[1]), dtype=results[0].dtype)
+        for group, vectors in zip(groups, results):
+            embeddings[group] = vectors
+        self._dimension = embeddings.shape[1]
+        return embeddings
+
+    def get_dimension(self) -> int:
+        """
+        获取向量维度
+
+        Returns:
+            向量维度
+        """
+        if self._dimension is None:
+            self._dimension = self.encode(["dimension probe"]).shape[1]
+        return self._dimension
+
+    def close(self):
+        """
+        关闭工作进程
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+def create_encoder(num_workers: Optional[int], embedder: Embedder):
+    """
+    根据工作进程数选择编码器
+
+    Args:
+        num_workers: 工作进程数（<= 1 时使用进程内的 embedder）
+        embedder: 进程内 Embedder
+
+    Returns:
+        Embedder 或 EmbeddingPool
+    """
+    if num_workers is None or num_workers <= 1:
+        return embedder
+    return EmbeddingPool(
+        num_workers,
+        model_name=embedder.model_name,
+        backend=embedder.backend,
+        tokenizer_source=embedder
+    )
@@ -5,7 +5,7 @@ Embedding 封装 - 本地模型加载与编码
 import os
 import sys
 import warnings
-from typing import List, Union
+from typing import List, Union, Optional
 import numpy as np
 
 # 禁用警告信息
@@ -17,16 +17,24 @@ os.environ['TOKENIZERS_PARALLELISM'] = 'false'
 os.environ['HF_HUB_DISABLE_PROGRESS_BARS'] = '1'
 os.environ['TRANSFORMERS_NO_ADVISORY_WARNINGS'] = '1'
 
-# 禁用 tqdm 进度条（safetensors 使用）
-try:
-    from tqdm import tqdm
-    from functools import partialmethod
-    tqdm.__init__ = partialmethod(tqdm.__init__, disable=True)
-except:
-    pass
+from config import EMBEDDING_MODEL, EMBEDDING_BACKEND, ONNX_QUANTIZE, EMBEDDING_MAX_BATCH_SIZE
+from src.batching import plan_token_batches
 
-from sentence_transformers import SentenceTransformer
-from config import EMBEDDING_MODEL
+
+def _disable_progress_bars():
+    """
+    禁用 tqdm 进度条（safetensors 使用），在加载模型前调用
+    """
+    try:
+        from tqdm import tqdm
+        from functools import partialmethod
+        tqdm.__init__ = partialmethod(tqdm.__init__, disable=True)
+    except:
+        pass
+
+
+# 单次前向计算的批大小（与 SentenceTransformer.encode 默认值一致）
+ENCODE_BATCH_SIZE = 32
 
 
 class Embedder:
@@ -34,15 +42,27 @@ class Embedder:
     Embedding 模型封装类
     """
     
-    def __init__(self, model_name: str = EMBEDDING_MODEL):
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        backend: str = EMBEDDING_BACKEND,
+        num_threads: int = 0
+    ):
         """
         初始化 Embedding 模型
         
         Args:
             model_name: 模型名称或路径
+            backend: 推理后端 "torch"（SentenceTransformer）或 "onnx"（onnxruntime）
+            num_threads: 算子线程数（0 表示使用后端默认值）
         """
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"不支持的 Embedding 后端: {backend}")
         self.model_name = model_name
+        self.backend = backend
+        self.num_threads = num_threads
         self.model = None
+        self.tokenizer = None
     
     def load_model(self):
         """
@@ -50,7 +70,20 @@ class Embedder:
         优先从本地缓存加载，避免每次联网检查更新
         """
         if self.model is None:
-            print(f"正在加载 Embedding 模型: {self.model_name}")
+            print(f"正在加载 Embedding 模型: {self.model_name} ({self.backend})")
+            _disable_progress_bars()
+            if self.backend == "onnx":
+                # onnx 后端运行时不导入 torch，首次使用时在子进程中导出
+                from src.onnx_backend import OnnxEncoder, ensure_export
+                export_dir = ensure_export(self.model_name, ONNX_QUANTIZE)
+                self.model = OnnxEncoder(export_dir, num_threads=self.num_threads)
+                print("模型加载完成!")
+                return self.model
+            
+            from sentence_transformers import SentenceTransformer
+            if self.num_threads > 0:
+                import torch
+                torch.set_num_threads(self.num_threads)
             try:
                 # 尝试离线模式加载，设置 local_files_only=True 避免联网检查
                 # device='cpu' 避免不必要的 GPU 检测信息
@@ -66,30 +99,165 @@ class Embedder:
             print("模型加载完成!")
         return self.model
     
-    def encode(self, texts: Union[str, List[str]], show_progress: bool = False) -> np.ndarray:
+    def get_tokenizer(self):
+        """
+        获取模型的快速分词器（模型未加载时只加载分词器）
+        
+        Returns:
+            torch 后端为 transformers 分词器，onnx 后端为 tokenizers.Tokenizer
+        """
+        if self.model is not None:
+            return self.model.tokenizer
+        
+        if self.tokenizer is None:
+            if self.backend == "onnx":
+                from src.onnx_backend import ensure_export, load_tokenizer, read_export_meta
+                export_dir = ensure_export(self.model_name, ONNX_QUANTIZE)
+                meta = read_export_meta(self.model_name, ONNX_QUANTIZE)
+                self.tokenizer = load_tokenizer(export_dir, meta["max_seq_length"])
+            else:
+                from transformers import AutoTokenizer
+                try:
+                    self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, local_files_only=True)
+                except Exception:
+                    self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self.tokenizer
+    
+    def copy_tokenizer(self):
+        """
+        获取分词器的独立副本（不截断、不填充），供分块和 token 计数等在其他线程中使用
+        
+        模型编码时会在共享的分词器上切换截断设置，与之并发调用会相互干扰
+        （截断的偏移或 "Already borrowed" 错误），因此这些场景不能直接使用 get_tokenizer 的结果。
+        
+        Returns:
+            tokenizers.Tokenizer；分词器不是快速分词器时返回 None
+        """
+        tokenizer = self.get_tokenizer()
+        if not hasattr(tokenizer, "encode_batch"):
+            if not getattr(tokenizer, "is_fast", False):
+                return None
+            tokenizer = tokenizer.backend_tokenizer
+        
+        from tokenizers import Tokenizer
+        copy = Tokenizer.from_str(tokenizer.to_str())
+        copy.no_truncation()
+        copy.no_padding()
+        return copy
+    
+    @property
+    def max_seq_length(self) -> int:
+        """
+        模型最大序列长度（token 数，含特殊 token）
+        
+        Returns:
+            最大序列长度
+        """
+        if self.model is not None:
+            return self.model.max_seq_length
+        if self.backend == "onnx":
+            from src.onnx_backend import read_export_meta
+            self.get_tokenizer()
+            return read_export_meta(self.model_name, ONNX_QUANTIZE)["max_seq_length"]
+        return min(self.get_tokenizer().model_max_length, 512)
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        批量计算文本编码后的 token 数（含特殊 token，按最大长度截断）
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            token 数列表
+        """
+        tokenizer = self.get_tokenizer()
+        if hasattr(tokenizer, "encode_batch"):
+            return [len(encoding.ids) for encoding in tokenizer.encode_batch(texts)]
+        
+        input_ids = tokenizer(
+            texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=self.max_seq_length
+        )["input_ids"]
+        return [len(ids) for ids in input_ids]
+    
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        show_progress: bool = False,
+        batch_size: int = ENCODE_BATCH_SIZE,
+        token_budget: Optional[int] = None
+    ) -> np.ndarray:
         """
         将文本编码为向量
         
         Args:
             texts: 单个文本或文本列表
             show_progress: 是否显示进度条
+            batch_size: 单次前向计算的批大小
+            token_budget: 按 token 长度分桶组批时每批的 token 上限（None 表示按固定批大小）
             
         Returns:
-            向量数组
+            向量数组（与输入顺序一致）
         """
         self.load_model()
         
         if isinstance(texts, str):
             texts = [texts]
         
+        if token_budget and len(texts) > 1:
+            groups = plan_token_batches(self.count_tokens(texts), token_budget, EMBEDDING_MAX_BATCH_SIZE)
+            embeddings = None
+            for group in groups:
+                vectors = self.model.encode(
+                    [texts[i] for i in group],
+                    batch_size=len(group),
+                    show_progress_bar=False,
+                    convert_to_numpy=True
+                )
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+                embeddings[group] = vectors
+            return embeddings
+        
         embeddings = self.model.encode(
             texts, 
+            batch_size=batch_size,
             show_progress_bar=show_progress,
             convert_to_numpy=True
         )
         
         return embeddings
     
+    @property
+    def cache_key(self) -> str:
+        """
+        向量缓存使用的模型标识（不同后端/量化方式的向量略有差异，分开缓存）
+        
+        Returns:
+            模型标识字符串
+        """
+        if self.backend == "onnx":
+            return f"{self.model_name}@onnx{'-int8' if ONNX_QUANTIZE else ''}"
+        return self.model_name
+    
+    def backend_info(self) -> dict:
+        """
+        获取后端信息（不加载模型）
+        
+        Returns:
+            {backend, quantized, agreement}，agreement 为 onnx 与 torch 的余弦一致性
+        """
+        info = {"backend": self.backend, "quantized": False, "agreement": None}
+        if self.backend == "onnx":
+            from src.onnx_backend import read_export_meta
+            meta = read_export_meta(self.model_name, ONNX_QUANTIZE) or {}
+            info["quantized"] = ONNX_QUANTIZE
+            info["agreement"] = meta.get("agreement")
+        return info
+    
     def get_dimension(self) -> int:
         """
         获取向量维度
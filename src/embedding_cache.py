@@ -0,0 +1,387 @@
+"""
+Embedding 缓存 - 按文本内容寻址的持久化向量缓存
+"""
+
+import os
+import re
+import time
+import hashlib
+from typing import List, Tuple, Optional
+import numpy as np
+from config import EMBEDDING_MODEL, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为无锁模式
+    fcntl = None
+
+
+# 文本哈希长度（字节）
+KEY_SIZE = 16
+
+
+class EmbeddingCache:
+    """
+    磁盘 Embedding 缓存
+
+    以 (模型名, 文本哈希) 为键，向量和每个槽位的键存放在可内存映射的数组中，
+    占用标记和访问时间单独存放为紧凑的 npz 文件。容量满时按 LRU 淘汰。
+    不同文档目录的索引任务可以共享同一个缓存（写入时加文件锁）。
+
+    put_many 只写入新条目所在的行，npz 索引在 flush 时统一落盘；
+    读取时核对槽位中的键，其他进程尚未落盘的写入覆盖了某个槽位时只会造成未命中。
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        cache_dir: str = EMBEDDING_CACHE_DIR,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES
+    ):
+        """
+        初始化缓存
+
+        Args:
+            model_name: 模型名称（不同模型使用独立的子目录）
+            cache_dir: 缓存根目录
+            max_entries: 最大缓存条目数
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dir = os.path.join(cache_dir, re.sub(r"[^\w.-]+", "__", model_name))
+        self.vectors_path = os.path.join(self.dir, "vectors.npy")
+        self.keys_path = os.path.join(self.dir, "keys.npy")
+        self.index_path = os.path.join(self.dir, "index.npz")
+        self.lock_path = os.path.join(self.dir, "lock")
+
+        self.vectors = None          # np.memmap (capacity, dim)
+        self.keys = None             # np.memmap (capacity, KEY_SIZE) uint8
+        self.used = None             # (capacity,) bool
+        self.atime = None            # (capacity,) int64，最近访问时间（纳秒）
+        self.slot_of = {}            # key bytes -> slot
+        self._index_stat = None
+        self._touched = {}           # 本进程命中但尚未落盘的访问时间 key -> atime
+        self._pending = {}           # 本进程写入但尚未落盘到索引的条目 key -> slot
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_text(text: str) -> bytes:
+        """
+        计算文本哈希键
+
+        Args:
+            text: 文本内容
+
+        Returns:
+            KEY_SIZE 字节的哈希
+        """
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+    def _lock(self, exclusive: bool):
+        """
+        获取跨进程文件锁
+
+        Args:
+            exclusive: 是否为排他锁
+
+        Returns:
+            锁文件句柄（调用方负责关闭）
+        """
+        os.makedirs(self.dir, exist_ok=True)
+        handle = open(self.lock_path, "a+")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return handle
+
+    def _refresh(self):
+        """
+        如果索引文件被其他进程更新过，则重新加载（需持有锁）
+        """
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._index_stat:
+            return
+
+        try:
+            with np.load(self.index_path) as data:
+                used = data["used"]
+                atime = data["atime"]
+            keys = np.load(self.keys_path, mmap_mode="r+")
+            vectors = np.load(self.vectors_path, mmap_mode="r+")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"警告: Embedding 缓存损坏，将重新创建: {e}")
+            self._reset_files()
+            return
+
+        if not vectors.shape[0] == keys.shape[0] == used.shape[0]:
+            print("警告: Embedding 缓存索引与向量文件不一致，将重新创建")
+            self._reset_files()
+            return
+
+        self.keys, self.used, self.atime, self.vectors = keys, used, atime, vectors
+        self.slot_of = {
+            self.keys[slot].tobytes(): int(slot)
+            for slot in np.flatnonzero(self.used)
+        }
+
+        # 其他进程落盘了索引：保留本进程已写入、且没有被覆盖的条目
+        now = time.time_ns()
+        for key, slot in self._pending.items():
+            if not self.used[slot] and key not in self.slot_of and self.keys[slot].tobytes() == key:
+                self.used[slot] = True
+                self.atime[slot] = now
+                self.slot_of[key] = slot
+        self._index_stat = stat_key
+
+    def _reset_files(self):
+        """
+        删除缓存文件并清空内存状态（需持有排他锁或确认无其他写入者）
+        """
+        for path in (self.vectors_path, self.keys_path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.vectors = self.keys = self.used = self.atime = None
+        self.slot_of = {}
+        self._pending = {}
+        self._index_stat = None
+
+    def _create(self, dim: int):
+        """
+        创建新的缓存文件（需持有排他锁）
+
+        Args:
+            dim: 向量维度
+        """
+        capacity = self.max_entries
+        self.vectors = np.lib.format.open_memmap(
+            self.vectors_path, mode="w+", dtype=np.float32, shape=(capacity, dim)
+        )
+        self.keys = np.lib.format.open_memmap(
+            self.keys_path, mode="w+", dtype=np.uint8, shape=(capacity, KEY_SIZE)
+        )
+        self.used = np.zeros(capacity, dtype=bool)
+        self.atime = np.zeros(capacity, dtype=np.int64)
+        self.slot_of = {}
+        self._pending = {}
+        # 立即写出空索引，其他进程由此发现并复用这组文件
+        self._save_index()
+
+    def _save_index(self):
+        """
+        原子地写入占用标记和访问时间（需持有排他锁）
+        """
+        tmp_path = os.path.join(self.dir, "index.tmp.npz")
+        np.savez(tmp_path, used=self.used, atime=self.atime)
+        os.replace(tmp_path, self.index_path)
+        st = os.stat(self.index_path)
+        self._index_stat = (st.st_mtime_ns, st.st_size)
+        self._pending = {}
+
+    def _apply_touches(self):
+        """
+        把本进程记录的访问时间合并到索引中（需持有排他锁）
+        """
+        for key, ts in self._touched.items():
+            slot = self.slot_of.get(key)
+            if slot is not None and self.atime[slot] < ts:
+                self.atime[slot] = ts
+        self._touched = {}
+
+    def get_many(self, keys: List[bytes]) -> Tuple[Optional[np.ndarray], List[int]]:
+        """
+        批量查询缓存
+
+        Args:
+            keys: 文本哈希键列表
+
+        Returns:
+            (向量数组, 未命中的下标列表)；缓存为空时向量数组为 None
+        """
+        handle = self._lock(exclusive=False)
+        try:
+            self._refresh()
+            if self.vectors is None:
+                self.misses += len(keys)
+                return None, list(range(len(keys)))
+
+            result = np.zeros((len(keys), self.vectors.shape[1]), dtype=np.float32)
+            hit_rows, hit_slots, missing = [], [], []
+            for i, key in enumerate(keys):
+                slot = self.slot_of.get(key)
+                if slot is not None and self.keys[slot].tobytes() != key:
+                    # 槽位已被其他进程尚未落盘的写入覆盖
+                    slot = None
+                if slot is None:
+                    missing.append(i)
+                else:
+                    hit_rows.append(i)
+                    hit_slots.append(slot)
+
+            if hit_slots:
+                # 排序后读取，对内存映射文件更友好
+                order = np.argsort(hit_slots)
+                slots = np.asarray(hit_slots)[order]
+                rows = np.asarray(hit_rows)[order]
+                result[rows] = self.vectors[slots]
+
+                now = time.time_ns()
+                for i in hit_rows:
+                    self._touched[keys[i]] = now
+        finally:
+            handle.close()
+
+        self.hits += len(hit_rows)
+        self.misses += len(missing)
+        return result, missing
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        """
+        批量写入缓存，容量不足时淘汰最久未使用的条目（需要调用 flush 落盘索引）
+
+        Args:
+            keys: 文本哈希键列表
+            vectors: 对应的向量数组 (n, dim)
+        """
+        if len(keys) == 0:
+            return
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        handle = self._lock(exclusive=True)
+        try:
+            self._refresh()
+            if self.vectors is not None and self.vectors.shape[1] != vectors.shape[1]:
+                print("警告: Embedding 缓存维度与模型不一致，将重新创建")
+                self._reset_files()
+            if self.vectors is None:
+                self._create(vectors.shape[1])
+
+            self._apply_touches()
+
+            # 去重并跳过其他进程已写入的键
+            new_rows = {}
+            for i, key in enumerate(keys):
+                if key not in self.slot_of and key not in new_rows:
+                    new_rows[key] = i
+            new_rows = list(new_rows.items())[:self.vectors.shape[0]]
+
+            if new_rows:
+                slots = self._allocate(len(new_rows))
+                now = time.time_ns()
+                for slot in slots:
+                    if self.used[slot]:
+                        old_key = self.keys[slot].tobytes()
+                        self.slot_of.pop(old_key, None)
+                        self._pending.pop(old_key, None)
+
+                for slot, (key, row) in zip(slots, new_rows):
+                    self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                    self.used[slot] = True
+                    self.atime[slot] = now
+                    self.slot_of[key] = int(slot)
+                    self._pending[key] = int(slot)
+
+                rows = [row for _, row in new_rows]
+                self.vectors[slots] = vectors[rows]
+                self.vectors.flush()
+                self.keys.flush()
+        finally:
+            handle.close()
+
+    def _allocate(self, count: int) -> np.ndarray:
+        """
+        分配空闲槽位，不足时按 LRU 淘汰
+
+        Args:
+            count: 需要的槽位数
+
+        Returns:
+            槽位下标数组
+        """
+        free = np.flatnonzero(~self.used)
+        if len(free) >= count:
+            return free[:count]
+
+        need = count - len(free)
+        used = np.flatnonzero(self.used)
+        oldest = used[np.argpartition(self.atime[used], need - 1)[:need]]
+        return np.concatenate([free, oldest])
+
+    def flush(self):
+        """
+        把新写入的条目和命中记录的访问时间落盘（建索引结束时调用一次），
+        此后其他进程才能命中这些条目，LRU 顺序也在进程间共享
+        """
+        if not self._touched and not self._pending:
+            return
+
+        handle = self._lock(exclusive=True)
+        try:
+            self._refresh()
+            if self.vectors is not None:
+                self._apply_touches()
+                self._save_index()
+        finally:
+            handle.close()
+
+    def stats(self) -> dict:
+        """
+        获取缓存统计信息
+
+        Returns:
+            {entries, capacity, hits, misses}
+        """
+        return {
+            "entries": len(self.slot_of),
+            "capacity": self.max_entries if self.vectors is None else int(self.vectors.shape[0]),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def encode_with_cache(
+    embedder,
+    texts: List[str],
+    cache: Optional[EmbeddingCache],
+    batch_size: int = 100,
+    token_budget: Optional[int] = None
+) -> np.ndarray:
+    """
+    通过缓存批量编码文本：先整体查询缓存，只对未命中的文本调用模型并回写
+
+    Args:
+        embedder: Embedder 或 EmbeddingPool 实例
+        texts: 文本列表
+        cache: Embedding 缓存（为 None 时直接编码）
+        batch_size: 未命中文本每次交给模型的数量
+        token_budget: 按 token 长度分桶组批时每批的 token 上限
+
+    Returns:
+        向量数组 (len(texts), dim)
+    """
+    if cache is None:
+        return embedder.encode(texts, show_progress=False, token_budget=token_budget)
+
+    keys = [EmbeddingCache.hash_text(text) for text in texts]
+    vectors, missing = cache.get_many(keys)
+
+    for i in range(0, len(missing), batch_size):
+        batch_rows = missing[i:i + batch_size]
+        batch_vectors = embedder.encode(
+            [texts[row] for row in batch_rows],
+            show_progress=False,
+            token_budget=token_budget
+        )
+        if vectors is None:
+            vectors = np.zeros((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+        vectors[batch_rows] = batch_vectors
+        cache.put_many([keys[row] for row in batch_rows], batch_vectors)
+
+    if vectors is None:
+        vectors = np.zeros((0, embedder.get_dimension()), dtype=np.float32)
+    return vectors
@@ -0,0 +1,371 @@
+"""
+关键词索引 - BM25 倒排索引（中文按字二元组、英文按词切分），与向量检索结果做倒数排名融合
+"""
+
+import os
+import re
+import math
+import threading
+from collections import Counter
+from typing import List, Dict, Tuple, Iterable
+import numpy as np
+from config import LEXICAL_INDEX_PATH, BM25_K1, BM25_B, RRF_K
+
+
+# 中日韩文字（假名、汉字、谚文）
+_CJK_CHARS = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+
+# 中日韩文字的连续片段，或英文/数字词（保留命令行参数的前导 "-" 和标识符中的 - . _ / :）
+_TOKEN_RE = re.compile(rf"[{_CJK_CHARS}]+|-{{0,2}}[a-z0-9_]+(?:[-./:][a-z0-9_]+)*")
+_CJK_RE = re.compile(rf"[{_CJK_CHARS}]")
+_PART_SPLIT_RE = re.compile(r"[-./:]+")
+
+# 已删除文档占比超过该值时在保存前压缩
+COMPACT_RATIO = 0.3
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分文本为检索词
+
+    中文等 CJK 片段切为相邻二字组（单字片段保留单字）；英文和数字按词切分并转为小写。
+    带分隔符的标识符（如 --no-cache、E0433、docker-compose.yml）保留整体，同时拆出各部分，
+    使完整标识符和其中的单词都能命中。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        检索词列表（含重复，用于统计词频）
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        if _CJK_RE.match(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+            continue
+
+        tokens.append(token)
+        parts = [part for part in _PART_SPLIT_RE.split(token.lstrip("-")) if part]
+        if len(parts) > 1 or (parts and parts[0] != token):
+            tokens.extend(parts)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合：每个结果的得分为其在各排名列表中 1 / (k + 名次) 之和
+
+    Args:
+        rankings: 多个按相关度排好序的 ID 列表
+        k: 平滑常数（越大，排名靠后的结果权重越接近靠前的结果）
+
+    Returns:
+        [(ID, 融合得分)]，按得分降序
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, record_id in enumerate(ranking, start=1):
+            fused[record_id] = fused.get(record_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+class LexicalIndex:
+    """
+    BM25 倒排索引
+
+    以压缩稀疏行（CSR）格式存放：每个词的倒排表是 postings 中的一段连续区间，
+    每条记录为 (文档序号 uint32, 词频 uint16)；文档表记录分块 ID、长度和是否有效。
+    整个索引保存为一个 npz 文件，首次使用时全部读入内存并常驻，文件的 stat 变化时重新加载；
+    查询时只扫描问题中出现的词的倒排表区间。
+
+    新增的文档先暂存在内存中，保存或查询前一次性合并；删除只做标记，
+    已删除文档超过 COMPACT_RATIO 时在保存前压缩。
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        初始化索引
+
+        Args:
+            path: 索引文件路径
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._file_stat = None
+        self._reset_arrays()
+
+    def _reset_arrays(self):
+        """
+        清空内存中的索引
+        """
+        self.terms: List[str] = []                                # 词表
+        self.term_of: Dict[str, int] = {}                         # 词 -> 词序号
+        self.offsets = np.zeros(1, dtype=np.int64)                # (词数 + 1,) 倒排表区间
+        self.post_docs = np.zeros(0, dtype=np.uint32)             # 倒排记录的文档序号
+        self.post_tf = np.zeros(0, dtype=np.uint16)               # 倒排记录的词频
+        self.doc_ids = np.zeros(0, dtype=np.int64)                # 文档序号 -> 分块 ID
+        self.doc_len = np.zeros(0, dtype=np.int32)                # 文档长度（检索词数）
+        self.alive = np.zeros(0, dtype=bool)                      # 文档是否有效
+        self._pending = []                                        # 待合并的 (分块 ID, 词频 Counter)
+        self._dirty = False
+
+    def exists(self) -> bool:
+        """
+        检查索引文件是否存在
+
+        Returns:
+            是否存在
+        """
+        return os.path.exists(self.path)
+
+    def _refresh(self):
+        """
+        索引文件被（其他进程）更新过时重新加载（需持有锁）
+        """
+        if self._dirty or self._pending:
+            return
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self._file_stat is not None:
+                self._reset_arrays()
+                self._file_stat = None
+            return
+
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._file_stat:
+            return
+
+        with np.load(self.path) as data:
+            vocab = bytes(data["vocab"]).decode("utf-8")
+            self.offsets = data["offsets"]
+            self.post_docs = data["post_docs"]
+            self.post_tf = data["post_tf"]
+            self.doc_ids = data["doc_ids"]
+            self.doc_len = data["doc_len"]
+            self.alive = data["alive"]
+        self.terms = vocab.split("\n") if vocab else []
+        self.term_of = {term: i for i, term in enumerate(self.terms)}
+        self._file_stat = stat_key
+
+    def reset(self):
+        """
+        清空索引（全量重建前调用，保存时覆盖文件）
+        """
+        with self._lock:
+            self._reset_arrays()
+            self._dirty = True
+
+    def add(self, chunk_ids: List[int], texts: List[str]):
+        """
+        添加文档（暂存，保存或查询前合并）
+
+        Args:
+            chunk_ids: 分块 ID 列表
+            texts: 对应的文本列表
+        """
+        counted = [(int(chunk_id), Counter(tokenize(text))) for chunk_id, text in zip(chunk_ids, texts)]
+        with self._lock:
+            self._refresh()
+            self._pending.extend(counted)
+
+    def delete(self, chunk_ids: List[int]) -> int:
+        """
+        按分块 ID 标记删除
+
+        Args:
+            chunk_ids: 要删除的分块 ID 列表
+
+        Returns:
+            删除的文档数
+        """
+        if not chunk_ids:
+            return 0
+        with self._lock:
+            self._refresh()
+            self._merge_pending()
+            mask = np.isin(self.doc_ids, np.asarray(chunk_ids, dtype=np.int64)) & self.alive
+            if not mask.any():
+                return 0
+            self.alive = self.alive.copy()
+            self.alive[mask] = False
+            self._dirty = True
+            return int(mask.sum())
+
+    def _merge_pending(self):
+        """
+        把暂存的文档合并进 CSR 倒排表（需持有锁）
+        """
+        if not self._pending:
+            return
+
+        first_doc = len(self.doc_ids)
+        new_terms, new_docs, new_tf, new_len = [], [], [], []
+        for doc, (_, counts) in enumerate(self._pending, start=first_doc):
+            for term, tf in counts.items():
+                term_id = self.term_of.get(term)
+                if term_id is None:
+                    term_id = len(self.terms)
+                    self.terms.append(term)
+                    self.term_of[term] = term_id
+                new_terms.append(term_id)
+                new_docs.append(doc)
+                new_tf.append(min(tf, np.iinfo(np.uint16).max))
+            new_len.append(sum(counts.values()))
+
+        # 已有倒排记录展开为 (词序号, 文档序号, 词频)，与新记录一起按词稳定排序
+        old_terms = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets))
+        all_terms = np.concatenate([old_terms, np.asarray(new_terms, dtype=np.int64)])
+        order = np.argsort(all_terms, kind="stable")
+        self.post_docs = np.concatenate([self.post_docs, np.asarray(new_docs, dtype=np.uint32)])[order]
+        self.post_tf = np.concatenate([self.post_tf, np.asarray(new_tf, dtype=np.uint16)])[order]
+        self.offsets = np.searchsorted(all_terms[order], np.arange(len(self.terms) + 1)).astype(np.int64)
+
+        self.doc_ids = np.concatenate([self.doc_ids, [chunk_id for chunk_id, _ in self._pending]]).astype(np.int64)
+        self.doc_len = np.concatenate([self.doc_len, new_len]).astype(np.int32)
+        self.alive = np.concatenate([self.alive, np.ones(len(self._pending), dtype=bool)])
+        self._pending = []
+        self._dirty = True
+
+    def _compact(self):
+        """
+        移除已删除文档的倒排记录以及不再出现的词（需持有锁）
+        """
+        keep = np.flatnonzero(self.alive)
+        new_doc = np.full(len(self.doc_ids), -1, dtype=np.int64)
+        new_doc[keep] = np.arange(len(keep))
+
+        term_of_post = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.offsets))
+        live_posts = self.alive[self.post_docs]
+        term_of_post = term_of_post[live_posts]
+        self.post_docs = new_doc[self.post_docs[live_posts]].astype(np.uint32)
+        self.post_tf = self.post_tf[live_posts]
+
+        used_terms = np.unique(term_of_post)
+        self.terms = [self.terms[i] for i in used_terms]
+        self.term_of = {term: i for i, term in enumerate(self.terms)}
+        term_of_post = np.searchsorted(used_terms, term_of_post)
+        self.offsets = np.searchsorted(term_of_post, np.arange(len(self.terms) + 1)).astype(np.int64)
+
+        self.doc_ids = self.doc_ids[keep]
+        self.doc_len = self.doc_len[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+
+    def save(self):
+        """
+        合并暂存文档，按需压缩，并原子地写入索引文件
+        """
+        with self._lock:
+            self._merge_pending()
+            if not self._dirty:
+                return
+            if len(self.alive) and (~self.alive).sum() > COMPACT_RATIO * len(self.alive):
+                self._compact()
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                vocab=np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype=np.uint8),
+                offsets=self.offsets,
+                post_docs=self.post_docs,
+                post_tf=self.post_tf,
+                doc_ids=self.doc_ids,
+                doc_len=self.doc_len,
+                alive=self.alive
+            )
+            os.replace(tmp_path, self.path)
+            st = os.stat(self.path)
+            self._file_stat = (st.st_mtime_ns, st.st_size)
+            self._dirty = False
+
+    def search_batch(self, questions: List[str], top_k: int) -> List[List[Tuple[int, float]]]:
+        """
+        批量 BM25 检索
+
+        Args:
+            questions: 问题列表
+            top_k: 每个问题返回的结果数量
+
+        Returns:
+            与问题一一对应的 [(分块 ID, BM25 得分)]，按得分降序
+        """
+        with self._lock:
+            self._refresh()
+            self._merge_pending()
+            offsets, post_docs, post_tf = self.offsets, self.post_docs, self.post_tf
+            doc_ids, doc_len, alive = self.doc_ids, self.doc_len, self.alive
+            term_of = self.term_of
+
+        alive_count = int(alive.sum())
+        if alive_count == 0 or top_k <= 0:
+            return [[] for _ in questions]
+
+        avg_len = float(doc_len[alive].mean()) or 1.0
+        length_norm = self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+
+        results = []
+        for question in questions:
+            scores = np.zeros(len(doc_ids), dtype=np.float32)
+            for term in set(tokenize(question)):
+                term_id = term_of.get(term)
+                if term_id is None:
+                    continue
+                docs = post_docs[offsets[term_id]:offsets[term_id + 1]]
+                df = int(alive[docs].sum())
+                if df == 0:
+                    continue
+                idf = math.log(1 + (alive_count - df + 0.5) / (df + 0.5))
+                tf = post_tf[offsets[term_id]:offsets[term_id + 1]].astype(np.float32)
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + length_norm[docs])
+
+            scores[~alive] = 0
+            matched = np.flatnonzero(scores > 0)
+            if len(matched) > top_k:
+                matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+            matched = matched[np.argsort(-scores[matched], kind="stable")]
+            results.append([(int(doc_ids[doc]), float(scores[doc])) for doc in matched])
+        return results
+
+    def stats(self) -> Dict:
+        """
+        获取索引统计信息
+
+        Returns:
+            {docs, terms, postings, size_bytes}
+        """
+        with self._lock:
+            self._refresh()
+            return {
+                "docs": int(self.alive.sum()) + len(self._pending),
+                "terms": len(self.terms),
+                "postings": len(self.post_docs),
+                "size_bytes": os.path.getsize(self.path) if self.exists() else 0
+            }
+
+
+# 全局单例
+_lexical_index_instance = None
+
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    获取全局 LexicalIndex 实例
+
+    Returns:
+        LexicalIndex 实例
+    """
+    global _lexical_index_instance
+    if _lexical_index_instance is None:
+        _lexical_index_instance = LexicalIndex()
+    return _lexical_index_instance
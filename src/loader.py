@@ -4,20 +4,51 @@
 
 import os
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional
+from src.manifest import compute_content_hash
 
 
-def load_md_files(docs_dir: str) -> List[Dict]:
+def _read_md_file(md_file: Path, unreadable: Optional[List[str]] = None) -> Optional[Dict]:
     """
-    递归扫描指定目录下的所有 .md 文件
+    读取单个 md 文件
     
     Args:
-        docs_dir: 文档目录路径
+        md_file: 文件路径
+        unreadable: 读取出错的文件路径会追加到这里（文件已不存在时不追加，按删除处理）
         
     Returns:
-        文档列表 [{content, file_path, file_name}]
+        文档 {content, file_path, file_name, content_hash}，无法读取时返回 None
+    """
+    try:
+        content = md_file.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        # 扫描之后被删除
+        return None
+    except Exception as e:
+        print(f"警告: 无法读取文件 {md_file}: {e}")
+        if unreadable is not None:
+            unreadable.append(str(md_file.absolute()))
+        return None
+    
+    return {
+        "content": content,
+        "file_path": str(md_file.absolute()),
+        "file_name": md_file.name,
+        "content_hash": compute_content_hash(content)
+    }
+
+
+def load_md_files(docs_dir: str, unreadable: Optional[List[str]] = None) -> Iterator[Dict]:
+    """
+    递归扫描指定目录下的所有 .md 文件（逐个读取，按需产出）
+    
+    Args:
+        docs_dir: 文档目录路径
+        unreadable: 读取出错的文件路径会追加到这里
+        
+    Yields:
+        文档 {content, file_path, file_name, content_hash}
     """
-    documents = []
     docs_path = Path(docs_dir)
     
     if not docs_path.exists():
@@ -25,32 +56,26 @@ def load_md_files(docs_dir: str) -> List[Dict]:
     
     # 递归查找所有 .md 文件
     for md_file in docs_path.rglob("*.md"):
-        try:
-            content = md_file.read_text(encoding="utf-8")
-            documents.append({
-                "content": content,
-                "file_path": str(md_file.absolute()),
-                "file_name": md_file.name
-            })
-        except Exception as e:
-            print(f"警告: 无法读取文件 {md_file}: {e}")
-    
-    return documents
+        doc = _read_md_file(md_file, unreadable)
+        if doc is not None:
+            yield doc
 
 
-def get_file_stats(documents: List[Dict]) -> Dict:
+def load_md_paths(paths: Iterable[str], unreadable: Optional[List[str]] = None) -> Iterator[Dict]:
     """
-    获取文档统计信息
+    逐个读取指定的 md 文件（监视模式只处理变化的文件），不存在的文件跳过
     
     Args:
-        documents: 文档列表
+        paths: 文件路径列表
+        unreadable: 读取出错的文件路径会追加到这里
         
-    Returns:
-        统计信息字典
+    Yields:
+        文档 {content, file_path, file_name, content_hash}
     """
-    total_chars = sum(len(doc["content"]) for doc in documents)
-    return {
-        "total_files": len(documents),
-        "total_chars": total_chars,
-        "avg_chars": total_chars // len(documents) if documents else 0
-    }
+    for path in paths:
+        md_file = Path(path)
+        if md_file.is_file():
+            doc = _read_md_file(md_file, unreadable)
+            if doc is not None:
+                yield doc
+
@@ -0,0 +1,191 @@
+"""
+索引清单 - 记录文件内容哈希与分块 ID，支持增量索引
+"""
+
+import os
+import json
+import hashlib
+from typing import List, Dict, Set, Optional
+from config import (
+    INDEX_MANIFEST_PATH,
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    ONNX_QUANTIZE,
+    COLLECTION_NAME,
+    VECTOR_STORE_BACKEND,
+    CHUNK_MODE,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    DEDUP_ENABLED,
+    DEDUP_THRESHOLD,
+    DEDUP_NUM_PERM,
+    DEDUP_BANDS,
+    DEDUP_SHINGLE_SIZE
+)
+from src.splitter import SPLITTER_VERSION
+
+
+# 清单格式版本，格式不兼容时递增以触发全量重建
+MANIFEST_VERSION = 1
+
+
+def compute_content_hash(content: str) -> str:
+    """
+    计算文档内容哈希
+
+    Args:
+        content: 文档文本内容
+
+    Returns:
+        sha256 十六进制字符串
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """
+    索引清单类：文件路径 -> {内容哈希, 分块 ID 列表}
+    """
+
+    def __init__(self, path: str = INDEX_MANIFEST_PATH):
+        """
+        初始化索引清单
+
+        Args:
+            path: 清单文件路径
+        """
+        self.path = path
+        self.settings = self.current_settings()
+        self.files: Dict[str, Dict] = {}
+        self.next_id = 0
+
+    @staticmethod
+    def current_settings() -> Dict:
+        """
+        获取影响分块与向量结果的当前配置
+
+        Returns:
+            配置字典，任一项变化都需要全量重建
+        """
+        return {
+            "version": MANIFEST_VERSION,
+            "embedding_model": EMBEDDING_MODEL,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "onnx_quantize": ONNX_QUANTIZE if EMBEDDING_BACKEND == "onnx" else None,
+            "collection_name": COLLECTION_NAME,
+            "vector_store_backend": VECTOR_STORE_BACKEND,
+            "chunk_mode": CHUNK_MODE,
+            "chunk_size": CHUNK_TOKENS if CHUNK_MODE == "tokens" else CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP_TOKENS if CHUNK_MODE == "tokens" else CHUNK_OVERLAP,
+            "splitter_version": SPLITTER_VERSION,
+            "dedup": [DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE_SIZE] if DEDUP_ENABLED else None
+        }
+
+    def load(self) -> bool:
+        """
+        从磁盘加载清单
+
+        Returns:
+            是否加载成功且与当前配置兼容
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 无法读取索引清单 {self.path}: {e}")
+            return False
+
+        if data.get("settings") != self.settings:
+            return False
+
+        self.files = data.get("files", {})
+        self.next_id = data.get("next_id", 0)
+        return True
+
+    def save(self):
+        """
+        保存清单到磁盘（先写临时文件再替换，避免中断时损坏）
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "settings": self.settings,
+                "next_id": self.next_id,
+                "files": self.files
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        """
+        清空清单（全量重建时使用）
+        """
+        self.files = {}
+        self.next_id = 0
+
+    def allocate_ids(self, count: int) -> List[int]:
+        """
+        分配连续的新分块 ID
+
+        Args:
+            count: 需要的 ID 数量
+
+        Returns:
+            ID 列表
+        """
+        ids = list(range(self.next_id, self.next_id + count))
+        self.next_id += count
+        return ids
+
+    def referenced_ids(self) -> Set[int]:
+        """
+        获取所有文件引用的分块 ID（去重后多个位置可能引用同一个代表块）
+
+        Returns:
+            分块 ID 集合
+        """
+        return {chunk_id for entry in self.files.values() for chunk_id in entry["chunk_ids"]}
+
+    def get_chunk_ids(self, file_path: str) -> List[int]:
+        """
+        获取文件对应的分块 ID
+
+        Args:
+            file_path: 文件路径
+
+        Returns:
+            分块 ID 列表
+        """
+        entry = self.files.get(file_path)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def set_file(self, file_path: str, content_hash: str, chunk_ids: List[int]):
+        """
+        记录文件的哈希与分块 ID
+
+        Args:
+            file_path: 文件路径
+            content_hash: 内容哈希
+            chunk_ids: 分块 ID 列表
+        """
+        self.files[file_path] = {"hash": content_hash, "chunk_ids": chunk_ids}
+
+    def remove_file(self, file_path: str) -> Optional[Dict]:
+        """
+        从清单中移除文件
+
+        Args:
+            file_path: 文件路径
+
+        Returns:
+            被移除的条目
+        """
+        return self.files.pop(file_path, None)
@@ -0,0 +1,169 @@
+"""
+Markdown 分词器 - 单遍扫描 Markdown 文本，识别代码块、Front Matter 与表格，按标题切分章节
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Dict, Iterator, Optional
+
+
+# 可能影响章节划分的行：代码围栏、ATX 标题（# 标题）、Setext 标题下划线（=== / ---）
+_BLOCK_LINE_BODY = (
+    r"(?P<line> {0,3}(?:"
+    r"(?P<fence>`{3,}|~{3,})(?P<info>[^\n]*)"
+    r"|(?P<atx>#{1,6})(?P<title>[ \t\r][^\n]*)?"
+    r"|(?P<setext>=+|-+)[ \t\r]*"
+    r"))$"
+)
+_FIRST_BLOCK_LINE = re.compile(_BLOCK_LINE_BODY, re.M)
+# 以换行符开头，正则引擎按字面前缀快速跳到下一行，行首字符不符合时立即放弃，其余行不逐行构造字符串
+_BLOCK_LINE = re.compile(r"\n(?=[ `~#=-])" + _BLOCK_LINE_BODY, re.M)
+
+# 章节首尾去掉的空白（只含 ASCII 字符，空白的字节数等于字符数）
+_BLANK = " \t\r\n"
+
+# 文件开头的 YAML Front Matter：--- 开始，--- 或 ... 结束
+_FRONT_MATTER = re.compile(r"\A---[ \t]*\r?\n.*?^(?:---|\.\.\.)[ \t]*\r?$", re.M | re.S)
+
+# 表格分隔行，如 | --- | :---: |（至少含一个竖线）
+_TABLE_DELIMITER = re.compile(r"^ {0,3}(?=[^\n]*\|)\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)*\|?[ \t\r]*$")
+
+# 不能作为 Setext 标题内容的行：缩进代码、引用、表格行、列表项
+_NOT_PARAGRAPH = re.compile(r"(?: {4,}|\t| {0,3}(?:[>|]|[-+*](?=\s|$)|\d{1,9}[.)](?=\s|$)))")
+
+# ATX 标题末尾可选的闭合 #
+_CLOSING_HASHES = re.compile(r"(?:^|[ \t]+)#+$")
+
+
+@lru_cache(maxsize=None)
+def _closing_fence(marker: str):
+    """
+    匹配代码块闭合围栏的正则：同一字符、长度不短于开始围栏、后面没有其他内容
+    """
+    return re.compile(r"\n {0,3}" + re.escape(marker[0]) + "{%d,}[ \t\r]*$" % len(marker), re.M)
+
+
+def _paragraph_start(content: str, floor: int, line_start: int) -> int:
+    """
+    查找 Setext 下划线上方段落的起始位置
+
+    从下划线向上逐行回溯，直到空行或上一个块的结尾（floor）。
+    上方不是普通段落（空行、列表、引用、表格等）时返回 -1，此时 --- 是分隔线。
+
+    Args:
+        content: 全文
+        floor: 可回溯到的最前位置（上一个标题、代码块或分隔线之后）
+        line_start: 下划线所在行的起始位置
+
+    Returns:
+        段落起始位置，或 -1
+    """
+    start = line_start
+    while start > floor:
+        previous = max(content.rfind("\n", floor, start - 1) + 1, floor)
+        line = content[previous:start - 1]
+        if not line.strip():
+            break
+        if _TABLE_DELIMITER.match(line):
+            return -1
+        start = previous
+    if start == line_start or _NOT_PARAGRAPH.match(content, start):
+        return -1
+    return start
+
+
+def iter_sections(content: str) -> Iterator[Dict]:
+    """
+    单遍扫描 Markdown 文本，按标题产出章节
+
+    - 代码块（``` 或 ~~~ 围栏）内的 # 注释、shell 提示符等不会被当作标题
+    - 文件开头的 Front Matter 单独作为一个章节，其中的 # 注释同样不是标题
+    - 表格之后的 --- 是分隔线而不是 Setext 标题
+    - 支持 ATX 标题（# 标题）和 Setext 标题（标题下一行为 === 或 ---）
+
+    Args:
+        content: Markdown 文本内容
+
+    Yields:
+        章节 {text, heading_path, level, kind, start, end}：
+        text 为去掉首尾空白的章节文本（以标题行开头），heading_path 为从一级标题到本章节标题的路径，
+        level 为本章节标题级别（没有标题时为 0），kind 为 "section" 或 "front_matter"，
+        start / end 为 text 在 UTF-8 编码的原文中的字节偏移
+    """
+    ascii_only = content.isascii()
+    # 上一个章节结尾的 (字符位置, 字节位置)；章节之间只有 ASCII 空白，每个章节只编码一次
+    last_char = last_byte = 0
+
+    def make_section(start: int, end: int, kind: str) -> Optional[Dict]:
+        nonlocal last_char, last_byte
+        text = content[start:end]
+        stripped = text.strip(_BLANK)
+        if not stripped:
+            return None
+        left = start + len(text) - len(text.lstrip(_BLANK))
+        if ascii_only:
+            byte_start, byte_end = left, left + len(stripped)
+        else:
+            byte_start = last_byte + left - last_char
+            byte_end = byte_start + len(stripped.encode("utf-8"))
+            last_char, last_byte = left + len(stripped), byte_end
+        return {
+            "text": stripped,
+            "heading_path": [title for _, title in headings],
+            "level": headings[-1][0] if headings else 0,
+            "kind": kind,
+            "start": byte_start,
+            "end": byte_end
+        }
+
+    headings: List[tuple] = []
+    section_start = floor = 0
+    front_matter = _FRONT_MATTER.match(content)
+    if front_matter:
+        section = make_section(0, front_matter.end(), "front_matter")
+        if section:
+            yield section
+        section_start = floor = front_matter.end()
+
+    match = _FIRST_BLOCK_LINE.match(content, section_start) or _BLOCK_LINE.search(content, section_start)
+    while match:
+        line_start, line_end = match.start("line"), match.end()
+        marker, info, atx, title, underline = match.group("fence", "info", "atx", "title", "setext")
+        match = None
+        if marker:
+            if not (marker[0] == "`" and "`" in info):
+                # 直接跳到闭合围栏，代码块内的 # 注释等不再逐个匹配；没有闭合时代码块延续到文末
+                closing = _closing_fence(marker).search(content, line_end)
+                line_end = closing.end() if closing else len(content)
+                floor = line_end + 1
+            match = _BLOCK_LINE.search(content, line_end)
+            continue
+
+        if atx:
+            level = len(atx)
+            title = title.strip() if title else ""
+            if title.endswith("#"):
+                title = _CLOSING_HASHES.sub("", title)
+            heading_start = line_start
+        else:
+            heading_start = _paragraph_start(content, floor, line_start)
+            floor = line_end + 1
+            match = _BLOCK_LINE.search(content, line_end)
+            if heading_start < 0:
+                continue
+            level = 1 if underline[0] == "=" else 2
+            title = " ".join(content[heading_start:line_start].split())
+
+        section = make_section(section_start, heading_start, "section")
+        if section:
+            yield section
+        while headings and headings[-1][0] >= level:
+            headings.pop()
+        headings.append((level, title))
+        section_start = heading_start
+        floor = line_end + 1
+        match = match or _BLOCK_LINE.search(content, line_end)
+
+    section = make_section(section_start, len(content), "section")
+    if section:
+        yield section
@@ -0,0 +1,1028 @@
+"""
+NumPy 向量存储 - 基于内存映射 .npy 文件的暴力检索后端，接口与 VectorStore 相同
+"""
+
+import os
+import time
+import shutil
+from typing import List, Dict, Union, Optional
+import numpy as np
+from config import NUMPY_STORE_DIR, COLLECTION_NAME, VECTOR_DIM, TOP_K, QUANTIZE_RERANK_FACTOR
+from src.vector_store import make_index_params, make_search_params, resolve_index_params, read_index_info, write_index_info
+from src.quantization import train_quantizer, encode, approx_scores, compression_ratio, recall_at_k
+
+
+# 每次矩阵乘法处理的最大行数（限制批量查询时得分矩阵与解码缓冲的内存占用）
+SEARCH_BLOCK_ROWS = 16384
+
+# 已删除行占比超过该值时，flush 会压缩存储文件
+COMPACT_RATIO = 0.3
+
+# 向量文件的最小容量（行数），之后按倍数扩容
+MIN_CAPACITY = 1024
+
+# IVF_FLAT 训练参数：每个聚类最多采样的行数与 k-means 迭代次数
+IVF_SAMPLES_PER_LIST = 256
+IVF_KMEANS_ITERATIONS = 10
+
+# 有效行数超过训练时的该倍数后重新训练聚类中心
+IVF_RETRAIN_GROWTH = 2.0
+
+# 有效行数超过量化参数训练时的该倍数后重新训练（之前的新行只按已有参数追加编码）
+QUANT_RETRAIN_GROWTH = 2.0
+
+# 量化参数训练的最大采样行数，以及评估 recall@k 时的查询数
+QUANT_TRAIN_SAMPLES = 100000
+QUANT_EVAL_QUERIES = 100
+
+# 元数据列名
+_COLUMNS = ("ids", "chunk_index", "file_idx", "text_offset", "text_length", "alive", "ivf_list")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    按行做 L2 归一化（零向量保持为零）
+
+    Args:
+        vectors: 向量数组 (n, dim)
+
+    Returns:
+        归一化后的 float32 数组
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class NumpyVectorStore:
+    """
+    NumPy 平铺向量存储
+
+    - vectors.npy: L2 归一化后的 float32 向量，以内存映射方式读写，按倍数扩容
+    - text.bin:    所有文本块的 UTF-8 内容顺序拼接
+    - meta.npz:    列式元数据（id、chunk_index、文件编号、文本偏移/长度、是否有效）与文件表
+    - codes.npy:   可选的压缩向量（float16 / int8 / 1-bit 二值），检索时只扫描它召回候选，
+                   再从 vectors.npy 读取候选的原始向量精排
+
+    检索时对所有向量做一次矩阵乘法得到余弦相似度，再用 argpartition 取 top-k。
+    IVF_FLAT 索引用球面 k-means 把向量分到 nlist 个聚类（聚类中心存放在 ivf.npy），
+    查询时只计算 nprobe 个最近聚类中的向量；不支持 HNSW（退化为 FLAT）。
+    删除只做标记，已删除行较多时在 flush 中压缩。
+    写入先在内存中累积元数据，flush（或进程退出）时原子地写入 meta.npz；
+    其他进程写入后，本进程在下一次访问时自动重新加载。
+    """
+
+    def __init__(self, store_dir: str = NUMPY_STORE_DIR, collection_name: str = COLLECTION_NAME):
+        """
+        初始化向量存储
+
+        Args:
+            store_dir: 存储根目录
+            collection_name: 集合名称（每个集合一个子目录）
+        """
+        self.store_dir = store_dir
+        self.collection_name = collection_name
+        self.dir = os.path.join(store_dir, collection_name)
+        self.vectors_path = os.path.join(self.dir, "vectors.npy")
+        self.text_path = os.path.join(self.dir, "text.bin")
+        self.meta_path = os.path.join(self.dir, "meta.npz")
+        self.index_info_path = os.path.join(self.dir, "index.json")
+        self.centroids_path = os.path.join(self.dir, "ivf.npy")
+        self.codes_path = os.path.join(self.dir, "codes.npy")
+        self.quant_path = os.path.join(self.dir, "quant.npz")
+        # 显式指定的索引配置；为 None 时沿用集合已有的索引（新集合使用 config 中的默认值）
+        self.index_params = None
+
+        self.vectors = None          # np.memmap (capacity, dim)
+        self.count = 0               # 已使用的行数（含已删除行）
+        self.columns = None          # 列名 -> np.ndarray（长度为 count）
+        self.files = []              # 文件编号 -> (source_file, file_path)
+        self.file_index = {}         # (source_file, file_path) -> 文件编号
+        self.row_of = {}             # id -> 行号
+        self.text_end = 0            # text.bin 的有效长度
+        self.centroids = None        # IVF_FLAT 聚类中心 (nlist, dim)
+        self.codes = None            # 压缩向量 np.memmap (capacity, ...)，前 codes_rows 行有效
+        self.quant = None            # 量化参数 {kind, scale}
+        self._codes_rows = 0         # 已编码的行数
+        self._quant_trained_rows = 0 # 训练量化参数时的有效行数
+        self._meta_stat = None
+        self._dirty = False
+        self._registered = False
+
+    def connect(self):
+        """
+        打开存储（已被其他进程更新时重新加载）
+        """
+        self._refresh()
+        if not self._registered:
+            import atexit
+            atexit.register(self.flush)
+            self._registered = True
+        return self
+
+    def _refresh(self):
+        """
+        meta.npz 被其他进程更新过时重新加载（本进程有未落盘的写入时不加载）
+        """
+        if self._dirty:
+            return
+        try:
+            st = os.stat(self.meta_path)
+        except FileNotFoundError:
+            self._reset_state()
+            return
+
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._meta_stat:
+            return
+
+        with np.load(self.meta_path) as data:
+            self.columns = {name: data[name] for name in _COLUMNS if name in data}
+            self.files = list(zip(data["file_source"].tolist(), data["file_path"].tolist()))
+            dimension = int(data["dimension"])
+
+        self.count = len(self.columns["ids"])
+        self.columns.setdefault("ivf_list", np.full(self.count, -1, dtype=np.int32))
+        self.file_index = {entry: i for i, entry in enumerate(self.files)}
+        self.row_of = {
+            int(record_id): row
+            for row, record_id in enumerate(self.columns["ids"])
+            if self.columns["alive"][row]
+        }
+        self.text_end = int((self.columns["text_offset"] + self.columns["text_length"]).max()) if self.count else 0
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+        if self.vectors.shape[1] != dimension:
+            raise ValueError(f"向量文件维度 {self.vectors.shape[1]} 与元数据 {dimension} 不一致")
+        self.centroids = np.load(self.centroids_path) if os.path.exists(self.centroids_path) else None
+        self._load_codes()
+        self._meta_stat = stat_key
+
+    def _load_codes(self):
+        """
+        加载压缩向量与量化参数（不存在时清空）
+        """
+        self.codes = None
+        self.quant = None
+        self._codes_rows = 0
+        self._quant_trained_rows = 0
+        if os.path.exists(self.codes_path) and os.path.exists(self.quant_path):
+            self.codes = np.load(self.codes_path, mmap_mode="r+")
+            with np.load(self.quant_path) as data:
+                scale = data["scale"]
+                self.quant = {"kind": str(data["kind"]), "scale": scale if scale.size else None}
+                # 旧版本没有记录行数：编码文件没有预留容量
+                self._codes_rows = min(int(data["rows"]), len(self.codes)) if "rows" in data else len(self.codes)
+                self._quant_trained_rows = int(data["trained_rows"]) if "trained_rows" in data else self._codes_rows
+
+    def _save_quant(self):
+        """
+        原子地写入量化参数、已编码行数和训练时的有效行数
+        """
+        tmp_quant = os.path.join(self.dir, "quant.tmp.npz")
+        np.savez(
+            tmp_quant,
+            kind=np.array(self.quant["kind"]),
+            scale=self.quant["scale"] if self.quant["scale"] is not None else np.zeros(0, dtype=np.float32),
+            rows=np.array(self._codes_rows),
+            trained_rows=np.array(self._quant_trained_rows)
+        )
+        os.replace(tmp_quant, self.quant_path)
+
+    @property
+    def codes_rows(self) -> int:
+        """
+        已编码的行数（之后写入的行检索时使用原始向量）
+        """
+        return 0 if self.codes is None else self._codes_rows
+
+    def _reset_state(self):
+        """
+        清空内存状态
+        """
+        self.vectors = None
+        self.count = 0
+        self.columns = None
+        self.files = []
+        self.file_index = {}
+        self.row_of = {}
+        self.text_end = 0
+        self.centroids = None
+        self.codes = None
+        self.quant = None
+        self._codes_rows = 0
+        self._quant_trained_rows = 0
+        self._meta_stat = None
+
+    @staticmethod
+    def _empty_columns() -> Dict[str, np.ndarray]:
+        """
+        创建空的元数据列
+        """
+        return {
+            "ids": np.zeros(0, dtype=np.int64),
+            "chunk_index": np.zeros(0, dtype=np.int32),
+            "file_idx": np.zeros(0, dtype=np.int32),
+            "text_offset": np.zeros(0, dtype=np.int64),
+            "text_length": np.zeros(0, dtype=np.int64),
+            "alive": np.zeros(0, dtype=bool),
+            "ivf_list": np.zeros(0, dtype=np.int32),
+        }
+
+    def create_collection(self, dimension: int = VECTOR_DIM, recreate: bool = False):
+        """
+        创建集合
+
+        Args:
+            dimension: 向量维度
+            recreate: 是否重新创建（删除旧集合）
+        """
+        self.connect()
+
+        if self.has_collection():
+            if recreate:
+                print(f"删除旧集合: {self.collection_name}")
+                self._reset_state()
+                self._dirty = False
+                shutil.rmtree(self.dir)
+            else:
+                print(f"集合已存在: {self.collection_name}")
+                return
+
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors = np.lib.format.open_memmap(
+            self.vectors_path, mode="w+", dtype=np.float32, shape=(MIN_CAPACITY, dimension)
+        )
+        open(self.text_path, "wb").close()
+        self.columns = self._empty_columns()
+        self._dirty = True
+        self.flush()
+        print(f"创建集合成功: {self.collection_name}, 维度: {dimension}")
+
+    def _ensure_capacity(self, rows: int):
+        """
+        向量文件容量不足时按倍数扩容（复制到新文件后原子替换）
+
+        Args:
+            rows: 需要的总行数
+        """
+        capacity, dimension = self.vectors.shape
+        if rows <= capacity:
+            return
+
+        new_capacity = max(rows, capacity * 2)
+        tmp_path = os.path.join(self.dir, "vectors.tmp.npy")
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, dimension)
+        )
+        grown[:self.count] = self.vectors[:self.count]
+        grown.flush()
+        del grown
+        self.vectors = None
+        os.replace(tmp_path, self.vectors_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+
+    def insert(self, vectors: Union[np.ndarray, List[List[float]]], metadata: List[Dict]) -> List[int]:
+        """
+        插入向量和元数据
+
+        Args:
+            vectors: 向量数组 (n, dim) 或向量列表
+            metadata: 元数据列表 [{chunk_text, source_file, file_path, chunk_index, id}]
+
+        Returns:
+            插入的 ID 列表
+        """
+        self.connect()
+        if self.vectors is None:
+            raise ValueError(f"集合不存在: {self.collection_name}")
+        if len(metadata) == 0:
+            return []
+
+        ids = []
+        for meta in metadata:
+            record_id = meta.get("id")
+            if record_id is None:
+                raise ValueError("metadata 中必须包含 'id' 字段")
+            ids.append(int(record_id))
+
+        # 与 Milvus 的 upsert 语义不同，插入已存在的 ID 时先删除旧行
+        self._mark_deleted([record_id for record_id in ids if record_id in self.row_of])
+
+        start = self.count
+        self._ensure_capacity(start + len(metadata))
+        self.vectors[start:start + len(metadata)] = _normalize(vectors)
+
+        encoded = [meta["chunk_text"].encode("utf-8") for meta in metadata]
+        lengths = np.array([len(data) for data in encoded], dtype=np.int64)
+        offsets = self.text_end + np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        with open(self.text_path, "r+b") as f:
+            f.seek(self.text_end)
+            f.write(b"".join(encoded))
+            f.truncate()
+        self.text_end += int(lengths.sum())
+
+        file_idx = []
+        for meta in metadata:
+            entry = (meta["source_file"], meta["file_path"])
+            if entry not in self.file_index:
+                self.file_index[entry] = len(self.files)
+                self.files.append(entry)
+            file_idx.append(self.file_index[entry])
+
+        new_columns = {
+            "ids": np.array(ids, dtype=np.int64),
+            "chunk_index": np.array([meta["chunk_index"] for meta in metadata], dtype=np.int32),
+            "file_idx": np.array(file_idx, dtype=np.int32),
+            "text_offset": offsets,
+            "text_length": lengths,
+            "alive": np.ones(len(metadata), dtype=bool),
+            "ivf_list": self._assign_lists(self.vectors[start:start + len(metadata)]),
+        }
+        for name, values in new_columns.items():
+            self.columns[name] = np.concatenate([self.columns[name], values])
+
+        for row, record_id in enumerate(ids, start):
+            self.row_of[record_id] = row
+        self.count += len(metadata)
+        self._dirty = True
+        return ids
+
+    def _mark_deleted(self, ids: List[int]) -> int:
+        """
+        把指定 ID 标记为已删除
+
+        Args:
+            ids: ID 列表
+
+        Returns:
+            实际删除的行数
+        """
+        rows = [self.row_of.pop(int(record_id)) for record_id in ids if int(record_id) in self.row_of]
+        if rows:
+            self.columns["alive"][rows] = False
+            self._dirty = True
+        return len(rows)
+
+    def delete(self, ids: List[int]) -> int:
+        """
+        按 ID 删除向量
+
+        Args:
+            ids: 要删除的 ID 列表
+
+        Returns:
+            删除的记录数
+        """
+        if not ids:
+            return 0
+
+        self.connect()
+        if self.vectors is None:
+            return 0
+        return self._mark_deleted(ids)
+
+    def has_collection(self) -> bool:
+        """
+        检查集合是否存在
+
+        Returns:
+            集合是否存在
+        """
+        self.connect()
+        return self.vectors is not None
+
+    def configure_index(self, index_params: Dict):
+        """
+        指定下一次 build_vector_index 使用的索引配置
+
+        Args:
+            index_params: make_index_params 的返回值
+        """
+        self.index_params = index_params
+
+    def get_index_info(self) -> Optional[Dict]:
+        """
+        获取当前生效的向量索引信息
+
+        Returns:
+            {index_type, params, quantization, build_seconds, built_at, rows, compression_ratio, recall}，未建立时返回 None
+        """
+        return read_index_info(self.index_info_path)
+
+    def _assign_lists(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        把（已归一化的）向量分配到最近的聚类中心，未训练时返回 -1
+
+        Args:
+            vectors: 向量数组 (n, dim)
+
+        Returns:
+            每行的聚类编号
+        """
+        if self.centroids is None:
+            return np.full(len(vectors), -1, dtype=np.int32)
+
+        lists = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS])
+            lists[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return lists
+
+    def _train_ivf(self, nlist: int) -> np.ndarray:
+        """
+        在有效行的采样上训练球面 k-means 聚类中心
+
+        Args:
+            nlist: 聚类中心数（不超过有效行数）
+
+        Returns:
+            归一化的聚类中心 (nlist, dim)
+        """
+        rng = np.random.default_rng(0)
+        alive_rows = np.flatnonzero(self.columns["alive"])
+        nlist = max(1, min(nlist, len(alive_rows)))
+        sample_size = min(len(alive_rows), nlist * IVF_SAMPLES_PER_LIST)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(alive_rows, sample_size, replace=False))])
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(IVF_KMEANS_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            # 空聚类重新随机取一个样本作为中心
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = sample[rng.choice(len(sample), len(empty))]
+            centroids = _normalize(sums)
+        return centroids
+
+    def build_vector_index(self) -> Optional[Dict]:
+        """
+        确保向量索引与配置一致：不存在或配置变化时（重新）构建，并记录构建耗时
+
+        IVF_FLAT 在有效行数增长到训练时的 IVF_RETRAIN_GROWTH 倍后重新训练，
+        否则沿用已有聚类（新行在写入时已分配）。
+        启用量化时同理：有效行数增长到训练时的 QUANT_RETRAIN_GROWTH 倍后重新训练量化参数、
+        编码全部行并报告压缩比和 recall@k，否则只用已有参数编码新写入的行。
+
+        Returns:
+            新构建的索引信息；索引已是最新时返回 None
+        """
+        self.connect()
+        if self.vectors is None:
+            return None
+
+        info = previous = self.get_index_info()
+        wanted = resolve_index_params(self.index_params, info)
+        quantization = wanted["quantization"]
+        if wanted["index_type"] == "HNSW":
+            print("   numpy 后端不支持 HNSW 索引，改用 FLAT")
+            wanted = make_index_params("FLAT", quantization=quantization)
+
+        start = time.perf_counter()
+        ivf_changed, trained_rows = self._build_ivf(wanted, info)
+        codes_changed = self._build_codes(quantization)
+        config_changed = (
+            info is None
+            or info["index_type"] != wanted["index_type"]
+            or info["params"] != wanted["params"]
+            or info.get("quantization", "none") != quantization
+        )
+        if not (ivf_changed or codes_changed or config_changed):
+            return None
+        self._dirty = True
+        build_seconds = time.perf_counter() - start
+
+        info = {
+            "index_type": wanted["index_type"],
+            "params": wanted["params"],
+            "quantization": quantization,
+            "build_seconds": round(build_seconds, 3),
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "rows": len(self.row_of),
+            "trained_rows": trained_rows
+        }
+        if quantization != "none" and not codes_changed and previous and previous.get("recall"):
+            # 量化参数没有重新训练：沿用上次的评估结果
+            info["compression_ratio"] = previous["compression_ratio"]
+            info["recall"] = previous["recall"]
+        elif quantization != "none":
+            info["compression_ratio"] = round(compression_ratio(quantization, self.vectors.shape[1]), 2)
+            info["recall"] = self._evaluate_recall()
+            print(
+                f"   压缩比 {info['compression_ratio']}x，recall@{info['recall']['k']}: "
+                f"压缩检索 {info['recall']['compressed']:.3f} / 精排后 {info['recall']['reranked']:.3f}"
+            )
+        write_index_info(self.index_info_path, info)
+        return info
+
+    def _build_ivf(self, wanted: Dict, info: Optional[Dict]):
+        """
+        按需训练 IVF_FLAT 聚类中心并分配各行
+
+        Args:
+            wanted: 目标索引配置
+            info: 当前索引信息
+
+        Returns:
+            (是否重新训练或移除了聚类, 训练时的有效行数)
+        """
+        rows = len(self.row_of)
+        if wanted["index_type"] != "IVF_FLAT":
+            if self.centroids is None:
+                return False, 0
+            self.centroids = None
+            self.columns["ivf_list"][:] = -1
+            os.remove(self.centroids_path)
+            return True, 0
+
+        trained_rows = info.get("trained_rows", info.get("rows", 0)) if info else 0
+        same_config = info is not None and info["index_type"] == "IVF_FLAT" and info["params"] == wanted["params"]
+        if same_config and self.centroids is not None and rows <= trained_rows * IVF_RETRAIN_GROWTH:
+            # 新写入的行在 insert 时已分配到已有聚类，这里只补齐遗漏的行
+            unassigned = np.flatnonzero(self.columns["ivf_list"] < 0)
+            if len(unassigned):
+                self.columns["ivf_list"][unassigned] = self._assign_lists(self.vectors[unassigned])
+                self._dirty = True
+            return False, trained_rows
+
+        print(f"\n🧭 训练 IVF_FLAT 聚类中心: nlist={wanted['params']['nlist']}, 有效行数 {rows}")
+        self.centroids = self._train_ivf(wanted["params"]["nlist"]) if rows else None
+        self.columns["ivf_list"] = self._assign_lists(self.vectors[:self.count])
+        if self.centroids is not None:
+            tmp_path = os.path.join(self.dir, "ivf.tmp.npy")
+            np.save(tmp_path, self.centroids)
+            os.replace(tmp_path, self.centroids_path)
+        elif os.path.exists(self.centroids_path):
+            os.remove(self.centroids_path)
+        return True, rows
+
+    def _build_codes(self, kind: str) -> bool:
+        """
+        按需训练量化参数并编码
+
+        量化方式不变且有效行数没有超过训练时的 QUANT_RETRAIN_GROWTH 倍时，
+        只用已有参数编码新写入的行并追加；否则重新训练并编码全部行。
+
+        Args:
+            kind: 量化方式（"none" 表示移除压缩向量）
+
+        Returns:
+            是否重新训练或移除了压缩向量（只追加编码时返回 False）
+        """
+        if kind == "none" or self.count == 0:
+            if self.codes is None:
+                return False
+            self.codes = None
+            self.quant = None
+            for path in (self.codes_path, self.quant_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return True
+
+        alive_rows = np.flatnonzero(self.columns["alive"])
+        if (
+            self.quant is not None
+            and self.quant["kind"] == kind
+            and len(alive_rows) <= self._quant_trained_rows * QUANT_RETRAIN_GROWTH
+        ):
+            if self.codes_rows < self.count:
+                self._append_codes()
+            return False
+
+        print(f"\n🗜️  量化编码向量: {kind}（{self.count} 行）")
+        rng = np.random.default_rng(0)
+        trained_rows = len(alive_rows)
+        if len(alive_rows) > QUANT_TRAIN_SAMPLES:
+            alive_rows = np.sort(rng.choice(alive_rows, QUANT_TRAIN_SAMPLES, replace=False))
+        params = train_quantizer(kind, self.vectors[alive_rows])
+        if params["kind"] == "int8" and params["scale"] is None:
+            params["scale"] = np.ones(self.vectors.shape[1], dtype=np.float32)
+
+        # 与向量文件容量相同，之后写入的行可以直接追加
+        sample_codes = encode(params, self.vectors[:1])
+        tmp_codes = os.path.join(self.dir, "codes.tmp.npy")
+        codes = np.lib.format.open_memmap(
+            tmp_codes, mode="w+", dtype=sample_codes.dtype, shape=(len(self.vectors), sample_codes.shape[1])
+        )
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, self.count)
+            codes[start:stop] = encode(params, self.vectors[start:stop])
+        codes.flush()
+        del codes
+
+        self.codes = None
+        os.replace(tmp_codes, self.codes_path)
+        self.quant = params
+        self._codes_rows = self.count
+        self._quant_trained_rows = trained_rows
+        self._save_quant()
+        self._load_codes()
+        return True
+
+    def _append_codes(self):
+        """
+        用已有量化参数编码 [codes_rows, count) 行并写入压缩向量文件（容量不足时扩容）
+        """
+        start_row = self.codes_rows
+        if len(self.codes) < self.count:
+            capacity = max(self.count, len(self.vectors))
+            tmp_codes = os.path.join(self.dir, "codes.tmp.npy")
+            grown = np.lib.format.open_memmap(
+                tmp_codes, mode="w+", dtype=self.codes.dtype, shape=(capacity, self.codes.shape[1])
+            )
+            grown[:start_row] = self.codes[:start_row]
+            grown.flush()
+            del grown
+            self.codes = None
+            os.replace(tmp_codes, self.codes_path)
+            self.codes = np.load(self.codes_path, mmap_mode="r+")
+
+        for start in range(start_row, self.count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, self.count)
+            self.codes[start:stop] = encode(self.quant, self.vectors[start:stop])
+        self.codes.flush()
+        self._codes_rows = self.count
+        self._save_quant()
+
+    def _evaluate_recall(self, k: int = TOP_K) -> Dict:
+        """
+        用采样查询评估压缩检索相对未压缩暴力检索的 recall@k
+
+        查询取两个随机有效行的归一化平均（与库内向量分布相近，但不与任何一行完全相同）。
+
+        Args:
+            k: 评估的返回数量
+
+        Returns:
+            {k, queries, compressed, reranked}
+        """
+        alive_rows = np.flatnonzero(self.columns["alive"])
+        k = min(k, len(alive_rows))
+        if k == 0:
+            return {"k": 0, "queries": 0, "compressed": 1.0, "reranked": 1.0}
+
+        rng = np.random.default_rng(0)
+        pairs = rng.choice(alive_rows, (min(QUANT_EVAL_QUERIES, len(alive_rows)), 2))
+        queries = _normalize(np.asarray(self.vectors[pairs[:, 0]]) + np.asarray(self.vectors[pairs[:, 1]]))
+
+        _, exact = self._search_flat(queries, k, use_codes=False)
+        _, compressed = self._search_flat(queries, k, rerank=False)
+        _, reranked = self._search_flat(queries, k)
+        return {
+            "k": k,
+            "queries": len(queries),
+            "compressed": round(recall_at_k(exact, compressed), 4),
+            "reranked": round(recall_at_k(exact, reranked), 4)
+        }
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int = TOP_K,
+        search_params: Optional[Dict] = None
+    ) -> List[Dict]:
+        """
+        相似度搜索
+
+        Args:
+            query_vector: 查询向量
+            top_k: 返回结果数量
+            search_params: 查询参数覆盖值 {nprobe}（None 表示使用 config 默认值）
+
+        Returns:
+            搜索结果列表 [{id, score, text, source_file, file_path, chunk_index}]，score 为余弦相似度（越大越相关）
+        """
+        return self.search_batch([query_vector], top_k, search_params)[0]
+
+    def search_batch(
+        self,
+        query_vectors: Union[np.ndarray, List[List[float]]],
+        top_k: int = TOP_K,
+        search_params: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        批量相似度搜索：FLAT 为分块矩阵乘法 + argpartition，IVF_FLAT 只计算探测聚类内的行
+
+        Args:
+            query_vectors: 查询向量列表或 (n, dim) 数组
+            top_k: 每个查询返回的结果数量
+            search_params: 查询参数覆盖值 {nprobe}（None 表示使用 config 默认值）
+
+        Returns:
+            与查询向量一一对应的搜索结果列表
+        """
+        if len(query_vectors) == 0:
+            return []
+
+        self.connect()
+        if self.vectors is None or not self.row_of or top_k <= 0:
+            return [[] for _ in range(len(query_vectors))]
+
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        k = min(top_k, len(self.row_of))
+
+        if self.centroids is not None:
+            nprobe = make_search_params("IVF_FLAT", top_k, search_params)["nprobe"]
+            top_scores, top_rows = self._search_ivf(queries, k, nprobe)
+        else:
+            top_scores, top_rows = self._search_flat(queries, k)
+
+        formatted_results = []
+        with open(self.text_path, "rb") as f:
+            for scores, rows in zip(top_scores, top_rows):
+                hits = []
+                for score, row in zip(scores, rows):
+                    if not np.isfinite(score):
+                        continue
+                    hits.append(self._format_hit(f, int(row), float(score)))
+                formatted_results.append(hits)
+        return formatted_results
+
+    def get(self, ids: List[int], query_vector: Union[np.ndarray, List[float]]) -> List[Dict]:
+        """
+        按 ID 读取文本块，并计算与查询向量的相似度（用于补全只被关键词检索命中的结果）
+
+        Args:
+            ids: 分块 ID 列表
+            query_vector: 查询向量
+
+        Returns:
+            搜索结果列表（与 search 的格式相同，跳过不存在的 ID）
+        """
+        self.connect()
+        if self.vectors is None:
+            return []
+
+        query = _normalize(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+        hits = []
+        with open(self.text_path, "rb") as f:
+            for record_id in ids:
+                row = self.row_of.get(int(record_id))
+                if row is not None:
+                    hits.append(self._format_hit(f, row, float(self.vectors[row] @ query)))
+        return hits
+
+    def _candidate_count(self, k: int, use_codes: bool, rerank: bool) -> int:
+        """
+        召回阶段的候选数：使用压缩向量且需要精排时多召回 QUANTIZE_RERANK_FACTOR 倍
+        """
+        if use_codes and rerank and self.codes is not None:
+            return min(self.count, k * QUANTIZE_RERANK_FACTOR)
+        return k
+
+    def _block_scores(self, queries: np.ndarray, start: int, stop: int, use_codes: bool) -> np.ndarray:
+        """
+        计算一段连续行的得分（已编码的行用压缩向量得到近似分，其余用原始向量）
+        """
+        if use_codes and self.codes is not None and stop <= self.codes_rows:
+            return approx_scores(self.quant, queries, self.codes[start:stop])
+        return queries @ self.vectors[start:stop].T
+
+    def _subset_scores(self, query: np.ndarray, rows: np.ndarray, use_codes: bool) -> np.ndarray:
+        """
+        计算任意行集合的得分（已编码的行用压缩向量得到近似分，其余用原始向量）
+        """
+        if not use_codes or self.codes is None:
+            return np.asarray(self.vectors[rows]) @ query
+
+        scores = np.empty(len(rows), dtype=np.float32)
+        coded = rows < self.codes_rows
+        if coded.any():
+            scores[coded] = approx_scores(self.quant, query[None, :], self.codes[rows[coded]])[0]
+        if not coded.all():
+            scores[~coded] = np.asarray(self.vectors[rows[~coded]]) @ query
+        return scores
+
+    def _rerank(self, queries: np.ndarray, cand_scores: np.ndarray, cand_rows: np.ndarray, k: int):
+        """
+        用原始向量对候选重新打分并取 top-k
+
+        Args:
+            queries: 归一化的查询向量 (b, dim)
+            cand_scores: 候选近似得分 (b, n)，-inf 表示无效候选
+            cand_rows: 候选行号 (b, n)
+            k: 返回数量
+
+        Returns:
+            (得分 (b, k), 行号 (b, k))
+        """
+        exact = np.full(cand_scores.shape, -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            valid = np.isfinite(cand_scores[i])
+            exact[i, valid] = np.asarray(self.vectors[cand_rows[i][valid]]) @ query
+        return self._select_top(exact, cand_rows, k)
+
+    def _search_flat(self, queries: np.ndarray, k: int, use_codes: bool = True, rerank: bool = True):
+        """
+        暴力检索所有行（有压缩向量时先用它召回候选，再精排）
+
+        Args:
+            queries: 归一化的查询向量 (b, dim)
+            k: 返回数量
+            use_codes: 是否使用压缩向量召回
+            rerank: 使用压缩向量时是否用原始向量精排
+
+        Returns:
+            (得分 (b, k), 行号 (b, k))，按得分降序
+        """
+        alive = self.columns["alive"]
+        candidates = self._candidate_count(k, use_codes, rerank)
+
+        # 已编码与未编码的行分在不同分块中
+        bounds = sorted(set(range(0, self.count, SEARCH_BLOCK_ROWS)) | {self.codes_rows, self.count})
+        bounds = [bound for bound in bounds if bound <= self.count]
+
+        # 每个分块各自取候选，最后在候选中再取一次
+        cand_scores, cand_rows = [], []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if start == stop:
+                continue
+            scores = self._block_scores(queries, start, stop, use_codes)
+            scores[:, ~alive[start:stop]] = -np.inf
+            block_k = min(candidates, stop - start)
+            part = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+            cand_scores.append(np.take_along_axis(scores, part, axis=1))
+            cand_rows.append(part + start)
+
+        cand_scores, cand_rows = self._select_top(
+            np.concatenate(cand_scores, axis=1), np.concatenate(cand_rows, axis=1), candidates
+        )
+        if candidates > k:
+            return self._rerank(queries, cand_scores, cand_rows, k)
+        return cand_scores[:, :k], cand_rows[:, :k]
+
+    def _search_ivf(self, queries: np.ndarray, k: int, nprobe: int):
+        """
+        只在每个查询最近的 nprobe 个聚类内检索（有压缩向量时先召回候选，再精排）
+
+        Args:
+            queries: 归一化的查询向量 (b, dim)
+            k: 返回数量
+            nprobe: 探测的聚类数
+
+        Returns:
+            (得分 (b, k), 行号 (b, k))，按得分降序，候选不足时以 -inf 补齐
+        """
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        lists = self.columns["ivf_list"][:self.count]
+        alive = self.columns["alive"]
+        candidates = self._candidate_count(k, True, True)
+
+        cand_scores = np.full((len(queries), candidates), -np.inf, dtype=np.float32)
+        cand_rows = np.zeros((len(queries), candidates), dtype=np.int64)
+        for i, query in enumerate(queries):
+            rows = np.flatnonzero(np.isin(lists, probes[i]) & alive)
+            if len(rows) == 0:
+                continue
+            scores = self._subset_scores(query, rows, use_codes=True)
+            row_k = min(candidates, len(rows))
+            scores_k, rows_k = self._select_top(scores[None, :], rows[None, :], row_k)
+            cand_scores[i, :row_k] = scores_k[0]
+            cand_rows[i, :row_k] = rows_k[0]
+
+        if candidates > k:
+            return self._rerank(queries, cand_scores, cand_rows, k)
+        return cand_scores, cand_rows
+
+    @staticmethod
+    def _select_top(scores: np.ndarray, rows: np.ndarray, k: int):
+        """
+        在候选中用 argpartition 取 top-k 并按得分降序排列
+
+        Args:
+            scores: 候选得分 (b, n)
+            rows: 候选行号 (b, n)
+            k: 返回数量
+
+        Returns:
+            (得分 (b, k), 行号 (b, k))
+        """
+        if scores.shape[1] > k:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, part, axis=1)
+            rows = np.take_along_axis(rows, part, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def _format_hit(self, text_file, row: int, score: float) -> Dict:
+        """
+        读取一行的元数据并组装为搜索结果
+
+        Args:
+            text_file: 已打开的 text.bin
+            row: 行号
+            score: 余弦相似度
+
+        Returns:
+            搜索结果字典
+        """
+        text_file.seek(int(self.columns["text_offset"][row]))
+        text = text_file.read(int(self.columns["text_length"][row])).decode("utf-8")
+        source_file, file_path = self.files[int(self.columns["file_idx"][row])]
+        return {
+            "id": int(self.columns["ids"][row]),
+            "score": score,
+            "text": text,
+            "source_file": source_file,
+            "file_path": file_path,
+            "chunk_index": int(self.columns["chunk_index"][row])
+        }
+
+    def get_collection_stats(self) -> Dict:
+        """
+        获取集合统计信息
+
+        Returns:
+            统计信息字典
+        """
+        self.connect()
+
+        if self.vectors is None:
+            return {"exists": False, "count": 0}
+
+        return {
+            "exists": True,
+            "count": len(self.row_of)
+        }
+
+    def _compact(self):
+        """
+        去掉已删除的行，重写向量文件与文本文件（需在 flush 中调用）
+        """
+        keep = np.flatnonzero(self.columns["alive"])
+        dimension = self.vectors.shape[1]
+
+        tmp_vectors = os.path.join(self.dir, "vectors.tmp.npy")
+        compacted = np.lib.format.open_memmap(
+            tmp_vectors, mode="w+", dtype=np.float32, shape=(max(MIN_CAPACITY, len(keep)), dimension)
+        )
+        compacted[:len(keep)] = self.vectors[keep]
+        compacted.flush()
+        del compacted
+
+        tmp_text = os.path.join(self.dir, "text.tmp.bin")
+        offsets = np.zeros(len(keep), dtype=np.int64)
+        position = 0
+        with open(self.text_path, "rb") as src, open(tmp_text, "wb") as dst:
+            for i, row in enumerate(keep):
+                src.seek(int(self.columns["text_offset"][row]))
+                data = src.read(int(self.columns["text_length"][row]))
+                dst.write(data)
+                offsets[i] = position
+                position += len(data)
+
+        if self.codes is not None:
+            # 只保留已编码的行对应的编码，之后的行检索时使用原始向量
+            coded_keep = keep[keep < self.codes_rows]
+            tmp_codes = os.path.join(self.dir, "codes.tmp.npy")
+            np.save(tmp_codes, np.asarray(self.codes[coded_keep]))
+            self.codes = None
+            os.replace(tmp_codes, self.codes_path)
+            self._codes_rows = len(coded_keep)
+            self._save_quant()
+            self._load_codes()
+
+        self.vectors = None
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_text, self.text_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+
+        self.columns = {name: values[keep] for name, values in self.columns.items()}
+        self.columns["text_offset"] = offsets
+        self.count = len(keep)
+        self.text_end = position
+        self.row_of = {int(record_id): row for row, record_id in enumerate(self.columns["ids"])}
+
+    def flush(self):
+        """
+        把元数据原子地写入 meta.npz（已删除行较多时先压缩）
+        """
+        if not self._dirty or self.vectors is None:
+            return
+
+        dead = self.count - len(self.row_of)
+        if self.count and dead / self.count > COMPACT_RATIO:
+            self._compact()
+
+        self.vectors.flush()
+        tmp_path = os.path.join(self.dir, "meta.tmp.npz")
+        np.savez(
+            tmp_path,
+            dimension=np.int64(self.vectors.shape[1]),
+            file_source=np.array([entry[0] for entry in self.files], dtype=str),
+            file_path=np.array([entry[1] for entry in self.files], dtype=str),
+            **self.columns
+        )
+        os.replace(tmp_path, self.meta_path)
+        st = os.stat(self.meta_path)
+        self._meta_stat = (st.st_mtime_ns, st.st_size)
+        self._dirty = False
+
+    def close(self):
+        """
+        落盘并释放内存映射
+        """
+        self.flush()
+        self._reset_state()
@@ -0,0 +1,338 @@
+"""
+ONNX Runtime Embedding 后端 - 一次导出、可选 int8 量化、运行时不依赖 torch
+"""
+
+import os
+import re
+import sys
+import json
+import subprocess
+from pathlib import Path
+from typing import List, Dict, Optional
+import numpy as np
+from config import ONNX_CACHE_DIR
+
+
+# 导出时用于评估与 torch 后端一致性的探测文本
+PROBE_TEXTS = [
+    "如何使用 Docker 构建镜像？",
+    "git rebase 和 git merge 有什么区别",
+    "Python 虚拟环境的创建与激活方法",
+    "docker run -d -p 8080:80 --name web nginx",
+    "How do I undo the last commit without losing changes?",
+    "List comprehensions are a concise way to create lists in Python.",
+    "容器与虚拟机相比更加轻量，启动速度更快。",
+    "pip install -r requirements.txt",
+]
+
+# ONNX 输入名 -> tokenizers.Encoding 属性名
+_ENCODING_FIELDS = {
+    "input_ids": "ids",
+    "attention_mask": "attention_mask",
+    "token_type_ids": "type_ids",
+}
+
+
+def get_export_dir(model_name: str, quantize: bool, cache_dir: str = ONNX_CACHE_DIR) -> str:
+    """
+    获取模型导出目录
+
+    Args:
+        model_name: 模型名称
+        quantize: 是否为 int8 量化版本
+        cache_dir: 导出缓存根目录
+
+    Returns:
+        导出目录路径
+    """
+    name = re.sub(r"[^\w.-]+", "__", model_name)
+    return os.path.join(cache_dir, name + ("-int8" if quantize else ""))
+
+
+def read_export_meta(model_name: str, quantize: bool) -> Optional[Dict]:
+    """
+    读取导出元信息（不加载模型）
+
+    Args:
+        model_name: 模型名称
+        quantize: 是否为 int8 量化版本
+
+    Returns:
+        元信息字典，未导出时返回 None
+    """
+    meta_path = os.path.join(get_export_dir(model_name, quantize), "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_onnx(model_name: str, quantize: bool) -> Dict:
+    """
+    把 SentenceTransformer 模型导出为 ONNX（需要 torch，仅首次运行）
+
+    Args:
+        model_name: 模型名称
+        quantize: 是否额外做动态 int8 量化
+
+    Returns:
+        导出元信息
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = get_export_dir(model_name, quantize)
+    os.makedirs(out_dir, exist_ok=True)
+
+    print(f"正在导出 ONNX 模型: {model_name} -> {out_dir}")
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    # 池化方式与是否归一化与 SentenceTransformer 的模块配置保持一致
+    pooling = "mean"
+    normalize = False
+    for module in st_model:
+        if hasattr(module, "get_config_dict") and "pooling_mode_mean_tokens" in module.get_config_dict():
+            config = module.get_config_dict()
+            if config.get("pooling_mode_cls_token"):
+                pooling = "cls"
+            elif config.get("pooling_mode_max_tokens"):
+                pooling = "max"
+        if type(module).__name__ == "Normalize":
+            normalize = True
+
+    sample = tokenizer(["probe"], return_tensors="pt")
+    input_names = [name for name in _ENCODING_FIELDS if name in sample]
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    fp32_path = os.path.join(out_dir, "model_fp32.onnx" if quantize else "model.onnx")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(transformer),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, os.path.join(out_dir, "model.onnx"), weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+
+    tokenizer.save_pretrained(out_dir)
+
+    meta = {
+        "model_name": model_name,
+        "quantized": quantize,
+        "pooling": pooling,
+        "normalize": normalize,
+        "max_seq_length": st_model.max_seq_length,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+        "input_names": input_names,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    # 与 torch 后端比较余弦一致性
+    reference = st_model.encode(PROBE_TEXTS, convert_to_numpy=True)
+    candidate = OnnxEncoder(out_dir).encode(PROBE_TEXTS)
+    meta["agreement"] = cosine_agreement(reference, candidate)
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    print(
+        f"ONNX 导出完成，与 torch 后端的余弦一致性: "
+        f"平均 {meta['agreement']['mean']:.4f} / 最低 {meta['agreement']['min']:.4f}"
+    )
+    return meta
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> Dict:
+    """
+    计算两组向量逐行的余弦相似度
+
+    Args:
+        reference: 参考向量 (n, dim)
+        candidate: 待比较向量 (n, dim)
+
+    Returns:
+        {mean, min, samples}
+    """
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(ref * cand, axis=1)
+    return {
+        "mean": float(cosines.mean()),
+        "min": float(cosines.min()),
+        "samples": int(len(cosines))
+    }
+
+
+def ensure_export(model_name: str, quantize: bool) -> str:
+    """
+    确保模型已导出；未导出时在子进程中导出，当前进程不导入 torch
+
+    Args:
+        model_name: 模型名称
+        quantize: 是否为 int8 量化版本
+
+    Returns:
+        导出目录路径
+    """
+    out_dir = get_export_dir(model_name, quantize)
+    if read_export_meta(model_name, quantize) is None:
+        project_root = str(Path(__file__).resolve().parent.parent)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [project_root, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "src.onnx_backend", model_name]
+        if quantize:
+            command.append("--quantize")
+        subprocess.run(command, env=env, check=True)
+    return out_dir
+
+
+def load_tokenizer(export_dir: str, max_seq_length: int):
+    """
+    加载导出目录中的快速分词器（按模型最大长度截断，不填充）
+
+    Args:
+        export_dir: 导出目录
+        max_seq_length: 模型最大序列长度
+
+    Returns:
+        tokenizers.Tokenizer
+    """
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(os.path.join(export_dir, "tokenizer.json"))
+    tokenizer.enable_truncation(max_length=max_seq_length)
+    tokenizer.no_padding()
+    return tokenizer
+
+
+class OnnxEncoder:
+    """
+    基于 onnxruntime 的句向量编码器
+
+    提供与 SentenceTransformer 相同的 encode / get_sentence_embedding_dimension 接口。
+    """
+
+    def __init__(self, export_dir: str, num_threads: int = 0):
+        """
+        加载导出的模型与分词器
+
+        Args:
+            export_dir: 导出目录
+            num_threads: intra-op 线程数（0 表示由 onnxruntime 决定）
+        """
+        import onnxruntime
+
+        with open(os.path.join(export_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(export_dir, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+
+        self.max_seq_length = self.meta["max_seq_length"]
+        self.tokenizer = load_tokenizer(export_dir, self.max_seq_length)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """
+        获取向量维度
+        """
+        return self.meta["dimension"]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        编码一个批次
+        """
+        encodings = self.tokenizer.encode_batch(texts)
+        longest = max(len(e.ids) for e in encodings)
+
+        # 按批内最长序列填充
+        feeds = {}
+        for name in self.meta["input_names"]:
+            pad_value = self.meta["pad_token_id"] if name == "input_ids" else 0
+            array = np.full((len(encodings), longest), pad_value, dtype=np.int64)
+            for row, encoding in enumerate(encodings):
+                values = getattr(encoding, _ENCODING_FIELDS[name])
+                array[row, :len(values)] = values
+            feeds[name] = array
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+
+        mask = np.zeros((len(encodings), longest, 1), dtype=np.float32)
+        for row, encoding in enumerate(encodings):
+            mask[row, :len(encoding.ids)] = 1.0
+
+        if self.meta["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        elif self.meta["pooling"] == "max":
+            pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+        else:
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.meta["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True
+    ) -> np.ndarray:
+        """
+        编码文本（与 SentenceTransformer 一样先按长度排序以减少填充）
+
+        Args:
+            texts: 文本列表
+            batch_size: 批大小
+            show_progress_bar: 兼容参数（不使用）
+            convert_to_numpy: 兼容参数（总是返回 numpy）
+
+        Returns:
+            向量数组
+        """
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        order = np.argsort([-len(text) for text in texts])
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for i in range(0, len(texts), batch_size):
+            batch_idx = order[i:i + batch_size]
+            embeddings[batch_idx] = self._encode_batch([texts[j] for j in batch_idx])
+        return embeddings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="导出 ONNX Embedding 模型")
+    parser.add_argument("model_name", help="SentenceTransformer 模型名称")
+    parser.add_argument("--quantize", action="store_true", help="导出后做动态 int8 量化")
+    args = parser.parse_args()
+    export_onnx(args.model_name, args.quantize)
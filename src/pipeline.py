@@ -0,0 +1,242 @@
+"""
+索引流水线 - 读取/分割、向量化、写入三个阶段并发执行
+"""
+
+import time
+import queue
+import threading
+from typing import Callable, Dict, Iterable, List
+from config import PIPELINE_QUEUE_SIZE
+
+
+# 队列结束标记
+_END = object()
+
+
+class StageStats:
+    """
+    单个阶段的运行统计
+    """
+
+    def __init__(self, name: str):
+        """
+        初始化阶段统计
+
+        Args:
+            name: 阶段名称
+        """
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.max_queue_depth = 0
+
+    def record_queue_depth(self, depth: int):
+        """
+        记录阶段取数时输入队列的深度
+
+        Args:
+            depth: 队列中等待的批次数
+        """
+        self.depth_samples += 1
+        self.depth_total += depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_batch(self, items: int, seconds: float):
+        """
+        记录一个批次的处理耗时
+
+        Args:
+            items: 批次中的文本块数
+            seconds: 处理耗时（秒）
+        """
+        self.items += items
+        self.batches += 1
+        self.busy_seconds += seconds
+
+    def to_dict(self, wall_seconds: float) -> Dict:
+        """
+        导出统计结果
+
+        Args:
+            wall_seconds: 流水线总耗时
+
+        Returns:
+            统计字典
+        """
+        return {
+            "name": self.name,
+            "items": self.items,
+            "batches": self.batches,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "throughput": round(self.items / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+            "utilization": round(self.busy_seconds / wall_seconds, 3) if wall_seconds else 0.0,
+            "avg_queue_depth": round(self.depth_total / self.depth_samples, 2) if self.depth_samples else 0.0,
+            "max_queue_depth": self.max_queue_depth
+        }
+
+
+class IndexPipeline:
+    """
+    三阶段索引流水线
+
+    读取/分割线程 -> [有界队列] -> 向量化（调用线程） -> [有界队列] -> 写入线程。
+    写入第 N 批的同时向量化第 N+1 批，磁盘读取与模型计算也相互重叠。
+    """
+
+    def __init__(self, queue_size: int = PIPELINE_QUEUE_SIZE):
+        """
+        初始化流水线
+
+        Args:
+            queue_size: 阶段之间队列的最大批次数（限制内存占用）
+        """
+        self.queue_size = max(1, queue_size)
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """
+        向队列放入元素，流水线中止时放弃
+
+        Returns:
+            是否放入成功
+        """
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue, stats: StageStats):
+        """
+        从队列取出元素，流水线中止时返回结束标记
+        """
+        stats.record_queue_depth(q.qsize())
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, error: BaseException):
+        """
+        记录异常并通知其他阶段停止
+        """
+        self._errors.append(error)
+        self._stop.set()
+
+    def run(
+        self,
+        batches: Iterable[List[Dict]],
+        embed_fn: Callable[[List[Dict]], object],
+        insert_fn: Callable[[object, List[Dict]], None]
+    ) -> Dict:
+        """
+        运行流水线
+
+        Args:
+            batches: 产出文本块批次的迭代器（在读取线程中消费）
+            embed_fn: 向量化函数 embed_fn(chunks) -> vectors（在调用线程中执行）
+            insert_fn: 写入函数 insert_fn(vectors, chunks)（在写入线程中执行）
+
+        Returns:
+            {wall_seconds, stages: [阶段统计], bottleneck}
+        """
+        self._stop.clear()
+        self._errors = []
+
+        read_stats = StageStats("read+split")
+        embed_stats = StageStats("embed")
+        insert_stats = StageStats("insert")
+        chunk_queue = queue.Queue(self.queue_size)
+        vector_queue = queue.Queue(self.queue_size)
+
+        def reader():
+            try:
+                iterator = iter(batches)
+                while not self._stop.is_set():
+                    started = time.perf_counter()
+                    batch = next(iterator, _END)
+                    if batch is _END:
+                        break
+                    read_stats.record_batch(len(batch), time.perf_counter() - started)
+                    if not self._put(chunk_queue, batch):
+                        return
+            except BaseException as e:
+                self._fail(e)
+            finally:
+                self._put(chunk_queue, _END)
+
+        def inserter():
+            try:
+                while True:
+                    item = self._get(vector_queue, insert_stats)
+                    if item is _END:
+                        break
+                    vectors, batch = item
+                    started = time.perf_counter()
+                    insert_fn(vectors, batch)
+                    insert_stats.record_batch(len(batch), time.perf_counter() - started)
+            except BaseException as e:
+                self._fail(e)
+
+        wall_started = time.perf_counter()
+        reader_thread = threading.Thread(target=reader, name="index-reader", daemon=True)
+        inserter_thread = threading.Thread(target=inserter, name="index-inserter", daemon=True)
+        reader_thread.start()
+        inserter_thread.start()
+
+        try:
+            while True:
+                batch = self._get(chunk_queue, embed_stats)
+                if batch is _END:
+                    break
+                started = time.perf_counter()
+                vectors = embed_fn(batch)
+                embed_stats.record_batch(len(batch), time.perf_counter() - started)
+                if not self._put(vector_queue, (vectors, batch)):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(vector_queue, _END)
+            reader_thread.join()
+            inserter_thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        wall_seconds = time.perf_counter() - wall_started
+        stages = [s.to_dict(wall_seconds) for s in (read_stats, embed_stats, insert_stats)]
+        bottleneck = max(stages, key=lambda s: s["busy_seconds"])["name"] if stages else None
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "stages": stages,
+            "bottleneck": bottleneck
+        }
+
+
+def format_pipeline_stats(stats: Dict) -> List[str]:
+    """
+    把流水线统计格式化为可打印的文本行
+
+    Args:
+        stats: IndexPipeline.run 的返回值
+
+    Returns:
+        文本行列表
+    """
+    lines = [f"   流水线耗时 {stats['wall_seconds']:.2f}s，瓶颈阶段: {stats['bottleneck']}"]
+    for stage in stats["stages"]:
+        lines.append(
+            f"   - {stage['name']:<10} {stage['items']:>7} 块 | "
+            f"{stage['throughput']:>8.1f} 块/s | 利用率 {stage['utilization']:.0%} | "
+            f"输入队列 平均 {stage['avg_queue_depth']:.1f} / 最大 {stage['max_queue_depth']}"
+        )
+    return lines
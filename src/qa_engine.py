@@ -2,13 +2,68 @@
 问答引擎 - 检索与问答核心逻辑
 """
 
-from typing import List, Dict, Optional
+import time
+import itertools
+import threading
+import numpy as np
+from typing import List, Dict, Tuple, Optional, Iterable, Iterator
 from src.embedder import get_embedder
 from src.vector_store import get_vector_store
-from src.loader import load_md_files, get_file_stats
+from src.loader import load_md_files, load_md_paths
 from src.splitter import split_documents
 from src.ai_service import get_ai_service
-from config import TOP_K
+from src.manifest import IndexManifest
+from src.embedding_cache import EmbeddingCache, encode_with_cache
+from src.pipeline import IndexPipeline, format_pipeline_stats
+from src.embed_pool import create_encoder
+from src.query_cache import QueryCache, bump_index_generation
+from src.answer_cache import AnswerCache
+from src.lexical_index import get_lexical_index, reciprocal_rank_fusion
+from src.reranker import get_reranker
+from src.context_packer import get_context_packer
+from src.sentence_extractor import get_sentence_extractor
+from src.dedup import DuplicateIndex, DuplicateGroups
+from config import (
+    TOP_K,
+    QUERY_BATCH_SIZE,
+    QUERY_CACHE_ENABLED,
+    ANSWER_CACHE_ENABLED,
+    HYBRID_SEARCH_ENABLED,
+    HYBRID_CANDIDATE_FACTOR,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
+    CONTEXT_PACKING_ENABLED,
+    CONTEXT_TOKEN_BUDGET,
+    SENTENCE_EXTRACTION_ENABLED,
+    SENTENCE_KEEP_RATIO,
+    SENTENCE_NEIGHBOURS,
+    SENTENCE_MIN_SENTENCES,
+    DEDUP_ENABLED,
+    VECTOR_STORE_BACKEND,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_TOKEN_BUDGET,
+    EMBEDDING_WORKERS,
+    INDEX_BATCH_SIZE
+)
+
+
+def _iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """
+    把迭代器切分为固定大小的窗口
+    
+    Args:
+        items: 任意可迭代对象
+        batch_size: 窗口大小
+        
+    Yields:
+        每个窗口的元素列表
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
 
 
 class QAEngine:
@@ -22,112 +77,496 @@ class QAEngine:
         """
         self.embedder = get_embedder()
         self.vector_store = get_vector_store()
+        self.lexical_index = get_lexical_index()
         self.ai_service = None  # 延迟初始化
+        self.embedding_cache = EmbeddingCache(self.embedder.cache_key) if EMBEDDING_CACHE_ENABLED else None
+        self.query_cache = QueryCache(self.embedder.cache_key) if QUERY_CACHE_ENABLED else None
+        self.answer_cache = AnswerCache(self.embedder.cache_key) if ANSWER_CACHE_ENABLED else None
+        self.duplicate_groups = DuplicateGroups() if DEDUP_ENABLED else None
+        # 模型、分词器、向量存储、关键词索引和缓存都不是线程安全的：
+        # 常驻服务并发处理请求时，检索到打包的各阶段串行执行，只有大模型生成并发
+        self.lock = threading.RLock()
     
-    def build_index(self, docs_dir: str, recreate: bool = True) -> Dict:
+    def build_index(
+        self,
+        docs_dir: str,
+        recreate: bool = True,
+        incremental: bool = False,
+        workers: Optional[int] = None,
+        index_params: Optional[Dict] = None,
+        paths: Optional[List[str]] = None
+    ) -> Dict:
         """
         构建索引
         
+        文档读取、分割、向量化和插入以流水线方式按固定窗口进行，
+        峰值内存只与批大小有关，而与语料总量无关。
+        启用去重时，分割后近似相同的文本块只向量化和写入一个代表块。
+        写入时同步更新关键词倒排索引，写入完成后按配置（重新）构建向量索引。
+        
         Args:
             docs_dir: 文档目录路径
             recreate: 是否重新创建索引
+            incremental: 是否增量更新（仅处理新增、修改和删除的文件）
+            workers: Embedding 工作进程数（默认读取 EMBEDDING_WORKERS）
+            index_params: 向量索引配置（make_index_params 的返回值，None 表示沿用已有索引）
+            paths: 只处理这些文件（绝对路径，增量模式下有效）：存在的按内容哈希更新，
+                不存在的视为已删除，读取出错的保留原有分块；None 表示扫描整个目录
+            
+        Returns:
+            构建结果统计（unreadable_files 为读取出错、需要重试的文件）
+        """
+        if index_params is not None:
+            self.vector_store.configure_index(index_params)
+        
+        encoder = create_encoder(EMBEDDING_WORKERS if workers is None else workers, self.embedder)
+        try:
+            return self._build_index(docs_dir, recreate, incremental, encoder, paths)
+        finally:
+            if encoder is not self.embedder:
+                encoder.close()
+    
+    def _build_index(
+        self,
+        docs_dir: str,
+        recreate: bool,
+        incremental: bool,
+        encoder,
+        paths: Optional[List[str]] = None
+    ) -> Dict:
+        """
+        构建索引（build_index 的实现）
+        
+        Args:
+            docs_dir: 文档目录路径
+            recreate: 是否重新创建索引
+            incremental: 是否增量更新
+            encoder: 编码器（Embedder 或多进程 EmbeddingPool）
+            paths: 只处理的文件（None 表示扫描整个目录）
             
         Returns:
             构建结果统计
         """
-        # 1. 加载文档
-        print(f"\n📂 扫描目录: {docs_dir}")
-        documents = load_md_files(docs_dir)
-        file_stats = get_file_stats(documents)
-        print(f"   找到 {file_stats['total_files']} 个 md 文件, 共 {file_stats['total_chars']} 字符")
+        if not incremental:
+            paths = None
+        
+        # 1. 扫描文档（按需读取）；读取出错的文件不算删除，保留其旧分块
+        unreadable = []
+        if paths is None:
+            print(f"\n📂 扫描目录: {docs_dir}")
+            documents = load_md_files(docs_dir, unreadable)
+            first_doc = next(documents, None)
+            if first_doc is None:
+                return {"success": False, "message": "未找到任何 md 文件"}
+            documents = itertools.chain([first_doc], documents)
+        else:
+            print(f"\n📂 处理 {len(paths)} 个变化的文件: {docs_dir}")
+            documents = load_md_paths(paths, unreadable)
+        
+        # 2. 确定全量重建还是增量更新
+        manifest = IndexManifest()
+        dedup = DuplicateIndex() if DEDUP_ENABLED else None
+        full_rebuild = True
+        if incremental:
+            if not manifest.load():
+                print("   索引清单不存在或配置已变化，执行全量重建")
+            elif not self.vector_store.has_collection():
+                print("   集合不存在，执行全量重建")
+            elif not self.lexical_index.exists():
+                print("   关键词索引不存在，执行全量重建")
+            elif dedup is not None and not dedup.load():
+                print("   去重索引不存在，执行全量重建")
+            else:
+                full_rebuild = False
+        
+        if full_rebuild and paths is not None:
+            # 只有完整扫描才能重建索引
+            paths = None
+            documents = load_md_files(docs_dir, unreadable)
+        
+        if full_rebuild:
+            manifest.reset()
+            self.lexical_index.reset()
+            if dedup is not None:
+                dedup.reset()
+            print("\n💾 准备向量数据库...")
+            self.vector_store.create_collection(
+                dimension=encoder.get_dimension(),
+                recreate=recreate
+            )
+        
+        stats = {
+            "total_files": 0,
+            "total_chars": 0,
+            "added_files": 0,
+            "changed_files": 0,
+            "removed_files": 0,
+            "duplicate_chunks": 0,
+        }
+        seen_files = set()
+        pending_hashes = {}
+        stale_ids = []
         
-        if not documents:
-            return {"success": False, "message": "未找到任何 md 文件"}
+        def pending_documents():
+            """
+            过滤出需要重新分割的文档
+            """
+            for doc in documents:
+                file_path = doc["file_path"]
+                seen_files.add(file_path)
+                stats["total_files"] += 1
+                stats["total_chars"] += len(doc["content"])
+                
+                if file_path in manifest.files:
+                    if manifest.files[file_path]["hash"] == doc["content_hash"]:
+                        continue
+                    stats["changed_files"] += 1
+                else:
+                    stats["added_files"] += 1
+                yield doc
+        
+        def on_split(doc):
+            """
+            文档分割成功后才记录新哈希和已修改文件的旧分块：
+            分割失败的文件保留清单中的旧条目和旧分块，下次索引时重试
+            """
+            file_path = doc["file_path"]
+            stale_ids.extend(manifest.get_chunk_ids(file_path))
+            pending_hashes[file_path] = doc["content_hash"]
+        
+        ids_by_file = {}
+        
+        def chunk_batches():
+            """
+            读取/分割阶段：按固定窗口产出带 ID 的文本块（启用去重时只产出代表块）
+            """
+            chunks = split_documents(pending_documents(), on_split=on_split)
+            for batch_chunks in _iter_batches(chunks, INDEX_BATCH_SIZE):
+                if dedup is not None:
+                    new_chunks = dedup.assign(batch_chunks, manifest.allocate_ids)
+                    stats["duplicate_chunks"] += len(batch_chunks) - len(new_chunks)
+                else:
+                    new_chunks = batch_chunks
+                    for chunk, chunk_id in zip(batch_chunks, manifest.allocate_ids(len(batch_chunks))):
+                        chunk["id"] = chunk_id
+                for chunk in batch_chunks:
+                    ids_by_file.setdefault(chunk["file_path"], []).append(chunk["id"])
+                if new_chunks:
+                    yield new_chunks
+        
+        def embed_batch(batch_chunks):
+            """
+            向量化阶段
+            """
+            texts = [chunk["chunk_text"] for chunk in batch_chunks]
+            return encode_with_cache(
+                encoder,
+                texts,
+                self.embedding_cache,
+                batch_size=INDEX_BATCH_SIZE,
+                token_budget=EMBEDDING_TOKEN_BUDGET or None
+            )
+        
+        total_chunks = 0
+        inserted_ids = []
+        
+        def insert_batch(batch_vectors, batch_chunks):
+            """
+            写入阶段
+            """
+            nonlocal total_chunks
+            # 写入前记录 ID，写入中途失败时同样能回滚
+            inserted_ids.extend(chunk["id"] for chunk in batch_chunks)
+            self.vector_store.insert(batch_vectors, batch_chunks)
+            self.lexical_index.add(
+                [chunk["id"] for chunk in batch_chunks],
+                [chunk["chunk_text"] for chunk in batch_chunks]
+            )
+            total_chunks += len(batch_chunks)
+            print(f"   已处理 {total_chunks} 个文本块")
+        
+        # 3. 分割 -> 向量化 -> 插入，三个阶段并发流水线处理
+        print("\n✂️  分割文档并生成向量...")
+        cache_before = self.embedding_cache.stats() if self.embedding_cache is not None else None
         
-        # 2. 分割文档
-        print("\n✂️  分割文档...")
         try:
-            chunks = split_documents(documents)
-            print(f"   生成 {len(chunks)} 个文本块")
+            pipeline_stats = IndexPipeline().run(chunk_batches(), embed_batch, insert_batch)
         except Exception as e:
-            print(f"   ❌ 分割文档失败: {e}")
+            print(f"   ❌ 建立索引失败: {e}")
             import traceback
             traceback.print_exc()
-            return {"success": False, "message": f"分割文档失败: {e}"}
-        
-        # 3. 生成向量（分批处理避免内存溢出）
-        print("\n🔢 生成向量...")
-        texts = [chunk["chunk_text"] for chunk in chunks]
-        
-        # 分批处理，每批 100 个文本块
-        batch_size = 100
-        all_vectors = []
-        vector_dim = None
-        
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            print(f"   处理第 {i//batch_size + 1} 批 ({i+1}-{min(i+batch_size, len(texts))}/{len(texts)})")
-            batch_vectors = self.embedder.encode(batch_texts, show_progress=False)
-            all_vectors.extend(batch_vectors.tolist())
-            
-            if vector_dim is None:
-                vector_dim = batch_vectors.shape[1]
-        
-        print(f"   向量维度: {vector_dim}, 总数: {len(all_vectors)}")
-        
-        # 4. 创建集合
-        print("\n💾 存储到向量数据库...")
-        self.vector_store.create_collection(
-            dimension=vector_dim,
-            recreate=recreate
-        )
-        
-        # 5. 分批插入数据（避免一次性插入过多数据）
-        total_inserted = 0
-        for i in range(0, len(all_vectors), batch_size):
-            batch_vectors = all_vectors[i:i + batch_size]
-            batch_chunks = chunks[i:i + batch_size]
-            
-            # 重新分配 ID
-            batch_chunks_with_id = []
-            for j, chunk in enumerate(batch_chunks):
-                batch_chunks_with_id.append({
-                    **chunk,
-                    "id": i + j
-                })
-            
-            ids = self.vector_store.insert(batch_vectors, batch_chunks_with_id)
-            total_inserted += len(ids)
-            print(f"   已插入 {total_inserted}/{len(all_vectors)} 条记录")
+            # 清单和去重索引不会保存，下次运行会重新分配这些 ID：删除本次已写入的分块，避免主键冲突和无人引用的行
+            if inserted_ids:
+                print(f"   回滚本次已写入的 {len(inserted_ids)} 个文本块")
+                self.vector_store.delete(inserted_ids)
+                self.lexical_index.delete(inserted_ids)
+            if self.embedding_cache is not None:
+                self.embedding_cache.flush()
+            if full_rebuild:
+                # 集合已重建，旧清单不再与其一致：保存空清单，下次运行重新处理全部文件
+                manifest.save()
+            # 补建索引使集合仍可查询，同样使查询缓存失效
+            self.vector_store.build_vector_index()
+            self.vector_store.flush()
+            self.lexical_index.save()
+            bump_index_generation()
+            return {"success": False, "message": f"建立索引失败: {e}"}
+        
+        if total_chunks:
+            for line in format_pipeline_stats(pipeline_stats):
+                print(line)
+        
+        print(f"   找到 {stats['total_files']} 个 md 文件, 共 {stats['total_chars']} 字符")
+        if stats["duplicate_chunks"]:
+            print(f"   近重复文本块 {stats['duplicate_chunks']} 个，已合并到代表块（未重复向量化）")
+        
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+            cache_stats = self.embedding_cache.stats()
+            print(
+                f"   缓存命中 {cache_stats['hits'] - cache_before['hits']}, "
+                f"新编码 {cache_stats['misses'] - cache_before['misses']}"
+            )
+        
+        # 4. 更新索引清单，删除已修改和已移除文件的旧分块
+        for file_path, content_hash in pending_hashes.items():
+            manifest.set_file(file_path, content_hash, ids_by_file.get(file_path, []))
+        candidates = manifest.files if paths is None else [path for path in paths if path in manifest.files]
+        removed_files = [path for path in candidates if path not in seen_files and path not in unreadable]
+        for file_path in removed_files:
+            stale_ids.extend(manifest.get_chunk_ids(file_path))
+            manifest.remove_file(file_path)
+        groups_changed = False
+        if dedup is not None:
+            # 代表块可能被多个位置引用，只删除不再被任何位置引用的
+            referenced = manifest.referenced_ids()
+            stale_ids = [chunk_id for chunk_id in dict.fromkeys(stale_ids) if chunk_id not in referenced]
+            dedup.remove(stale_ids)
+            groups_changed = dedup.update_groups(manifest.files)
+        if stale_ids:
+            print(f"\n🗑️  删除 {len(stale_ids)} 个过期文本块...")
+            self.vector_store.delete(stale_ids)
+            self.lexical_index.delete(stale_ids)
+        stats["removed_files"] = len(removed_files)
+        stats["deleted_chunks"] = len(stale_ids)
+        
+        # 按配置（重新）构建向量索引
+        index_rebuilt = self.vector_store.build_vector_index() is not None
+        
+        # 索引内容或重复位置有变化时落盘并递增代数，使各进程缓存的检索结果失效
+        if full_rebuild or total_chunks or stale_ids or index_rebuilt or groups_changed:
+            self.vector_store.flush()
+            self.lexical_index.save()
+            if dedup is not None:
+                dedup.save()
+            bump_index_generation()
+        
+        # 5. 保存索引清单
+        manifest.save()
+        
+        if unreadable:
+            print(f"   ⚠️ {len(unreadable)} 个文件读取失败，保留其原有分块，下次索引时重试")
+        if not full_rebuild:
+            print(
+                f"   新增 {stats['added_files']} | 修改 {stats['changed_files']} | "
+                f"删除 {stats['removed_files']} | 未变化 "
+                f"{stats['total_files'] - stats['added_files'] - stats['changed_files']}"
+            )
         
-        print(f"✅ 索引建立完成！")
+        if pending_hashes or stale_ids or removed_files:
+            print(f"✅ 索引建立完成！")
+        else:
+            print("✅ 索引已是最新，无需重新生成向量")
         
         return {
             "success": True,
-            "total_files": file_stats["total_files"],
-            "total_chunks": len(chunks),
-            "vector_dimension": vector_dim
+            "incremental": not full_rebuild,
+            "total_files": stats["total_files"],
+            "added_files": stats["added_files"],
+            "changed_files": stats["changed_files"],
+            "removed_files": stats["removed_files"],
+            "total_chunks": total_chunks,
+            "deleted_chunks": stats["deleted_chunks"],
+            "duplicate_chunks": stats["duplicate_chunks"],
+            "unreadable_files": unreadable,
+            "vector_dimension": encoder.get_dimension() if total_chunks else None,
+            "pipeline": pipeline_stats,
+            "index": self.vector_store.get_index_info()
         }
     
-    def query(self, question: str, top_k: int = TOP_K) -> List[Dict]:
+    def query(
+        self,
+        question: str,
+        top_k: int = TOP_K,
+        search_params: Optional[Dict] = None,
+        hybrid: Optional[bool] = None
+    ) -> List[Dict]:
         """
         查询问答
         
         Args:
             question: 用户问题
             top_k: 返回结果数量
+            search_params: 向量索引查询参数 {nprobe, ef}（None 表示使用 config 默认值）
+            hybrid: 是否融合关键词检索（None 表示使用 HYBRID_SEARCH_ENABLED）
             
         Returns:
             检索结果列表
         """
-        # 1. 将问题编码为向量
-        query_vector = self.embedder.encode(question)[0].tolist()
+        return self.query_batch([question], top_k, search_params=search_params, hybrid=hybrid)[0]
+    
+    def query_batch(
+        self,
+        questions: List[str],
+        top_k: int = TOP_K,
+        batch_size: int = QUERY_BATCH_SIZE,
+        search_params: Optional[Dict] = None,
+        hybrid: Optional[bool] = None
+    ) -> List[List[Dict]]:
+        """
+        批量查询：按批编码问题，并用一次多向量检索取回每批的结果
+        
+        启用查询缓存时，已缓存的问题向量和检索结果直接复用，
+        只对未命中的问题编码和检索。启用去重时，代表块的结果改写为仍然存在的位置，
+        其他重复位置放在 duplicates 字段中。
+        
+        Args:
+            questions: 问题列表
+            top_k: 每个问题返回的结果数量
+            batch_size: 每批编码/检索的问题数
+            search_params: 向量索引查询参数 {nprobe, ef}（None 表示使用 config 默认值）
+            hybrid: 是否融合关键词检索（None 表示使用 HYBRID_SEARCH_ENABLED）
+            
+        Returns:
+            与问题一一对应的检索结果列表
+        """
+        return self._query_batch(questions, top_k, batch_size, search_params, hybrid)[0]
+    
+    def _query_batch(
+        self,
+        questions: List[str],
+        top_k: int,
+        batch_size: int,
+        search_params: Optional[Dict],
+        hybrid: Optional[bool]
+    ) -> Tuple[List[List[Dict]], np.ndarray]:
+        """
+        批量查询的实现，同时返回问题向量（问答阶段复用，不再重新编码）
+        
+        Returns:
+            (与问题一一对应的检索结果列表, 问题向量 (n, dim))
+        """
+        if hybrid is None:
+            hybrid = HYBRID_SEARCH_ENABLED
+        # 混合检索与纯向量检索的结果分开缓存
+        cache_params = {**(search_params or {}), "hybrid": True} if hybrid else search_params
         
-        # 2. 在向量数据库中搜索
-        results = self.vector_store.search(query_vector, top_k)
+        results, vectors = [], []
+        for batch in _iter_batches(questions, batch_size):
+            with self.lock:
+                # 1. 将问题编码为向量
+                query_vectors = self._encode_questions(batch)
+                
+                # 2. 在向量数据库中搜索（只检索未命中缓存的问题）
+                batch_results = [None] * len(batch)
+                if self.query_cache is not None:
+                    for i, vector in enumerate(query_vectors):
+                        batch_results[i] = self.query_cache.get_results(vector, top_k, cache_params)
+                
+                missing = [i for i, hits in enumerate(batch_results) if hits is None]
+                if missing:
+                    if hybrid:
+                        searched = self._search_hybrid(
+                            [batch[i] for i in missing], query_vectors[missing], top_k, search_params
+                        )
+                    else:
+                        searched = self.vector_store.search_batch(query_vectors[missing], top_k, search_params)
+                    for i, hits in zip(missing, searched):
+                        if self.duplicate_groups is not None:
+                            hits = self.duplicate_groups.collapse(hits)
+                        batch_results[i] = hits
+                        if self.query_cache is not None:
+                            self.query_cache.put_results(query_vectors[i], top_k, hits, cache_params)
+            
+            results.extend(batch_results)
+            vectors.append(query_vectors)
+        return results, (np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32))
+    
+    def _search_hybrid(
+        self,
+        questions: List[str],
+        query_vectors: np.ndarray,
+        top_k: int,
+        search_params: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        混合检索：向量检索与 BM25 关键词检索各取 top_k × HYBRID_CANDIDATE_FACTOR 个候选，
+        用倒数排名融合后取前 top_k 个
         
+        只被关键词检索命中的文本块从向量存储中补读，score 仍为与问题的向量相似度；
+        结果另外带有 rrf_score、vector_rank 和 lexical_rank（未命中该路时为 None）。
+        
+        Args:
+            questions: 问题列表
+            query_vectors: 对应的问题向量 (n, dim)
+            top_k: 每个问题返回的结果数量
+            search_params: 向量索引查询参数
+            
+        Returns:
+            与问题一一对应的检索结果列表
+        """
+        candidates = top_k * HYBRID_CANDIDATE_FACTOR
+        vector_results = self.vector_store.search_batch(query_vectors, candidates, search_params)
+        lexical_results = self.lexical_index.search_batch(questions, candidates)
+        
+        results = []
+        for query_vector, vector_hits, lexical_hits in zip(query_vectors, vector_results, lexical_results):
+            vector_rank = {hit["id"]: rank for rank, hit in enumerate(vector_hits, 1)}
+            lexical_rank = {chunk_id: rank for rank, (chunk_id, _) in enumerate(lexical_hits, 1)}
+            fused = reciprocal_rank_fusion([list(vector_rank), list(lexical_rank)])[:top_k]
+            
+            hit_of = {hit["id"]: hit for hit in vector_hits}
+            lexical_only = [chunk_id for chunk_id, _ in fused if chunk_id not in hit_of]
+            for hit in self.vector_store.get(lexical_only, query_vector):
+                hit_of[hit["id"]] = hit
+            
+            results.append([
+                {
+                    **hit_of[chunk_id],
+                    "rrf_score": rrf_score,
+                    "vector_rank": vector_rank.get(chunk_id),
+                    "lexical_rank": lexical_rank.get(chunk_id)
+                }
+                for chunk_id, rrf_score in fused
+                if chunk_id in hit_of
+            ])
         return results
     
+    def _encode_questions(self, questions: List[str]) -> np.ndarray:
+        """
+        编码问题，优先使用查询缓存中的向量
+        
+        Args:
+            questions: 问题列表
+            
+        Returns:
+            向量数组 (len(questions), dim)
+        """
+        if self.query_cache is None:
+            return self.embedder.encode(questions, token_budget=EMBEDDING_TOKEN_BUDGET or None)
+        
+        cached = [self.query_cache.get_vector(question) for question in questions]
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            encoded = self.embedder.encode(
+                [questions[i] for i in missing],
+                token_budget=EMBEDDING_TOKEN_BUDGET or None
+            )
+            for i, vector in zip(missing, encoded):
+                cached[i] = vector
+                self.query_cache.put_vector(questions[i], vector)
+        return np.stack(cached)
+    
     def get_stats(self) -> Dict:
         """
         获取索引统计信息
@@ -135,7 +574,187 @@ class QAEngine:
         Returns:
             统计信息
         """
-        return self.vector_store.get_collection_stats()
+        with self.lock:
+            stats = self.vector_store.get_collection_stats()
+            stats["vector_store"] = VECTOR_STORE_BACKEND
+            stats["index"] = self.vector_store.get_index_info() if stats.get("exists") else None
+            stats["embedding"] = self.embedder.backend_info()
+            stats["lexical"] = self.lexical_index.stats()
+            if self.duplicate_groups is not None:
+                stats["dedup"] = self.duplicate_groups.stats()
+            if self.query_cache is not None:
+                stats["query_cache"] = self.query_cache.stats()
+            if self.answer_cache is not None:
+                stats["answer_cache"] = self.answer_cache.stats()
+        return stats
+    
+    def _prepare_answer(
+        self,
+        question: str,
+        top_k: int,
+        base_url: Optional[str],
+        api_key: Optional[str],
+        model: Optional[str],
+        search_params: Optional[Dict],
+        hybrid: Optional[bool],
+        rerank: Optional[bool],
+        answer_cache: Optional[bool],
+        compress: Optional[bool]
+    ) -> Dict:
+        """
+        问答的检索、重排序、AI 服务初始化、答案缓存查找、上下文打包和句子抽取阶段（ask_with_ai 与 ask_with_ai_stream 共用）
+        
+        Returns:
+            {contexts, rerank, timings, start, error, vector, answer_cache, cached, prompt_contexts, packing, compression, ai_service, prompt_options}，
+            error 不为 None 时表示无法继续生成答案，cached 不为 None 时表示命中答案缓存，
+            prompt_contexts 为实际交给大模型的参考资料，ai_service 为本次请求使用的 AI 服务
+        """
+        if rerank is None:
+            rerank = RERANK_ENABLED
+        if compress is None:
+            compress = SENTENCE_EXTRACTION_ENABLED
+        if answer_cache is None:
+            answer_cache = ANSWER_CACHE_ENABLED
+        timings = {}
+        start = time.perf_counter()
+        prepared = {
+            "contexts": [], "rerank": None, "timings": timings, "start": start,
+            "error": None, "vector": None, "answer_cache": False, "cached": None,
+            "prompt_contexts": [], "packing": None, "compression": None, "ai_service": None,
+            "prompt_options": None
+        }
+        
+        # 1. 检索相关文档（重排序时多取候选）
+        candidates = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+        results, query_vectors = self._query_batch([question], candidates, QUERY_BATCH_SIZE, search_params, hybrid)
+        search_results = results[0]
+        # 答案缓存和句子抽取直接复用检索时编码的问题向量
+        prepared["vector"] = query_vectors[0]
+        timings["retrieve"] = round(time.perf_counter() - start, 3)
+        
+        if not search_results:
+            timings["total"] = timings["retrieve"]
+            prepared["error"] = "未找到相关文档"
+            return prepared
+        
+        # 2. 重排序，只保留最相关的 top_k 个
+        if rerank:
+            stage_start = time.perf_counter()
+            search_results, prepared["rerank"] = get_reranker().rerank(question, search_results, top_k)
+            timings["rerank"] = round(time.perf_counter() - stage_start, 3)
+        prepared["contexts"] = search_results
+        
+        # 3. 选择 AI 服务：请求指定的端点/模型只用于本次请求，不替换默认服务
+        try:
+            if base_url or api_key or model:
+                prepared["ai_service"] = get_ai_service(base_url, api_key, model)
+            else:
+                prepared["ai_service"] = self._default_ai_service()
+        except ValueError as e:
+            timings["total"] = round(time.perf_counter() - start, 3)
+            prepared["error"] = str(e)
+            return prepared
+        
+        # 4. 查找答案缓存
+        prepared["answer_cache"] = answer_cache
+        if answer_cache and self.answer_cache is None:
+            # 配置中未启用、由请求单独开启
+            self.answer_cache = AnswerCache(self.embedder.cache_key)
+        # 打包预算和句子抽取设置会改变交给大模型的参考资料，一并作为缓存键
+        prepared["prompt_options"] = {
+            "packing": CONTEXT_TOKEN_BUDGET if CONTEXT_PACKING_ENABLED else None,
+            "compress": [SENTENCE_KEEP_RATIO, SENTENCE_NEIGHBOURS, SENTENCE_MIN_SENTENCES] if compress else None
+        }
+        if prepared["answer_cache"]:
+            prepared["cached"] = self.answer_cache.get(
+                prepared["vector"],
+                [result["id"] for result in search_results],
+                prepared["ai_service"].model,
+                prepared["prompt_options"]
+            )
+            if prepared["cached"] is not None:
+                timings["total"] = round(time.perf_counter() - start, 3)
+                return prepared
+        
+        # 5. 打包上下文：合并相邻分块、去掉重叠，并按 token 预算截取
+        if CONTEXT_PACKING_ENABLED:
+            stage_start = time.perf_counter()
+            prepared["prompt_contexts"], prepared["packing"] = get_context_packer().pack(search_results)
+            timings["pack"] = round(time.perf_counter() - stage_start, 3)
+        else:
+            prepared["prompt_contexts"] = [result["text"] for result in search_results]
+        
+        # 6. 句子抽取：只保留与问题最相关的句子及其前后句
+        if compress:
+            stage_start = time.perf_counter()
+            prepared["prompt_contexts"], prepared["compression"] = get_sentence_extractor().extract(
+                prepared["vector"], prepared["prompt_contexts"]
+            )
+            timings["compress"] = round(time.perf_counter() - stage_start, 3)
+        return prepared
+    
+    def _default_ai_service(self):
+        """
+        获取默认 AI 服务（config 中的端点和模型），首次使用时初始化
+        
+        Returns:
+            AIService 实例
+        """
+        if self.ai_service is None:
+            self.ai_service = get_ai_service()
+        return self.ai_service
+    
+    def _store_answer(self, question: str, prepared: Dict, ai_result: Dict):
+        """
+        把成功生成的回答写入答案缓存
+        """
+        if not prepared["answer_cache"] or not ai_result.get("success"):
+            return
+        with self.lock:
+            self.answer_cache.put(
+                question,
+                prepared["vector"],
+                [result["id"] for result in prepared["contexts"]],
+                prepared["ai_service"].model,
+                prepared["prompt_options"],
+                ai_result
+            )
+    
+    @staticmethod
+    def _cached_result(prepared: Dict) -> Dict:
+        """
+        组装命中答案缓存时的返回结果（不含 usage：没有调用大模型）
+        """
+        cached = dict(prepared["cached"])
+        return {
+            "success": True,
+            "answer": cached.pop("answer"),
+            "reasoning": cached.pop("reasoning", None),
+            "model": cached.pop("model", None),
+            "cached": cached,
+            "contexts": prepared["contexts"],
+            "context_count": len(prepared["contexts"]),
+            "rerank": prepared["rerank"],
+            "packing": None,
+            "compression": None,
+            "timings": prepared["timings"]
+        }
+    
+    @staticmethod
+    def _error_result(prepared: Dict) -> Dict:
+        """
+        组装无法生成答案时的返回结果
+        """
+        return {
+            "success": False,
+            "error": prepared["error"],
+            "answer": None,
+            "contexts": prepared["contexts"],
+            "rerank": prepared["rerank"],
+            "packing": prepared["packing"],
+            "compression": prepared["compression"],
+            "timings": prepared["timings"]
+        }
     
     def ask_with_ai(
         self,
@@ -143,58 +762,133 @@ class QAEngine:
         top_k: int = TOP_K,
         base_url: Optional[str] = None,
         api_key: Optional[str] = None,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        search_params: Optional[Dict] = None,
+        hybrid: Optional[bool] = None,
+        rerank: Optional[bool] = None,
+        answer_cache: Optional[bool] = None,
+        compress: Optional[bool] = None
     ) -> Dict:
         """
         使用 AI 基于知识库回答问题（RAG）
         
+        启用重排序时先检索 RERANK_CANDIDATES 个候选，用交叉编码器打分后只保留前 top_k 个；
+        打分超出时间预算时回退到检索顺序。结果中的 timings 记录各阶段耗时（秒）。
+        
+        启用答案缓存时，措辞相近（问题向量相似度达到阈值）且检索到同一组文本块的问题
+        直接返回之前的回答，不再调用大模型；此时结果中的 cached 为 {question, similarity}。
+        
+        启用句子抽取时，参考资料只保留与问题最相关的句子及其前后句，
+        结果中的 compression 记录句子数、字符数和压缩比例。
+        
         Args:
             question: 用户问题
             top_k: 检索结果数量
             base_url: API 基础 URL（可选）
             api_key: API 密钥（可选）
             model: 模型名称（可选）
+            search_params: 向量索引查询参数 {nprobe, ef}（可选）
+            hybrid: 是否融合关键词检索（可选）
+            rerank: 是否用交叉编码器重排序（None 表示使用 RERANK_ENABLED）
+            answer_cache: 是否使用答案缓存（None 表示使用 ANSWER_CACHE_ENABLED）
+            compress: 是否做句子抽取（None 表示使用 SENTENCE_EXTRACTION_ENABLED）
             
         Returns:
-            包含答案、检索结果和元信息的字典
+            包含答案、检索结果、各阶段耗时和元信息的字典
         """
-        # 1. 检索相关文档
-        search_results = self.query(question, top_k)
+        with self.lock:
+            prepared = self._prepare_answer(
+                question, top_k, base_url, api_key, model, search_params, hybrid, rerank, answer_cache, compress
+            )
+        if prepared["error"]:
+            return self._error_result(prepared)
+        if prepared["cached"] is not None:
+            return self._cached_result(prepared)
         
-        if not search_results:
-            return {
-                "success": False,
-                "error": "未找到相关文档",
-                "answer": None,
-                "contexts": []
-            }
-        
-        # 2. 提取上下文文本
-        contexts = [result["text"] for result in search_results]
-        
-        # 3. 初始化或更新 AI 服务
-        if base_url or api_key or model:
-            self.ai_service = get_ai_service(base_url, api_key, model)
-        elif self.ai_service is None:
-            try:
-                self.ai_service = get_ai_service()
-            except ValueError as e:
-                return {
-                    "success": False,
-                    "error": str(e),
-                    "answer": None,
-                    "contexts": search_results
-                }
-        
-        # 4. 使用 AI 生成答案
-        ai_result = self.ai_service.generate_answer(question, contexts)
+        # 7. 使用 AI 生成答案
+        timings = prepared["timings"]
+        stage_start = time.perf_counter()
+        ai_result = prepared["ai_service"].generate_answer(question, prepared["prompt_contexts"])
+        timings["generate"] = round(time.perf_counter() - stage_start, 3)
+        timings["total"] = round(time.perf_counter() - prepared["start"], 3)
+        self._store_answer(question, prepared, ai_result)
         
-        # 5. 返回完整结果
+        # 8. 返回完整结果
         return {
             **ai_result,
-            "contexts": search_results,
-            "context_count": len(search_results)
+            "cached": None,
+            "contexts": prepared["contexts"],
+            "context_count": len(prepared["contexts"]),
+            "rerank": prepared["rerank"],
+            "packing": prepared["packing"],
+            "compression": prepared["compression"],
+            "timings": timings
         }
+    
+    def ask_with_ai_stream(
+        self,
+        question: str,
+        top_k: int = TOP_K,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        search_params: Optional[Dict] = None,
+        hybrid: Optional[bool] = None,
+        rerank: Optional[bool] = None,
+        answer_cache: Optional[bool] = None,
+        compress: Optional[bool] = None
+    ) -> Iterator[Dict]:
+        """
+        流式 RAG 问答：检索完成后立即产出参考文档，再逐个产出大模型返回的增量（参数同 ask_with_ai）
+        
+        Yields:
+            {"type": "contexts", "contexts": 检索结果}（检索失败时没有这一项），
+            {"type": "reasoning" | "content", "text": 增量文本}（命中答案缓存时整段产出一次），
+            最后一个为 {"type": "done", "result": 与 ask_with_ai 相同的字典}，timings 中另含 ttft
+        """
+        with self.lock:
+            prepared = self._prepare_answer(
+                question, top_k, base_url, api_key, model, search_params, hybrid, rerank, answer_cache, compress
+            )
+        if prepared["contexts"]:
+            yield {"type": "contexts", "contexts": prepared["contexts"]}
+        if prepared["error"]:
+            yield {"type": "done", "result": self._error_result(prepared)}
+            return
+        if prepared["cached"] is not None:
+            result = self._cached_result(prepared)
+            if result["reasoning"]:
+                yield {"type": "reasoning", "text": result["reasoning"]}
+            yield {"type": "content", "text": result["answer"]}
+            yield {"type": "done", "result": result}
+            return
+        
+        # 7. 流式生成答案
+        timings = prepared["timings"]
+        stage_start = time.perf_counter()
+        for event in prepared["ai_service"].stream_answer(question, prepared["prompt_contexts"]):
+            if event["type"] != "done":
+                yield event
+                continue
+            
+            ai_result = event["result"]
+            timings["ttft"] = ai_result.pop("ttft", None)
+            timings["generate"] = round(time.perf_counter() - stage_start, 3)
+            timings["total"] = round(time.perf_counter() - prepared["start"], 3)
+            self._store_answer(question, prepared, ai_result)
+            yield {
+                "type": "done",
+                "result": {
+                    **ai_result,
+                    "cached": None,
+                    "contexts": prepared["contexts"],
+                    "context_count": len(prepared["contexts"]),
+                    "rerank": prepared["rerank"],
+                    "packing": prepared["packing"],
+                    "compression": prepared["compression"],
+                    "timings": timings
+                }
+            }
 
 
 # 全局单例
@@ -0,0 +1,151 @@
+"""
+向量量化 - float16 / int8 标量量化 / 1-bit 二值编码，用于压缩存储与候选召回
+"""
+
+from typing import Dict
+import numpy as np
+
+
+# 支持的量化方式（"none" 表示不压缩）
+QUANTIZATIONS = ("none", "float16", "int8", "binary")
+
+# 0-255 每个字节中 1 的个数（numpy < 2.0 没有 bitwise_count）
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def code_bytes(kind: str, dimension: int) -> int:
+    """
+    每个向量编码后的字节数
+
+    Args:
+        kind: 量化方式
+        dimension: 向量维度
+
+    Returns:
+        字节数
+    """
+    if kind == "float16":
+        return dimension * 2
+    if kind == "int8":
+        return dimension
+    if kind == "binary":
+        return (dimension + 7) // 8
+    return dimension * 4
+
+
+def compression_ratio(kind: str, dimension: int) -> float:
+    """
+    相对 float32 的压缩比
+
+    Args:
+        kind: 量化方式
+        dimension: 向量维度
+
+    Returns:
+        float32 字节数 / 编码字节数
+    """
+    return dimension * 4 / code_bytes(kind, dimension)
+
+
+def train_quantizer(kind: str, vectors: np.ndarray) -> Dict:
+    """
+    训练量化参数
+
+    int8 按维度取最大绝对值作为缩放系数；binary 取各维度均值作为二值化阈值
+    （文本向量通常不以原点为中心，直接取符号会让大部分位相同）。
+
+    Args:
+        kind: 量化方式
+        vectors: 归一化向量 (n, dim)
+
+    Returns:
+        量化参数 {kind, scale}（binary 的 scale 即阈值）
+    """
+    params = {"kind": kind, "scale": None}
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if kind == "int8" and len(vectors):
+        params["scale"] = np.clip(np.abs(vectors).max(axis=0), 1e-6, None)
+    elif kind == "binary" and len(vectors):
+        params["scale"] = vectors.mean(axis=0)
+    return params
+
+
+def encode(params: Dict, vectors: np.ndarray) -> np.ndarray:
+    """
+    编码向量
+
+    Args:
+        params: train_quantizer 的返回值
+        vectors: 归一化向量 (n, dim)
+
+    Returns:
+        编码数组：float16 (n, dim) / int8 (n, dim) / uint8 (n, ceil(dim/8))
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    kind = params["kind"]
+    if kind == "float16":
+        return vectors.astype(np.float16)
+    if kind == "int8":
+        return np.clip(np.rint(vectors / params["scale"] * 127), -127, 127).astype(np.int8)
+    if kind == "binary":
+        return np.packbits(vectors > _threshold(params), axis=1)
+    raise ValueError(f"不支持的量化方式: {kind}")
+
+
+def _threshold(params: Dict):
+    """
+    binary 编码的二值化阈值（未训练时为 0）
+    """
+    return 0 if params["scale"] is None else params["scale"]
+
+
+def approx_scores(params: Dict, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    用编码计算近似相似度（越大越相似）
+
+    float16 / int8 解码后与查询做矩阵乘法；binary 用 Hamming 距离估计余弦相似度。
+
+    Args:
+        params: 量化参数
+        queries: 归一化查询向量 (b, dim)
+        codes: 编码数组 (n, ...)
+
+    Returns:
+        近似得分 (b, n)
+    """
+    kind = params["kind"]
+    if kind == "float16":
+        return queries @ np.asarray(codes, dtype=np.float32).T
+    if kind == "int8":
+        # (q * s / 127) @ codes.T，缩放系数合并到查询上，编码只需转成 float32
+        return (queries * (params["scale"] / 127)) @ np.asarray(codes, dtype=np.float32).T
+
+    dimension = queries.shape[1]
+    query_bits = np.packbits(queries > _threshold(params), axis=1)
+    codes = np.asarray(codes)
+    scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for i, bits in enumerate(query_bits):
+        xor = np.bitwise_xor(codes, bits)
+        hamming = (np.bitwise_count(xor) if hasattr(np, "bitwise_count") else _POPCOUNT[xor]).sum(axis=1, dtype=np.int64)
+        scores[i] = 1 - 2 * hamming / dimension
+    return scores
+
+
+def recall_at_k(reference_rows: np.ndarray, candidate_rows: np.ndarray) -> float:
+    """
+    计算 recall@k：候选 top-k 与参考 top-k 的平均重合比例
+
+    Args:
+        reference_rows: 参考结果 (b, k)
+        candidate_rows: 候选结果 (b, k)
+
+    Returns:
+        平均召回率
+    """
+    if len(reference_rows) == 0:
+        return 1.0
+    hits = [
+        len(set(ref.tolist()) & set(cand.tolist())) / max(len(ref), 1)
+        for ref, cand in zip(reference_rows, candidate_rows)
+    ]
+    return float(np.mean(hits))
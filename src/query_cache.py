@@ -0,0 +1,318 @@
+"""
+查询缓存 - 问题向量与检索结果的 LRU 缓存，按索引代数自动失效
+"""
+
+import os
+import json
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+import numpy as np
+from config import (
+    INDEX_GENERATION_PATH,
+    QUERY_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_PERSIST,
+    QUERY_CACHE_PATH
+)
+
+
+def read_index_generation(path: str = INDEX_GENERATION_PATH) -> int:
+    """
+    读取索引代数（每次索引内容变化时由 build_index 递增）
+
+    Args:
+        path: 代数文件路径
+
+    Returns:
+        当前代数，文件不存在时为 0
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("generation", 0))
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def bump_index_generation(path: str = INDEX_GENERATION_PATH) -> int:
+    """
+    递增索引代数（原子写入），使所有进程中已缓存的检索结果失效
+
+    Args:
+        path: 代数文件路径
+
+    Returns:
+        新的代数
+    """
+    generation = read_index_generation(path) + 1
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"generation": generation}, f)
+    os.replace(tmp_path, path)
+    return generation
+
+
+def normalize_question(question: str) -> str:
+    """
+    规范化问题文本：去掉首尾空白并合并连续空白（不改变分词结果）
+
+    Args:
+        question: 原始问题
+
+    Returns:
+        规范化后的问题
+    """
+    return " ".join(question.split())
+
+
+class QueryCache:
+    """
+    查询缓存
+
+    包含两级 LRU：
+    - 规范化问题 -> 问题向量（只与模型有关）
+    - (问题向量, top_k, 查询参数) -> 检索结果（索引代数变化时整体清空）
+
+    每次查找结果前检查代数文件，其他进程重建索引后也能自动失效。
+    可选地在进程退出时落盘，下次启动时恢复。
+    """
+
+    def __init__(
+        self,
+        model_key: str,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        persist_path: Optional[str] = QUERY_CACHE_PATH if QUERY_CACHE_PERSIST else None,
+        generation_path: str = INDEX_GENERATION_PATH
+    ):
+        """
+        初始化缓存
+
+        Args:
+            model_key: 模型标识（不同模型的向量不能混用）
+            max_entries: 每级缓存的最大条目数
+            persist_path: 落盘文件路径（None 表示只在内存中缓存）
+            generation_path: 索引代数文件路径
+        """
+        self.model_key = model_key
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.generation_path = generation_path
+
+        self.vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.results: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self.generation = read_index_generation(generation_path)
+        self._generation_stat = self._stat_generation()
+        self._lock = threading.Lock()
+
+        self.vector_hits = 0
+        self.vector_misses = 0
+        self.result_hits = 0
+        self.result_misses = 0
+
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    def _stat_generation(self):
+        """
+        获取代数文件的 (mtime, size)，用于廉价地判断是否变化
+        """
+        try:
+            st = os.stat(self.generation_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _check_generation(self):
+        """
+        索引代数变化时清空检索结果缓存（需持有锁）
+        """
+        stat = self._stat_generation()
+        if stat == self._generation_stat:
+            return
+        self._generation_stat = stat
+        generation = read_index_generation(self.generation_path)
+        if generation != self.generation:
+            self.generation = generation
+            self.results.clear()
+
+    @staticmethod
+    def _result_key(vector: np.ndarray, top_k: int, search_params: Optional[Dict] = None) -> str:
+        """
+        计算检索结果的缓存键（查询参数不同的结果分开缓存）
+        """
+        digest = hashlib.blake2b(np.ascontiguousarray(vector, dtype=np.float32).tobytes(), digest_size=16)
+        key = f"{digest.hexdigest()}:{top_k}"
+        if search_params:
+            key += ":" + json.dumps(search_params, sort_keys=True)
+        return key
+
+    def _put(self, store: OrderedDict, key: str, value):
+        """
+        写入并按 LRU 淘汰（需持有锁）
+        """
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_entries:
+            store.popitem(last=False)
+
+    def get_vector(self, question: str) -> Optional[np.ndarray]:
+        """
+        查找问题向量
+
+        Args:
+            question: 问题文本
+
+        Returns:
+            向量，未命中时返回 None
+        """
+        key = normalize_question(question)
+        with self._lock:
+            vector = self.vectors.get(key)
+            if vector is None:
+                self.vector_misses += 1
+                return None
+            self.vectors.move_to_end(key)
+            self.vector_hits += 1
+            return vector
+
+    def put_vector(self, question: str, vector: np.ndarray):
+        """
+        缓存问题向量
+
+        Args:
+            question: 问题文本
+            vector: 问题向量
+        """
+        with self._lock:
+            self._put(self.vectors, normalize_question(question), np.array(vector, dtype=np.float32))
+
+    def get_results(
+        self,
+        vector: np.ndarray,
+        top_k: int,
+        search_params: Optional[Dict] = None
+    ) -> Optional[List[Dict]]:
+        """
+        查找检索结果
+
+        Args:
+            vector: 问题向量
+            top_k: 返回结果数量
+            search_params: 向量索引查询参数
+
+        Returns:
+            检索结果的副本，未命中或索引已变化时返回 None
+        """
+        key = self._result_key(vector, top_k, search_params)
+        with self._lock:
+            self._check_generation()
+            results = self.results.get(key)
+            if results is None:
+                self.result_misses += 1
+                return None
+            self.results.move_to_end(key)
+            self.result_hits += 1
+            return [dict(result) for result in results]
+
+    def put_results(
+        self,
+        vector: np.ndarray,
+        top_k: int,
+        results: List[Dict],
+        search_params: Optional[Dict] = None
+    ):
+        """
+        缓存检索结果
+
+        Args:
+            vector: 问题向量
+            top_k: 返回结果数量
+            results: 检索结果
+            search_params: 向量索引查询参数
+        """
+        key = self._result_key(vector, top_k, search_params)
+        with self._lock:
+            self._check_generation()
+            self._put(self.results, key, [dict(result) for result in results])
+
+    def stats(self) -> Dict:
+        """
+        获取缓存统计信息
+
+        Returns:
+            {generation, vector_entries, vector_hits, vector_misses,
+             result_entries, result_hits, result_misses}
+        """
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "vector_entries": len(self.vectors),
+                "vector_hits": self.vector_hits,
+                "vector_misses": self.vector_misses,
+                "result_entries": len(self.results),
+                "result_hits": self.result_hits,
+                "result_misses": self.result_misses
+            }
+
+    def load(self):
+        """
+        从落盘文件恢复缓存（模型不一致时丢弃，索引代数不一致时只恢复向量）
+        """
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+
+        try:
+            with np.load(self.persist_path) as data:
+                meta = json.loads(str(data["meta"]))
+                vector_keys = [str(key) for key in data["vector_keys"]]
+                vectors = data["vectors"]
+                result_keys = [str(key) for key in data["result_keys"]]
+                result_values = [str(value) for value in data["result_values"]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"警告: 查询缓存文件损坏，已忽略: {e}")
+            return
+
+        if meta.get("model_key") != self.model_key:
+            return
+
+        with self._lock:
+            for key, vector in zip(vector_keys, vectors):
+                self._put(self.vectors, key, vector)
+            self._check_generation()
+            if meta.get("generation") == self.generation:
+                for key, value in zip(result_keys, result_values):
+                    self._put(self.results, key, json.loads(value))
+
+    def save(self):
+        """
+        把缓存原子地写入落盘文件
+        """
+        if not self.persist_path:
+            return
+
+        with self._lock:
+            vector_keys = list(self.vectors.keys())
+            dim = next(iter(self.vectors.values())).shape[0] if self.vectors else 0
+            vectors = np.stack(list(self.vectors.values())) if self.vectors else np.zeros((0, dim), dtype=np.float32)
+            result_keys = list(self.results.keys())
+            result_values = [json.dumps(value, ensure_ascii=False) for value in self.results.values()]
+            meta = json.dumps({"model_key": self.model_key, "generation": self.generation})
+
+        directory = os.path.dirname(self.persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.persist_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            meta=np.array(meta),
+            vector_keys=np.array(vector_keys, dtype=str),
+            vectors=vectors,
+            result_keys=np.array(result_keys, dtype=str),
+            result_values=np.array(result_values, dtype=str)
+        )
+        os.replace(tmp_path, self.persist_path)
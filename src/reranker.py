@@ -0,0 +1,141 @@
+"""
+重排序 - 本地 CPU 交叉编码器，在时间预算内对检索候选重新打分
+"""
+
+import time
+from typing import List, Dict, Tuple, Optional
+from config import (
+    RERANK_MODEL,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    RERANK_TIME_BUDGET
+)
+
+
+class Reranker:
+    """
+    交叉编码器重排序
+
+    把 (问题, 文本块) 成对输入模型打分，比向量相似度更准确，但每个候选都要做一次前向计算。
+    候选按检索顺序分批打分，预计下一批会超出时间预算时停止：已打分的前缀按得分重排，
+    其余候选保持检索顺序接在后面，保证一次问答的额外延迟不超过预算（加一个批次的耗时）。
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        batch_size: int = RERANK_BATCH_SIZE,
+        max_length: int = RERANK_MAX_LENGTH
+    ):
+        """
+        初始化重排序器
+
+        Args:
+            model_name: 交叉编码器模型名称或路径
+            batch_size: 每次前向计算的候选数
+            max_length: 问题 + 文本块的最大 token 数
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.model = None
+
+    def load_model(self):
+        """
+        加载模型（延迟加载）
+        优先从本地缓存加载，避免每次联网检查更新
+        """
+        if self.model is None:
+            print(f"正在加载重排序模型: {self.model_name}")
+            from src.embedder import _disable_progress_bars
+            _disable_progress_bars()
+            from sentence_transformers import CrossEncoder
+            try:
+                self.model = CrossEncoder(
+                    self.model_name,
+                    max_length=self.max_length,
+                    device="cpu",
+                    local_files_only=True
+                )
+            except Exception:
+                # 如果本地没有模型，则联网下载（仅在第一次运行时触发）
+                print(f"本地未找到模型 {self.model_name}，正在从 Hugging Face 联网下载...")
+                self.model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            print("模型加载完成!")
+        return self.model
+
+    def rerank(
+        self,
+        question: str,
+        hits: List[Dict],
+        top_n: int,
+        time_budget: Optional[float] = RERANK_TIME_BUDGET
+    ) -> Tuple[List[Dict], Dict]:
+        """
+        对检索结果重新打分并保留前 top_n 个
+
+        Args:
+            question: 用户问题
+            hits: 按检索顺序排列的候选结果
+            top_n: 保留的结果数量
+            time_budget: 打分阶段的时间预算（秒，None 表示不限制；不含首次加载模型的时间）
+
+        Returns:
+            (结果列表, 重排序信息 {applied, candidates, scored, timed_out, load_seconds, seconds})
+            已打分的结果带有 rerank_score；提前停止时 timed_out 为 True，一个候选都没打分时 applied 为 False
+        """
+        load_start = time.perf_counter()
+        model = self.load_model()
+        load_seconds = time.perf_counter() - load_start
+
+        start = time.perf_counter()
+        scores = []
+        slowest_batch = 0.0
+        timed_out = False
+        for i in range(0, len(hits), self.batch_size):
+            elapsed = time.perf_counter() - start
+            # 预计下一批会超出预算时提前停止，而不是等它算完
+            if time_budget is not None and elapsed + slowest_batch > time_budget:
+                timed_out = True
+                break
+
+            batch_start = time.perf_counter()
+            batch = hits[i:i + self.batch_size]
+            batch_scores = model.predict(
+                [(question, hit["text"]) for hit in batch],
+                batch_size=len(batch),
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+            scores.extend(float(score) for score in batch_scores)
+            slowest_batch = max(slowest_batch, time.perf_counter() - batch_start)
+
+        info = {
+            "applied": bool(scores),
+            "candidates": len(hits),
+            "scored": len(scores),
+            "timed_out": timed_out,
+            "load_seconds": round(load_seconds, 3),
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+        # 只重排已打分的前缀，未打分的候选按检索顺序补在后面
+        order = sorted(range(len(scores)), key=lambda i: -scores[i])
+        reranked = [{**hits[i], "rerank_score": scores[i]} for i in order]
+        return (reranked + hits[len(scores):])[:top_n], info
+
+
+# 全局单例
+_reranker_instance = None
+
+
+def get_reranker() -> Reranker:
+    """
+    获取全局 Reranker 实例
+
+    Returns:
+        Reranker 实例
+    """
+    global _reranker_instance
+    if _reranker_instance is None:
+        _reranker_instance = Reranker()
+    return _reranker_instance
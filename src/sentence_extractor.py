@@ -0,0 +1,178 @@
+"""
+句子抽取 - 按与问题的相似度从参考资料中挑选句子，压缩交给大模型的提示词
+"""
+
+import re
+import math
+import time
+from typing import List, Dict, Tuple
+import numpy as np
+from config import (
+    EMBEDDING_TOKEN_BUDGET,
+    SENTENCE_KEEP_RATIO,
+    SENTENCE_NEIGHBOURS,
+    SENTENCE_MIN_SENTENCES
+)
+
+
+# 句子边界：中文句末标点之后、英文句末标点后接空白处、换行处
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[。！？])|(?<=[.!?])(?=\s)|(?<=\n)")
+
+# 被省略的句子用省略号标记，提示大模型原文并不连续
+GAP_MARKER = " …… "
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    把文本切分为句子，返回每个句子在原文中的位置（保留句末标点，不含首尾空白，跳过空句）
+
+    分隔符与 split_text 查找句子边界时使用的一致：。！？.!? 和换行。
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        [(起始位置, 结束位置)]，按原文顺序
+    """
+    spans = []
+    start = 0
+    for piece in _SENTENCE_BOUNDARY.split(text):
+        end = start + len(piece)
+        stripped = piece.strip()
+        if stripped:
+            left = start + piece.index(stripped)
+            spans.append((left, left + len(stripped)))
+        start = end
+    return spans
+
+
+def select_sentences(scores: np.ndarray, keep_ratio: float, neighbours: int) -> List[int]:
+    """
+    挑选得分最高的句子及其前后相邻的句子
+
+    Args:
+        scores: 每个句子与问题的相似度
+        keep_ratio: 按得分挑选的句子比例（至少一句）
+        neighbours: 每个被选句子前后额外保留的句子数
+
+    Returns:
+        保留的句子下标（升序，即原文顺序）
+    """
+    count = len(scores)
+    top = np.argsort(-scores, kind="stable")[:max(1, math.ceil(count * keep_ratio))]
+    kept = set()
+    for i in top.tolist():
+        kept.update(range(max(0, i - neighbours), min(count, i + neighbours + 1)))
+    return sorted(kept)
+
+
+class SentenceExtractor:
+    """
+    问题相关句子抽取
+
+    把每段参考资料切成句子，所有句子一次批量编码，与问题向量计算余弦相似度；
+    每段保留得分最高的 SENTENCE_KEEP_RATIO 句及其前后 SENTENCE_NEIGHBOURS 句，按原文顺序拼接，
+    不连续处用省略号标记。句子太少的段落原样保留。
+    """
+
+    def __init__(
+        self,
+        keep_ratio: float = SENTENCE_KEEP_RATIO,
+        neighbours: int = SENTENCE_NEIGHBOURS,
+        min_sentences: int = SENTENCE_MIN_SENTENCES
+    ):
+        """
+        初始化抽取器
+
+        Args:
+            keep_ratio: 按得分挑选的句子比例
+            neighbours: 被选句子前后额外保留的句子数
+            min_sentences: 句子数少于此值的段落原样保留
+        """
+        self.keep_ratio = keep_ratio
+        self.neighbours = neighbours
+        self.min_sentences = min_sentences
+
+    def extract(self, query_vector: np.ndarray, passages: List[str]) -> Tuple[List[str], Dict]:
+        """
+        压缩参考资料
+
+        Args:
+            query_vector: 问题向量（检索时已计算）
+            passages: 参考资料文本列表
+
+        Returns:
+            (压缩后的参考资料列表, 抽取信息 {sentences, kept_sentences, chars_before, chars_after, ratio, seconds})
+        """
+        start = time.perf_counter()
+        split = [sentence_spans(passage) for passage in passages]
+        candidates = [i for i, spans in enumerate(split) if len(spans) >= self.min_sentences]
+
+        compressed = list(passages)
+        total = sum(len(sentences) for sentences in split)
+        kept_total = total
+        if candidates:
+            # 所有待压缩段落的句子一次批量编码
+            sentences = [passages[i][left:right] for i in candidates for left, right in split[i]]
+            from src.embedder import get_embedder
+            vectors = get_embedder().encode(sentences, token_budget=EMBEDDING_TOKEN_BUDGET or None)
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+            query = np.asarray(query_vector, dtype=np.float32)
+            scores = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+
+            offset = 0
+            for i in candidates:
+                count = len(split[i])
+                kept = select_sentences(scores[offset:offset + count], self.keep_ratio, self.neighbours)
+                offset += count
+                kept_total -= count - len(kept)
+
+                compressed[i] = self._join(passages[i], split[i], kept)
+
+        chars_before = sum(len(passage) for passage in passages)
+        chars_after = sum(len(passage) for passage in compressed)
+        return compressed, {
+            "sentences": total,
+            "kept_sentences": kept_total,
+            "chars_before": chars_before,
+            "chars_after": chars_after,
+            "ratio": round(chars_after / chars_before, 3) if chars_before else 1.0,
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+
+    @staticmethod
+    def _join(text: str, spans: List[Tuple[int, int]], kept: List[int]) -> str:
+        """
+        按原文顺序拼接保留的句子：连续的句子直接截取原文（保留原有换行），不连续处插入省略号
+        """
+        groups = []
+        for i in kept:
+            if groups and i == groups[-1][1] + 1:
+                groups[-1][1] = i
+            else:
+                groups.append([i, i])
+
+        parts = [text[spans[first][0]:spans[last][1]] for first, last in groups]
+        result = GAP_MARKER.join(parts)
+        if kept[0] > 0:
+            result = GAP_MARKER.lstrip() + result
+        if kept[-1] < len(spans) - 1:
+            result += GAP_MARKER.rstrip()
+        return result
+
+
+# 全局单例
+_sentence_extractor_instance = None
+
+
+def get_sentence_extractor() -> SentenceExtractor:
+    """
+    获取全局 SentenceExtractor 实例
+
+    Returns:
+        SentenceExtractor 实例
+    """
+    global _sentence_extractor_instance
+    if _sentence_extractor_instance is None:
+        _sentence_extractor_instance = SentenceExtractor()
+    return _sentence_extractor_instance
@@ -3,14 +3,27 @@
 """
 
 import re
-from typing import List, Dict
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from bisect import bisect_left
+from typing import List, Dict, Tuple, Callable, Iterable, Iterator, Optional
+from config import CHUNK_MODE, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from src.markdown_tokenizer import iter_sections
+
+
+# 分割规则版本，切分结果变化时递增以触发全量重建
+SPLITTER_VERSION = 3
+
+# 分块边界，按优先级：段落、换行、句末标点
+_BREAK = re.compile(r"\n\n|\n|[。！？.!?]")
+_BREAK_PRIORITY = {"\n\n": 0, "\n": 1}
 
 
 def split_by_headers(content: str) -> List[str]:
     """
     按 Markdown 标题分割文档
     
+    逐行判断，代码块中以 # 开头的行也会被当作标题；
+    split_documents 使用 markdown_tokenizer.iter_sections，这里保留用于对比。
+    
     Args:
         content: Markdown 文本内容
         
@@ -91,19 +104,199 @@ def split_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
     return chunks
 
 
-def split_documents(documents: List[Dict], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Dict]:
+class TokenChunker:
+    """
+    按 Embedding 模型的 token 数分块
+    
+    每个文档的所有章节一次批量分词，借助快速分词器的 offset mapping 把 token 位置映射回原文：
+    每块尽量填满 CHUNK_TOKENS 个 token（不超过模型最大序列长度减去特殊 token），
+    在最后四分之一的窗口内优先选择段落、换行、句末标点处断开，否则避免从单词中间断开。
+    """
+    
+    def __init__(
+        self,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        tokenizer=None,
+        max_seq_length: Optional[int] = None
+    ):
+        """
+        初始化分块器
+        
+        Args:
+            chunk_tokens: 目标分块大小（token 数）
+            overlap_tokens: 块之间的重叠 token 数
+            tokenizer: 快速分词器（默认使用 Embedding 模型的分词器）
+            max_seq_length: 模型最大序列长度（默认从 Embedding 模型读取）
+        """
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.limit = None
+        self.overlap = None
+    
+    def load_tokenizer(self):
+        """
+        加载分词器并计算每块的 token 上限（延迟加载，只执行一次）
+        
+        Raises:
+            ValueError: 分词器不支持 offset mapping
+        """
+        if self.limit is not None:
+            return
+        if self.tokenizer is None or self.max_seq_length is None:
+            from src.embedder import get_embedder
+            embedder = get_embedder()
+            if self.tokenizer is None:
+                # 分块在读取线程中进行，与编码并发，使用不截断的独立副本
+                tokenizer = embedder.copy_tokenizer()
+                if tokenizer is None:
+                    raise ValueError("按 token 分块需要快速分词器（offset mapping）")
+                self.tokenizer = tokenizer
+            if self.max_seq_length is None:
+                self.max_seq_length = embedder.max_seq_length
+        
+        # 模型输入还要加上 [CLS]、[SEP] 等特殊 token
+        if hasattr(self.tokenizer, "encode_batch"):
+            special_tokens = len(self.tokenizer.encode("a").ids) - len(self.tokenizer.encode("a", add_special_tokens=False).ids)
+        else:
+            special_tokens = self.tokenizer.num_special_tokens_to_add()
+        self.limit = max(1, min(self.chunk_tokens, self.max_seq_length - special_tokens))
+        # 重叠不超过分块的一半，保证每块都有足够的新内容
+        self.overlap = min(self.overlap_tokens, self.limit // 2)
+    
+    def _offsets(self, texts: List[str]) -> List[List[Tuple[int, int]]]:
+        """
+        批量分词，返回每个文本中各 token 的字符区间（不含特殊 token）
+        """
+        if hasattr(self.tokenizer, "encode_batch"):
+            return [encoding.offsets for encoding in self.tokenizer.encode_batch(texts, add_special_tokens=False)]
+        return self.tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False
+        )["offset_mapping"]
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        批量计算 token 数（不截断、不含特殊 token）
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            token 数列表
+        """
+        self.load_tokenizer()
+        return [len(offsets) for offsets in self._offsets(texts)] if texts else []
+    
+    def split(self, texts: List[str]) -> List[List[str]]:
+        """
+        把多个章节分别按 token 数分块（一次批量分词）
+        
+        Args:
+            texts: 章节文本列表
+            
+        Returns:
+            每个章节的分块列表
+        """
+        self.load_tokenizer()
+        if not texts:
+            return []
+        return [self._split_one(text, offsets) for text, offsets in zip(texts, self._offsets(texts))]
+    
+    def _split_one(self, text: str, offsets: List[Tuple[int, int]]) -> List[str]:
+        """
+        按 token 区间切分一个章节
+        """
+        count = len(offsets)
+        if count <= self.limit:
+            return [text]
+        
+        starts = [offset[0] for offset in offsets]
+        chunks = []
+        start = 0
+        while start < count:
+            end = min(start + self.limit, count)
+            if end < count:
+                end = self._break_point(text, offsets, starts, start, end)
+            chunk = text[offsets[start][0]:offsets[end - 1][1]].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= count:
+                break
+            
+            # 下一块从 overlap 个 token 之前开始，并对齐到单词开头
+            new_start = max(end - self.overlap, start + 1)
+            while new_start < end and not self._is_word_start(text, offsets, new_start):
+                new_start += 1
+            start = new_start
+        return chunks
+    
+    def _break_point(self, text: str, offsets: List[Tuple[int, int]], starts: List[int], start: int, end: int) -> int:
+        """
+        在分块末尾四分之一的窗口内选择断开位置，返回分块结束的 token 下标（不含）
+        """
+        lowest = max(start + 1, end - self.limit // 4)
+        window_start, window_end = offsets[lowest][0], offsets[end][0]
+        
+        # 一次扫描窗口，取优先级最高的边界中最靠后的一个
+        best_priority, best_position = None, None
+        for match in _BREAK.finditer(text, window_start, window_end):
+            priority = _BREAK_PRIORITY.get(match.group(), 2)
+            if best_priority is None or priority <= best_priority:
+                best_priority, best_position = priority, match.end()
+        if best_position is not None:
+            index = bisect_left(starts, best_position, lowest, end + 1)
+            if lowest <= index <= end:
+                return index
+        
+        # 没有合适的边界时避免从单词中间断开
+        index = end
+        while index > lowest and not self._is_word_start(text, offsets, index):
+            index -= 1
+        return index if index > lowest else end
+    
+    @staticmethod
+    def _is_word_start(text: str, offsets: List[Tuple[int, int]], index: int) -> bool:
+        """
+        第 index 个 token 是否位于单词开头（与前一个 token 之间有空白，或不在两个英文字母/数字之间）
+        """
+        position = offsets[index][0]
+        if index == 0 or position > offsets[index - 1][1] or position == 0:
+            return True
+        before, after = text[position - 1], text[position] if position < len(text) else " "
+        return not (before.isascii() and before.isalnum() and after.isascii() and after.isalnum())
+
+
+def split_documents(
+    documents: Iterable[Dict],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+    mode: str = CHUNK_MODE,
+    on_split: Optional[Callable[[Dict], None]] = None
+) -> Iterator[Dict]:
     """
-    分割所有文档
+    分割所有文档（逐个文档处理，按需产出分块）
+    
+    分割失败的文档打印警告后跳过，不产出任何分块，也不调用 on_split。
     
     Args:
-        documents: 文档列表
-        chunk_size: 每块的最大字符数
-        overlap: 块之间的重叠字符数
+        documents: 文档列表或文档迭代器
+        chunk_size: chars 模式下每块的最大字符数
+        overlap: chars 模式下块之间的重叠字符数
+        mode: "tokens" 按 Embedding 模型的 token 数分块（CHUNK_TOKENS / CHUNK_OVERLAP_TOKENS），"chars" 按字符数分块
+        on_split: 文档分割成功后、产出其分块前调用 on_split(doc)（没有分块的文档同样调用）
         
-    Returns:
-        分块列表 [{chunk_text, source_file, file_path, chunk_index}]
+    Yields:
+        分块 {chunk_text, source_file, file_path, chunk_index}
     """
-    all_chunks = []
+    total = len(documents) if hasattr(documents, "__len__") else None
+    chunker = None
     
     for doc_idx, doc in enumerate(documents):
         content = doc["content"]
@@ -112,20 +305,34 @@ def split_documents(documents: List[Dict], chunk_size: int = CHUNK_SIZE, overlap
         
         # 打印进度（每 20 个文档）
         if (doc_idx + 1) % 20 == 0 or doc_idx == 0:
-            print(f"   处理文档 {doc_idx + 1}/{len(documents)}: {file_name}")
+            progress = f"{doc_idx + 1}/{total}" if total is not None else f"{doc_idx + 1}"
+            print(f"   处理文档 {progress}: {file_name}")
         
+        # 有文档需要分割时才加载分词器
+        if doc_idx == 0 and mode == "tokens":
+            chunker = get_token_chunker()
+            try:
+                chunker.load_tokenizer()
+            except ValueError as e:
+                print(f"   ⚠️  {e}，改为按字符数分块")
+                chunker = None
+        
+        doc_chunks = []
         try:
-            # 先按标题分割
-            sections = split_by_headers(content)
+            # 先按标题分割（识别代码块、Front Matter 和表格）
+            sections = [section["text"] for section in iter_sections(content)]
+            
+            # 再按大小分割（按 token 分块时整个文档的章节一次批量分词）
+            if chunker is not None:
+                section_chunks = chunker.split(sections)
+            else:
+                section_chunks = [split_text(section, chunk_size, overlap) for section in sections]
             
             chunk_index = 0
-            for section in sections:
-                # 再按大小分割
-                chunks = split_text(section, chunk_size, overlap)
-                
+            for chunks in section_chunks:
                 for chunk in chunks:
                     if chunk.strip():
-                        all_chunks.append({
+                        doc_chunks.append({
                             "chunk_text": chunk,
                             "source_file": file_name,
                             "file_path": file_path,
@@ -136,5 +343,24 @@ def split_documents(documents: List[Dict], chunk_size: int = CHUNK_SIZE, overlap
             print(f"   ⚠️  处理文档失败 {file_name}: {e}")
             # 继续处理其他文档
             continue
+        
+        if on_split is not None:
+            on_split(doc)
+        yield from doc_chunks
+
+
+# 全局单例
+_token_chunker_instance = None
+
+
+def get_token_chunker() -> TokenChunker:
+    """
+    获取全局 TokenChunker 实例
     
-    return all_chunks
+    Returns:
+        TokenChunker 实例
+    """
+    global _token_chunker_instance
+    if _token_chunker_instance is None:
+        _token_chunker_instance = TokenChunker()
+    return _token_chunker_instance
@@ -2,9 +2,159 @@
 向量存储 - Milvus Lite 封装
 """
 
-from typing import List, Dict, Optional
-from pymilvus import MilvusClient
-from config import MILVUS_DB_PATH, COLLECTION_NAME, VECTOR_DIM, TOP_K
+import os
+import json
+import time
+from typing import List, Dict, Optional, Union
+import numpy as np
+from config import (
+    MILVUS_DB_PATH,
+    COLLECTION_NAME,
+    VECTOR_DIM,
+    TOP_K,
+    VECTOR_STORE_BACKEND,
+    INDEX_TYPE,
+    INDEX_NLIST,
+    INDEX_HNSW_M,
+    INDEX_HNSW_EF_CONSTRUCTION,
+    SEARCH_NPROBE,
+    SEARCH_EF,
+    VECTOR_QUANTIZATION
+)
+from src.quantization import QUANTIZATIONS
+
+
+# 支持的向量索引类型
+INDEX_TYPES = ("FLAT", "IVF_FLAT", "HNSW")
+
+
+def make_index_params(
+    index_type: str = INDEX_TYPE,
+    nlist: int = INDEX_NLIST,
+    hnsw_m: int = INDEX_HNSW_M,
+    ef_construction: int = INDEX_HNSW_EF_CONSTRUCTION,
+    quantization: Optional[str] = VECTOR_QUANTIZATION
+) -> Dict:
+    """
+    构造向量索引配置
+    
+    Args:
+        index_type: 索引类型（FLAT / IVF_FLAT / HNSW）
+        nlist: IVF_FLAT 聚类中心数
+        hnsw_m: HNSW 每个节点的最大连接数
+        ef_construction: HNSW 建图时的候选集大小
+        quantization: 向量量化方式（none / float16 / int8 / binary），None 表示沿用已有设置
+        
+    Returns:
+        {index_type, params, quantization}
+    """
+    index_type = index_type.upper()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}（可选: {', '.join(INDEX_TYPES)}）")
+    
+    params = {}
+    if index_type == "IVF_FLAT":
+        params = {"nlist": nlist}
+    elif index_type == "HNSW":
+        params = {"M": hnsw_m, "efConstruction": ef_construction}
+    
+    index_params = {"index_type": index_type, "params": params}
+    if quantization is not None:
+        index_params["quantization"] = check_quantization(quantization)
+    return index_params
+
+
+def check_quantization(quantization: str) -> str:
+    """
+    校验向量量化方式
+    
+    Args:
+        quantization: 量化方式
+        
+    Returns:
+        小写的量化方式
+    """
+    quantization = quantization.lower()
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"不支持的量化方式: {quantization}（可选: {', '.join(QUANTIZATIONS)}）")
+    return quantization
+
+
+def resolve_index_params(requested: Optional[Dict], info: Optional[Dict]) -> Dict:
+    """
+    合并指定的索引配置与当前生效的索引配置（未指定的项沿用已有索引，新集合使用 config 默认值）
+    
+    Args:
+        requested: configure_index 指定的配置（可以只包含部分键）
+        info: 当前索引信息
+        
+    Returns:
+        完整的 {index_type, params, quantization}
+    """
+    if info:
+        current = {
+            "index_type": info["index_type"],
+            "params": info["params"],
+            "quantization": info.get("quantization", "none")
+        }
+    else:
+        current = make_index_params()
+    return {**current, **(requested or {})}
+
+
+def make_search_params(index_type: str, top_k: int, overrides: Optional[Dict] = None) -> Dict:
+    """
+    按索引类型构造查询参数
+    
+    Args:
+        index_type: 当前生效的索引类型
+        top_k: 返回结果数量
+        overrides: 命令行等传入的覆盖值 {nprobe, ef}
+        
+    Returns:
+        该索引类型使用的查询参数
+    """
+    overrides = overrides or {}
+    if index_type == "IVF_FLAT":
+        return {"nprobe": overrides.get("nprobe") or SEARCH_NPROBE}
+    if index_type == "HNSW":
+        # HNSW 要求 ef 不小于返回数量
+        return {"ef": max(overrides.get("ef") or SEARCH_EF, top_k)}
+    return {}
+
+
+def read_index_info(path: str) -> Optional[Dict]:
+    """
+    读取与集合一同保存的索引信息
+    
+    Args:
+        path: 索引信息文件路径
+        
+    Returns:
+        {index_type, params, build_seconds, built_at, rows}，不存在时返回 None
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_index_info(path: str, info: Dict):
+    """
+    原子地写入索引信息
+    
+    Args:
+        path: 索引信息文件路径
+        info: 索引信息
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
 
 
 class VectorStore:
@@ -23,23 +173,34 @@ class VectorStore:
         self.db_path = db_path
         self.collection_name = collection_name
         self.client = None
+        # 显式指定的索引配置；为 None 时沿用集合已有的索引（新集合使用 config 中的默认值）
+        self.index_params = None
+        self.index_info_path = os.path.join(
+            os.path.dirname(db_path) or ".", f"{collection_name}.index.json"
+        )
+        # 本地 .db 文件路径由 Milvus Lite 打开，http:// 等 URI 连接 Milvus 服务
+        self.is_lite = "://" not in db_path
     
     def connect(self):
         """
         连接到 Milvus Lite
         """
         if self.client is None:
+            # 延迟导入 pymilvus，避免不需要数据库的命令承担导入开销
+            from pymilvus import MilvusClient
             self.client = MilvusClient(self.db_path)
         return self.client
     
     def create_collection(self, dimension: int = VECTOR_DIM, recreate: bool = False):
         """
-        创建集合
+        创建集合（此时不建向量索引，写入完成后由 build_vector_index 一次性构建）
         
         Args:
             dimension: 向量维度
             recreate: 是否重新创建（删除旧集合）
         """
+        from pymilvus import DataType
+        
         self.connect()
         
         # 检查集合是否存在
@@ -47,24 +208,98 @@ class VectorStore:
             if recreate:
                 print(f"删除旧集合: {self.collection_name}")
                 self.client.drop_collection(self.collection_name)
+                if os.path.exists(self.index_info_path):
+                    os.remove(self.index_info_path)
             else:
                 print(f"集合已存在: {self.collection_name}")
                 return
         
-        # 创建新集合
+        # 创建新集合：主键 + 向量字段，文本等元数据作为动态字段
+        schema = self.client.create_schema(auto_id=False, enable_dynamic_field=True)
+        schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+        schema.add_field(field_name="vector", datatype=DataType.FLOAT_VECTOR, dim=dimension)
         self.client.create_collection(
             collection_name=self.collection_name,
-            dimension=dimension,
-            metric_type="COSINE"  # 使用余弦相似度
+            schema=schema
         )
         print(f"创建集合成功: {self.collection_name}, 维度: {dimension}")
     
-    def insert(self, vectors: List[List[float]], metadata: List[Dict]) -> List[int]:
+    def configure_index(self, index_params: Dict):
+        """
+        指定下一次 build_vector_index 使用的索引配置
+        
+        Args:
+            index_params: make_index_params 的返回值
+        """
+        self.index_params = index_params
+    
+    def get_index_info(self) -> Optional[Dict]:
+        """
+        获取当前生效的向量索引信息
+        
+        Returns:
+            {index_type, params, quantization, build_seconds, built_at, rows}，未建立时返回 None
+        """
+        return read_index_info(self.index_info_path)
+    
+    def build_vector_index(self) -> Optional[Dict]:
+        """
+        确保向量索引与配置一致：不存在或配置变化时（重新）构建，并记录构建耗时
+        
+        Returns:
+            新构建的索引信息；索引已是最新时返回 None
+        """
+        self.connect()
+        
+        info = self.get_index_info()
+        wanted = resolve_index_params(self.index_params, info)
+        if wanted["quantization"] != "none":
+            print(f"   Milvus 后端不支持量化存储 ({wanted['quantization']})，忽略")
+            wanted["quantization"] = "none"
+        if self.is_lite and wanted["index_type"] != "FLAT":
+            # Milvus Lite 对任何索引类型都按 FLAT 暴力检索，如实记录实际生效的索引
+            print(f"   Milvus Lite 不支持 {wanted['index_type']} 索引，改用 FLAT")
+            wanted = {**wanted, "index_type": "FLAT", "params": {}}
+        
+        existing = self.client.list_indexes(self.collection_name)
+        if existing and info and info["index_type"] == wanted["index_type"] and info["params"] == wanted["params"]:
+            return None
+        
+        print(f"\n🧭 构建向量索引: {wanted['index_type']} {wanted['params']}")
+        start = time.perf_counter()
+        if existing:
+            self.client.release_collection(self.collection_name)
+            for index_name in existing:
+                self.client.drop_index(self.collection_name, index_name)
+        
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name="vector",
+            index_name="vector_index",
+            index_type=wanted["index_type"],
+            metric_type="COSINE",  # 使用余弦相似度
+            params=wanted["params"]
+        )
+        self.client.create_index(self.collection_name, index_params)
+        self.client.load_collection(self.collection_name)
+        build_seconds = time.perf_counter() - start
+        
+        info = {
+            **wanted,
+            "build_seconds": round(build_seconds, 3),
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "rows": self.get_collection_stats()["count"]
+        }
+        write_index_info(self.index_info_path, info)
+        print(f"   索引构建完成，耗时 {build_seconds:.2f}s")
+        return info
+    
+    def insert(self, vectors: Union[np.ndarray, List[List[float]]], metadata: List[Dict]) -> List[int]:
         """
         插入向量和元数据
         
         Args:
-            vectors: 向量列表
+            vectors: 向量数组 (n, dim) 或向量列表（numpy 行直接传给 pymilvus，不转换为 list）
             metadata: 元数据列表 [{chunk_text, source_file, file_path, chunk_index, id}]
             
         Returns:
@@ -97,41 +332,151 @@ class VectorStore:
         
         return result.get("ids", [])
     
-    def search(self, query_vector: List[float], top_k: int = TOP_K) -> List[Dict]:
+    def delete(self, ids: List[int]) -> int:
+        """
+        按 ID 删除向量
+        
+        Args:
+            ids: 要删除的 ID 列表
+            
+        Returns:
+            删除的记录数
+        """
+        if not ids:
+            return 0
+        
+        self.connect()
+        
+        result = self.client.delete(
+            collection_name=self.collection_name,
+            ids=ids
+        )
+        
+        if isinstance(result, dict):
+            return result.get("delete_count", len(ids))
+        return len(ids)
+    
+    def has_collection(self) -> bool:
+        """
+        检查集合是否存在
+        
+        Returns:
+            集合是否存在
+        """
+        self.connect()
+        return self.client.has_collection(self.collection_name)
+    
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int = TOP_K,
+        search_params: Optional[Dict] = None
+    ) -> List[Dict]:
         """
         相似度搜索
         
         Args:
             query_vector: 查询向量
             top_k: 返回结果数量
+            search_params: 查询参数覆盖值 {nprobe, ef}（None 表示使用 config 默认值）
+            
+        Returns:
+            搜索结果列表 [{id, score, text, source_file, file_path, chunk_index}]，score 为余弦相似度（越大越相关）
+        """
+        return self.search_batch([query_vector], top_k, search_params)[0]
+    
+    def search_batch(
+        self,
+        query_vectors: Union[np.ndarray, List[List[float]]],
+        top_k: int = TOP_K,
+        search_params: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        批量相似度搜索（一次请求检索多个查询向量）
+        
+        Args:
+            query_vectors: 查询向量列表或 (n, dim) 数组（numpy 行直接传给 pymilvus）
+            top_k: 每个查询返回的结果数量
+            search_params: 查询参数覆盖值 {nprobe, ef}（None 表示使用 config 默认值）
             
         Returns:
-            搜索结果列表 [{id, distance, text, source_file, file_path}]
+            与查询向量一一对应的搜索结果列表
         """
+        if len(query_vectors) == 0:
+            return []
+        
         self.connect()
         
+        info = self.get_index_info()
+        index_type = info["index_type"] if info else "FLAT"
         results = self.client.search(
             collection_name=self.collection_name,
-            data=[query_vector],
+            data=list(query_vectors),
             limit=top_k,
-            output_fields=["text", "source_file", "file_path", "chunk_index"]
+            output_fields=["text", "source_file", "file_path", "chunk_index"],
+            search_params={
+                "metric_type": "COSINE",
+                "params": make_search_params(index_type, top_k, search_params)
+            }
         )
         
         # 格式化结果
         formatted_results = []
-        if results and len(results) > 0:
-            for hit in results[0]:
-                formatted_results.append({
+        for hits in results or []:
+            formatted_results.append([
+                {
                     "id": hit["id"],
-                    "score": 1 - hit["distance"],  # 转换为相似度分数
+                    "score": hit["distance"],  # COSINE 度量下 distance 即余弦相似度（越大越相关）
                     "text": hit["entity"].get("text", ""),
                     "source_file": hit["entity"].get("source_file", ""),
                     "file_path": hit["entity"].get("file_path", ""),
                     "chunk_index": hit["entity"].get("chunk_index", 0)
-                })
+                }
+                for hit in hits
+            ])
         
+        # 没有返回结果的查询补空列表，保持一一对应
+        formatted_results.extend([] for _ in range(len(query_vectors) - len(formatted_results)))
         return formatted_results
     
+    def get(self, ids: List[int], query_vector: Union[np.ndarray, List[float]]) -> List[Dict]:
+        """
+        按 ID 读取文本块，并计算与查询向量的相似度（用于补全只被关键词检索命中的结果）
+        
+        Args:
+            ids: 分块 ID 列表
+            query_vector: 查询向量
+            
+        Returns:
+            搜索结果列表（与 search 的格式相同，跳过不存在的 ID）
+        """
+        if not ids:
+            return []
+        
+        self.connect()
+        
+        rows = self.client.get(
+            collection_name=self.collection_name,
+            ids=[int(record_id) for record_id in ids],
+            output_fields=["vector", "text", "source_file", "file_path", "chunk_index"]
+        )
+        
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        by_id = {}
+        for row in rows or []:
+            vector = np.asarray(row["vector"], dtype=np.float32)
+            cosine = float(vector @ query / (np.linalg.norm(vector) or 1.0))
+            by_id[row["id"]] = {
+                "id": row["id"],
+                "score": cosine,  # 与 search 一致：余弦相似度
+                "text": row.get("text", ""),
+                "source_file": row.get("source_file", ""),
+                "file_path": row.get("file_path", ""),
+                "chunk_index": row.get("chunk_index", 0)
+            }
+        return [by_id[record_id] for record_id in ids if record_id in by_id]
+    
     def get_collection_stats(self) -> Dict:
         """
         获取集合统计信息
@@ -150,6 +495,11 @@ class VectorStore:
             "count": stats.get("row_count", 0)
         }
     
+    def flush(self):
+        """
+        确保写入已持久化（Milvus Lite 写入即持久化，无需额外操作）
+        """
+    
     def close(self):
         """
         关闭连接
@@ -163,14 +513,20 @@ class VectorStore:
 _vector_store_instance = None
 
 
-def get_vector_store() -> VectorStore:
+def get_vector_store():
     """
-    获取全局 VectorStore 实例
+    获取全局向量存储实例（按 VECTOR_STORE_BACKEND 选择后端）
     
     Returns:
-        VectorStore 实例
+        VectorStore 或 NumpyVectorStore 实例
     """
     global _vector_store_instance
     if _vector_store_instance is None:
-        _vector_store_instance = VectorStore()
+        if VECTOR_STORE_BACKEND == "numpy":
+            from src.numpy_store import NumpyVectorStore
+            _vector_store_instance = NumpyVectorStore()
+        elif VECTOR_STORE_BACKEND == "milvus":
+            _vector_store_instance = VectorStore()
+        else:
+            raise ValueError(f"不支持的向量存储后端: {VECTOR_STORE_BACKEND}")
     return _vector_store_instance
@@ -0,0 +1,98 @@
+"""
+目录监视 - 轮询 .md 文件的修改时间与大小，合并一段时间内的变化后交给增量索引
+"""
+
+import time
+from pathlib import Path
+from typing import Dict, Set, Tuple
+from config import WATCH_INTERVAL, WATCH_DEBOUNCE
+
+
+def snapshot_md_files(docs_dir: str) -> Dict[str, Tuple[int, int]]:
+    """
+    记录目录下所有 .md 文件的修改时间和大小
+
+    Args:
+        docs_dir: 文档目录路径
+
+    Returns:
+        {绝对路径: (mtime_ns, size)}，路径格式与 load_md_files 一致
+    """
+    snapshot = {}
+    for md_file in Path(docs_dir).rglob("*.md"):
+        try:
+            st = md_file.stat()
+        except OSError:
+            # 扫描期间被删除
+            continue
+        snapshot[str(md_file.absolute())] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+def diff_snapshots(old: Dict[str, Tuple[int, int]], new: Dict[str, Tuple[int, int]]) -> Set[str]:
+    """
+    比较两次快照，找出新增、修改和删除的文件
+
+    Args:
+        old: 之前的快照
+        new: 当前的快照
+
+    Returns:
+        发生变化的文件路径集合
+    """
+    return {path for path in old.keys() | new.keys() if old.get(path) != new.get(path)}
+
+
+class DirectoryWatcher:
+    """
+    目录监视器
+
+    每隔 interval 秒对目录做一次快照（只 stat，不读取内容），与上一次快照比较。
+    发现变化后继续累积，直到 debounce 秒内没有新的变化才返回，
+    这样保存多个文件、git checkout 等连续操作只触发一次更新。
+    """
+
+    def __init__(self, docs_dir: str, interval: float = WATCH_INTERVAL, debounce: float = WATCH_DEBOUNCE):
+        """
+        初始化监视器（立即记录当前快照，此后的变化都会被报告）
+
+        Args:
+            docs_dir: 文档目录路径
+            interval: 轮询间隔（秒）
+            debounce: 变化合并窗口（秒）
+        """
+        self.docs_dir = docs_dir
+        self.interval = interval
+        self.debounce = debounce
+        self.snapshot = snapshot_md_files(docs_dir)
+        self.pending = set()
+
+    def requeue(self, paths):
+        """
+        把未能处理的文件放回，下一批中重试（没有新变化时在 debounce 秒后重试）
+
+        Args:
+            paths: 文件路径列表
+        """
+        self.pending |= set(paths)
+
+    def wait_for_changes(self) -> Set[str]:
+        """
+        阻塞直到有文件变化且之后 debounce 秒内不再变化
+
+        Returns:
+            这段时间内变化过的文件路径（新增、修改或删除）
+        """
+        pending, self.pending = self.pending, set()
+        last_change = time.monotonic() if pending else 0.0
+        while True:
+            time.sleep(self.interval)
+            current = snapshot_md_files(self.docs_dir)
+            changed = diff_snapshots(self.snapshot, current)
+            self.snapshot = current
+            now = time.monotonic()
+            if changed:
+                pending |= changed
+                last_change = now
+            elif pending and now - last_change >= self.debounce:
+                return pending